@@ -0,0 +1,24 @@
+# Copyright 2021 Planet Labs, Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+import sys
+
+# modules using async syntax cannot be collected, even to be skipped
+collect_ignore = []
+if sys.version_info < (3, 6):
+    collect_ignore += [
+        'planet/api/aio.py',
+        'planet/api/aio_downloader.py',
+        'tests/test_aio.py',
+        'tests/test_aio_downloader.py',
+    ]
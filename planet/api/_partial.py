@@ -0,0 +1,140 @@
+# Copyright 2021 Planet Labs, Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+'''Partial files that outlive the process writing them.
+
+Unlike `atomic_open`, which discards its temporary file on failure, a
+download is written to `<name>.part` next to a `<name>.part.json` sidecar
+recording the source and which bytes are complete. A later download of the
+same content to the same name continues where it stopped.
+'''
+import errno
+import json
+import logging
+import os
+
+from ._fatomic import _replace_file
+
+log = logging.getLogger(__name__)
+
+
+def _merge(intervals):
+    '''Sort and merge overlapping or adjacent [start, end) intervals.'''
+    merged = []
+    for start, end in sorted(intervals):
+        if start >= end:
+            continue
+        if merged and start <= merged[-1][1]:
+            merged[-1][1] = max(merged[-1][1], end)
+        else:
+            merged.append([start, end])
+    return merged
+
+
+def missing(intervals, size):
+    '''The [start, end) intervals of [0, size) not in `intervals`.
+
+    >>> from planet.api._partial import missing
+    >>> missing([[10, 20], [0, 5]], 30)
+    [[5, 10], [20, 30]]
+    '''
+    gaps = []
+    pos = 0
+    for start, end in _merge(intervals):
+        if start > pos:
+            gaps.append([pos, start])
+        pos = max(pos, end)
+    if pos < size:
+        gaps.append([pos, size])
+    return gaps
+
+
+def _remove(path):
+    try:
+        os.unlink(path)
+    except OSError as ex:
+        if ex.errno != errno.ENOENT:
+            raise
+
+
+class PartialFile(object):
+    '''The partial file of a download to `filename`.
+
+    :param str filename: The final file name
+    :param dict source: Identifies the content: the url, size and any of the
+                        etag and last_modified validators
+    '''
+
+    def __init__(self, filename, source):
+        self.filename = filename
+        self.path = filename + '.part'
+        self.sidecar = self.path + '.json'
+        self.source = source
+        self.file = None
+
+    def _matches(self, recorded):
+        if recorded.get('size') != self.source['size']:
+            return False
+        validators = [k for k in ('etag', 'last_modified')
+                      if self.source.get(k) and recorded.get(k)]
+        # without a validator there is no knowing if the content changed
+        return bool(validators) and all(
+            recorded[k] == self.source[k] for k in validators)
+
+    def completed(self):
+        '''Get the [start, end) intervals already written, if the partial file
+        is of the same content, or an empty list.'''
+        try:
+            with open(self.sidecar) as fp:
+                recorded = json.load(fp)
+        except (IOError, OSError, ValueError):
+            return []
+        if not self._matches(recorded) or not os.path.exists(self.path):
+            log.info('discarding partial download %s', self.path)
+            return []
+        return _merge(recorded.get('completed', []))
+
+    def open(self, resume):
+        '''Open the partial file for writing, keeping its content if
+        `resume`.'''
+        if resume:
+            self.file = open(self.path, 'r+b')
+        else:
+            self.discard()
+            self.file = open(self.path, 'wb')
+        return self.file
+
+    def save(self, intervals):
+        '''Record the [start, end) intervals that are written.'''
+        self.file.flush()
+        record = dict(self.source, completed=_merge(intervals))
+        tmp = self.sidecar + '.tmp'
+        with open(tmp, 'w') as fp:
+            json.dump(record, fp)
+        _replace_file(tmp, self.sidecar)
+
+    def close(self):
+        if self.file is not None:
+            self.file.close()
+            self.file = None
+
+    def commit(self):
+        '''Move the complete file into place.'''
+        self.close()
+        _replace_file(self.path, self.filename)
+        _remove(self.sidecar)
+
+    def discard(self):
+        self.close()
+        _remove(self.path)
+        _remove(self.sidecar)
@@ -0,0 +1,712 @@
+# Copyright 2021 Planet Labs, Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+'''An asyncio native client. This requires Python 3.6+ and the optional
+`aiohttp` dependency (``pip install planet[async]``).
+
+The :py:class:`AsyncClientV1` provides the same methods as
+:py:class:`planet.api.ClientV1` but each must be awaited::
+
+    async with AsyncClientV1() as client:
+        items = await client.quick_search(request)
+        async for item in items:
+            assets = await client.get_assets(item)
+'''
+
+import asyncio
+import functools
+import heapq
+import json
+import logging
+import os
+import re
+import time
+
+try:
+    import aiohttp
+    from yarl import URL
+except ImportError:
+    aiohttp = None
+from requests.exceptions import ConnectionError
+from requests.exceptions import ReadTimeout
+
+from . import models
+from . import sharding
+from ._fatomic import atomic_open
+from .checksums import Hasher
+from .checksums import preferred
+from .client import _login_result
+from .client import ClientV1
+from .dispatch import _RateLimiter
+from .dispatch import _get_user_agent
+from .dispatch import _headers
+from .dispatch import _is_subdomain_of_tld
+from .dispatch import _log_request
+from .dispatch import DEFAULT_TIMEOUTS
+from .dispatch import USE_STRICT_SSL
+from .exceptions import APIException
+from .exceptions import ChecksumMismatch
+from .exceptions import NoPermission
+from .exceptions import RequestCancelled
+from .metrics import Hooks
+from .retry import RetryPolicy
+from .utils import check_status
+
+log = logging.getLogger(__name__)
+
+_REDIRECT_STATUS = frozenset([301, 302, 303, 307, 308])
+
+
+class _HTTPResponse(object):
+    '''Adapts an aiohttp response to the subset of the requests.Response
+    interface used by the models and :py:func:`planet.api.utils.check_status`
+    '''
+
+    def __init__(self, response, content=None):
+        self.raw = response
+        self.status_code = response.status
+        self.headers = response.headers
+        self.url = str(response.url)
+        self.content = content
+
+    @property
+    def text(self):
+        return self.content.decode(self.raw.get_encoding(), 'replace')
+
+    def json(self):
+        return json.loads(self.text)
+
+    def close(self):
+        self.raw.release()
+
+
+class Response(models.Response):
+    '''An awaitable response. `get_body` is a coroutine.'''
+
+    def __init__(self, request, dispatcher, stream=False):
+        models.Response.__init__(self, request, dispatcher)
+        self._stream = stream
+
+    def _create_body(self, response):
+        body_type = _BODY_TYPES.get(self.request.body_type,
+                                    self.request.body_type)
+        return body_type(self.request, response, self._dispatcher)
+
+    async def get_body(self):
+        '''Get the response Body
+
+        :returns Body: A Body object containing the response.
+        '''
+        if self._body is None:
+            resp = await self._dispatcher._dispatch(self.request,
+                                                    self._stream)
+            if self._cancel:
+                resp.close()
+                raise RequestCancelled()
+            self._body = self._create_body(resp)
+        return self._body
+
+
+class Body(models.Body):
+    '''A streaming Body, iterate with `async for` to receive chunks.'''
+
+    def __aiter__(self):
+        chunks = self.response.raw.content.iter_chunked(models.chunk_size)
+        return chunks.__aiter__()
+
+    async def _write(self, fp, callback, hasher=None):
+        loop = asyncio.get_event_loop()
+        total = 0
+        if not callback:
+            def noop(*a, **kw):
+                pass
+            callback = noop
+
+        def put(chunk):
+            fp.write(chunk)
+            if hasher:
+                hasher.update(chunk)
+        callback(start=self)
+        try:
+            async for chunk in self:
+                if self._cancel:
+                    raise RequestCancelled()
+                # writing and hashing would block the other tasks
+                await loop.run_in_executor(None, put, chunk)
+                size = len(chunk)
+                total += size
+                callback(wrote=size, total=total)
+        finally:
+            self.response.close()
+        if hasher:
+            hasher.check(self.size)
+        if self.size == 0:
+            self.size = total
+        callback(finish=self)
+
+    async def _write_file(self, file, callback, digests):
+        with atomic_open(file, 'wb') as fp:
+            await self._write(fp, callback,
+                              Hasher(file, digests) if digests else None)
+
+    async def write(self, file=None, callback=None, digests=None):
+        '''Write the contents of the body to the optionally provided file and
+        providing progress to the optional callback. See
+        :py:meth:`planet.api.models.Body.write`.
+
+        :param file: file name or file-like object
+        :param callback: optional progress callback
+        :param dict digests: optional expected hex digests by algorithm
+        '''
+        if not file:
+            file = self.name
+        if not file:
+            raise ValueError('no file name provided or discovered in response')
+        if hasattr(file, 'write'):
+            await self._write(file, callback,
+                              Hasher(self.name, digests) if digests else None)
+            return
+        attempt = 0
+        while True:
+            try:
+                return await self._write_file(file, callback, digests)
+            except ChecksumMismatch as ex:
+                attempt += 1
+                if self._cancel or attempt > models.checksum_retries:
+                    raise
+                log.warning('%s, downloading again', ex)
+                self._notify('request_retry', attempt, 0, 'checksum')
+                self.response = await self._dispatcher._dispatch(
+                    self._request, True)
+                self.size = int(
+                    self.response.headers.get('content-length', 0))
+
+
+class JSON(models.JSON):
+    pass
+
+
+class _Paged(object):
+    '''Asynchronous paging, the first page is this object. Iterating with
+    `async for` yields the items of each page.'''
+
+    async def next(self):
+        next_ = self._next_url()
+        if next_:
+            request = models.Request(next_, self._request.auth,
+                                     body_type=type(self))
+            return await self._dispatcher.response(request).get_body()
+
+    async def _pages(self):
+        page = self
+        while page is not None:
+            yield page
+            page = await page.next()
+
+    async def iter(self, pages=None):
+        '''Get an async iterator of pages.
+
+        :param int pages: optional limit to number of pages
+        :return: async iter of this and subsequent pages
+        '''
+        cnt = 0
+        async for page in self._pages():
+            if pages is not None and cnt >= pages:
+                break
+            cnt += 1
+            yield page
+
+    async def items_iter(self, limit=None):
+        '''Get an async iterator of the 'items' in each page.
+
+        :param int limit: The number of 'items' to limit to.
+        :return: async iter of items in page
+        '''
+        if limit is not None and limit <= 0:
+            return
+        cnt = 0
+        async for page in self._pages():
+            for item in page.get()[self.ITEM_KEY]:
+                yield item
+                cnt += 1
+                if limit is not None and cnt >= limit:
+                    return
+
+    def __aiter__(self):
+        return self.items_iter(None)
+
+
+class Paged(_Paged, models.Paged):
+    pass
+
+
+class Items(_Paged, models.Items):
+    pass
+
+
+class Searches(_Paged, models.Searches):
+    pass
+
+
+class Mosaics(_Paged, models.Mosaics):
+    pass
+
+
+class MosaicQuads(_Paged, models.MosaicQuads):
+    pass
+
+
+class Feeds(_Paged, models.Feeds):
+    pass
+
+
+class Subscriptions(_Paged, models.Subscriptions):
+    pass
+
+
+class WFS3Collections(_Paged, models.WFS3Collections):
+    pass
+
+
+class WFS3Features(_Paged, models.WFS3Features):
+    pass
+
+
+class Orders(_Paged, models.Orders):
+    pass
+
+
+class DeliverySubscriptions(_Paged, models.DeliverySubscriptions):
+    pass
+
+
+class Order(models.Order):
+    pass
+
+
+async def _anext(items):
+    '''The next item of an async iterator or None.'''
+    try:
+        return await items.__anext__()
+    except StopAsyncIteration:
+        return None
+
+
+class ShardedItems(object):
+    '''The items of several searches read concurrently and merged into one
+    stream, see :py:class:`planet.api.sharding.ShardedItems`. Iterate with
+    `async for`.
+
+    :param searches: sequence of coroutine functions that each return
+                     :py:class:`planet.api.aio.Items`
+    :param int buffer: The maximum number of items read ahead of the consumer
+                       when not sorted
+    :param sort: optional sort specification, see
+                 :py:func:`planet.api.sharding.sort_key`
+    '''
+
+    def __init__(self, searches, buffer=1000, sort=None):
+        self._searches = list(searches)
+        self._buffer = buffer
+        self._sort = sort
+
+    async def _run(self, search, items):
+        try:
+            async for item in await search():
+                await items.put(item)
+        except asyncio.CancelledError:
+            raise
+        except Exception as ex:
+            await items.put(ex)
+        # None marks the end of this search
+        await items.put(None)
+
+    async def _merged(self):
+        items = asyncio.Queue(self._buffer)
+        tasks = [asyncio.ensure_future(self._run(search, items))
+                 for search in self._searches]
+        running = len(tasks)
+        seen = sharding._RecentIds(sharding.DEDUPE_SIZE)
+        try:
+            while running:
+                item = await items.get()
+                if item is None:
+                    running -= 1
+                elif isinstance(item, Exception):
+                    raise item
+                elif seen.add(item['id']):
+                    yield item
+        finally:
+            [t.cancel() for t in tasks]
+
+    async def _ordered(self):
+        key = sharding.sort_key(self._sort)
+        pages = await asyncio.gather(*[search() for search in self._searches])
+        streams = [page.items_iter() for page in pages]
+        seen = sharding._RecentIds(sharding.DEDUPE_SIZE)
+        try:
+            heap = []
+            for index, stream in enumerate(streams):
+                item = await _anext(stream)
+                if item is not None:
+                    heap.append((key(item), index, item))
+            heapq.heapify(heap)
+            while heap:
+                _, index, item = heap[0]
+                if seen.add(item['id']):
+                    yield item
+                item = await _anext(streams[index])
+                if item is None:
+                    heapq.heappop(heap)
+                else:
+                    heapq.heapreplace(heap, (key(item), index, item))
+        finally:
+            for stream in streams:
+                await stream.aclose()
+
+    async def items_iter(self, limit=None):
+        '''Get an async iterator of the items of all searches.
+
+        :param int limit: The number of items to limit to.
+        :return: async iter of items
+        '''
+        if limit is not None and limit <= 0:
+            return
+        items = self._ordered() if self._sort else self._merged()
+        cnt = 0
+        try:
+            async for item in items:
+                yield item
+                cnt += 1
+                if limit is not None and cnt >= limit:
+                    return
+        finally:
+            await items.aclose()
+
+    def __aiter__(self):
+        return self.items_iter(None)
+
+
+# map the synchronous body types requested by the client to async ones
+_BODY_TYPES = {
+    models.Body: Body,
+    models.JSON: JSON,
+    models.Paged: Paged,
+    models.Items: Items,
+    models.Searches: Searches,
+    models.Mosaics: Mosaics,
+    models.MosaicQuads: MosaicQuads,
+    models.Feeds: Feeds,
+    models.Subscriptions: Subscriptions,
+    models.WFS3Collections: WFS3Collections,
+    models.WFS3Features: WFS3Features,
+    models.Orders: Orders,
+    models.DeliverySubscriptions: DeliverySubscriptions,
+    models.Order: Order,
+}
+
+
+def _params(params):
+    # aiohttp only accepts str values
+    return dict((k, str(v)) for k, v in (params or {}).items()
+                if v is not None)
+
+
+class AsyncDispatcher(object):
+    '''Dispatches requests using a shared aiohttp session. Requests are rate
+    limited and retried like those of the
+    :py:class:`planet.api.dispatch.RequestsDispatcher` but no thread is used
+    per request.
+
+    :param int limit: The maximum number of concurrent connections
+    '''
+
+    def __init__(self, limit=100, rate_limit=4, burst=None, retry=None,
+                 max_rate=None, timeouts=None):
+        if aiohttp is None:
+            raise ImportError('the asyncio client requires aiohttp, '
+                              'pip install planet[async]')
+        self._limit = limit
+        self._session = None
+        self.limiter = _RateLimiter(rate_limit, burst, max_rate)
+        self.timeouts = dict(DEFAULT_TIMEOUTS, **(timeouts or {}))
+        self.retry = retry or RetryPolicy()
+        self.hooks = Hooks()
+
+    def add_listener(self, listener):
+        '''Add a :py:class:`planet.api.metrics.Listener` to be notified
+        of request activity.'''
+        self.hooks.add(listener)
+
+    def remove_listener(self, listener):
+        self.hooks.remove(listener)
+
+    def _get_session(self):
+        if self._session is None or self._session.closed:
+            connector = aiohttp.TCPConnector(limit=self._limit,
+                                             ssl=None if USE_STRICT_SSL
+                                             else False)
+            self._session = aiohttp.ClientSession(
+                connector=connector,
+                headers={'User-Agent': _get_user_agent()})
+        return self._session
+
+    async def close(self):
+        if self._session is not None:
+            await self._session.close()
+            self._session = None
+
+    def response(self, request, stream=False):
+        return Response(request, self, stream)
+
+    async def _send(self, request, stream):
+        '''Make a request, following redirects in the same way as the
+        :py:class:`planet.api.dispatch.RedirectSession`'''
+        session = self._get_session()
+        connect, read = self.timeouts['download' if stream else 'api']
+        timeout = aiohttp.ClientTimeout(sock_connect=connect, sock_read=read)
+        headers = _headers(request)
+        url, params = request.url, _params(request.params)
+        method, data = request.method, request.data
+        while True:
+            resp = await session.request(method, url, data=data,
+                                         headers=headers, params=params,
+                                         allow_redirects=False,
+                                         timeout=timeout)
+            location = resp.headers.get('Location')
+            if resp.status not in _REDIRECT_STATUS or not location:
+                break
+            resp.release()
+            redirect = str(resp.url.join(URL(location)))
+            if resp.status == 303:
+                method, data = 'GET', None
+            params = None
+            auth = headers.get('Authorization')
+            if auth and not _is_subdomain_of_tld(url, redirect):
+                headers = dict(headers)
+                headers.pop('Authorization')
+                key = re.match(r'api-key (\S+)', auth)
+                if key:
+                    params = {'api_key': key.group(1)}
+            url = redirect
+        content = None
+        if not stream or resp.status >= 300:
+            try:
+                content = await resp.read()
+            finally:
+                resp.release()
+        return _HTTPResponse(resp, content)
+
+    async def _checked_send(self, request, stream):
+        '''Send a request, raising the requests exceptions a
+        :py:class:`planet.api.retry.RetryPolicy` knows for aiohttp's.'''
+        try:
+            return await self._send(request, stream)
+        except asyncio.TimeoutError as ex:
+            raise ReadTimeout(ex)
+        except aiohttp.ClientConnectionError as ex:
+            raise ConnectionError(ex)
+
+    async def _dispatch(self, request, stream=False):
+        attempt, wait = 0, 0
+        while True:
+            attempt += 1
+            throttled = self.limiter._reserve(request)
+            if throttled > 0:
+                self.hooks.throttle_wait(request, throttled)
+                await asyncio.sleep(throttled)
+            _log_request(request)
+            self.hooks.request_start(request)
+            t = time.time()
+            resp = None
+            try:
+                resp = await self._checked_send(request, stream)
+                elapsed = time.time() - t
+                self.hooks.request_end(request, resp, elapsed)
+                check_status(resp)
+                self.limiter.feedback(request)
+                self.retry.record(request, attempt, elapsed)
+                return resp
+            except (APIException,) + self.retry.connection_errors as ex:
+                elapsed = time.time() - t
+                self.limiter.feedback(request, ex)
+                if resp is None:
+                    self.hooks.request_end(request, None, elapsed, ex)
+                wait, reason = self.retry.get_wait(request, attempt, wait,
+                                                   resp, ex)
+                self.retry.record(request, attempt, elapsed, wait, reason,
+                                  failed=wait is None)
+                if wait is None:
+                    raise
+                self.hooks.request_retry(request, attempt, wait, reason)
+                await asyncio.sleep(wait)
+
+
+def write_to_file(directory=None, callback=None, overwrite=True,
+                  digests=None, checksums=None):
+    '''Create a coroutine function for asynchronous Body handling. See
+    :py:func:`planet.api.write_to_file`.
+
+    :param directory str: The optional directory to write to.
+    :param callback func: An optional callback to receive notification of
+                          write progress.
+    :param overwrite bool: Overwrite any existing files. Defaults to True.
+    :param digests dict: The optional expected digests of the download,
+                         otherwise those expected by `checksums` are used.
+    :param checksums: An optional
+                      :py:class:`planet.api.checksums.Checksums` of the
+                      directory.
+    '''
+
+    async def writer(body):
+        loop = asyncio.get_event_loop()
+        file = os.path.join(directory or '.', body.name)
+        expected = digests
+        if expected is None and checksums is not None:
+            expected = checksums.expected(body.name)
+        if overwrite or not os.path.exists(file) or \
+                checksums is not None and expected and \
+                not await loop.run_in_executor(
+                    None, checksums.verified, body.name, expected):
+            await body.write(file, callback, digests=expected)
+            if checksums is not None and expected:
+                await loop.run_in_executor(
+                    None, checksums.record, body.name, preferred(expected))
+        else:
+            if callback:
+                callback(skip=body)
+            body.response.close()
+    return writer
+
+
+class AsyncClientV1(ClientV1):
+    '''AsyncClientV1 provides the methods of
+    :py:class:`planet.api.ClientV1` as coroutines. Returned Paged bodies
+    support `async for` over their items and downloaded bodies are streamed
+    asynchronously.
+
+    The client should be closed when no longer needed, either by awaiting
+    :py:meth:`close` or by using it as an async context manager.
+
+    :param int limit: The maximum number of concurrent connections
+    '''
+
+    def __init__(self, api_key=None, base_url='https://api.planet.com/',
+                 limit=100, rate_limit=4, burst=None, retry=None,
+                 max_rate=None):
+        ClientV1.__init__(self, api_key, base_url, limit, rate_limit, burst,
+                          retry, max_rate=max_rate)
+
+    def _create_dispatcher(self, workers, rate_limit, burst, retry, cache,
+                           max_rate):
+        return AsyncDispatcher(workers, rate_limit, burst, retry, max_rate)
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc):
+        await self.close()
+
+    async def close(self):
+        '''Close any open connections.'''
+        await self.dispatcher.close()
+
+    def shutdown(self):
+        pass
+
+    async def login(self, identity, credentials):
+        '''Login using email identity and credentials, see
+        :py:meth:`planet.api.ClientV1.login`.'''
+        session = self.dispatcher._get_session()
+        async with session.post(self._url('v0/auth/login'), json={
+            'email': identity,
+            'password': credentials
+        }) as resp:
+            return _login_result(resp.status, await resp.text())
+
+    async def sharded_search(self, request, shards=4, interval='day', **kw):
+        '''Execute a quick search as several concurrent searches, see
+        :py:meth:`planet.api.ClientV1.sharded_search`.
+
+        :returns: :py:class:`planet.api.aio.ShardedItems`
+        '''
+        stats = (await self.stats(dict(request, interval=interval))).get()
+        boundaries = sharding.shard_boundaries(stats['buckets'], shards)
+        return ShardedItems(
+            [functools.partial(self.quick_search, shard, **kw)
+             for shard in sharding.shard_requests(request, boundaries)],
+            sort=kw.get('sort'))
+
+    def _get(self, path, body_type=models.JSON, params=None, stream=False):
+        for k, v in (params or {}).items():
+            if isinstance(v, dict):
+                params[k] = json.dumps(v)
+        request = self._request(path, body_type, params)
+        return self.dispatcher.response(request, stream)
+
+    async def _download(self, url, callback):
+        body = await self._get(url, models.Body, stream=True).get_body()
+        if callback:
+            await callback(body)
+        return body
+
+    async def download(self, asset, callback=None):
+        '''Download the specified asset. If provided, the coroutine function
+        callback will be awaited with the Body, see
+        :py:func:`planet.api.aio.write_to_file`. Otherwise it is up to the
+        caller to consume the streaming Body.
+
+        :param asset dict: An asset representation from the API
+        :param callback: An optional coroutine function handling the Body
+        :returns: :py:Class:`planet.api.aio.Body` of the asset.
+        :raises planet.api.exceptions.APIException: On API error.
+        '''
+        return await self._download(asset['location'], callback)
+
+    async def download_quad(self, quad, callback=None):
+        '''Download the specified mosaic quad, see :py:meth:`download`.
+
+        :param quad dict: A mosaic quad representation from the API
+        :param callback: An optional coroutine function handling the Body
+        :returns: :py:Class:`planet.api.aio.Body` of the quad.
+        :raises planet.api.exceptions.APIException: On API error.
+        '''
+        try:
+            download_url = quad['_links']['download']
+        except KeyError:
+            msg = 'You do not have download permissions for quad {}'
+            raise NoPermission(msg.format(quad['id']))
+        return await self._download(download_url, callback)
+
+    async def download_location(self, location, callback=None):
+        '''Download an item in an order, see :py:meth:`download`.
+
+        :param location: location URL of item
+        :param callback: An optional coroutine function handling the Body
+        :returns: :py:Class:`planet.api.aio.Body` of the item.
+        :raises planet.api.exceptions.APIException: On API error.
+        '''
+        return await self._download(location, callback)
+
+    async def download_order(self, order_id, callback=None):
+        '''Download all items in an order concurrently.
+
+        :param order_id: ID of order to download
+        :param callback: An optional coroutine function handling each Body
+        :returns: list of :py:Class:`planet.api.aio.Body`
+        :raises planet.api.exceptions.APIException: On API error.
+        '''
+        order = await self.get_individual_order(order_id)
+        return await asyncio.gather(*[
+            self.download_location(location, callback)
+            for location in order.get_locations()])
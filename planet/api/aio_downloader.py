@@ -0,0 +1,319 @@
+# Copyright 2021 Planet Labs, Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+'''An asyncio Downloader. This requires Python 3.6+ and an
+:py:class:`planet.api.aio.AsyncClientV1`.
+
+Instead of a thread per stage, the activation, polling and download of
+assets are done by pools of tasks on one event loop, connected by bounded
+queues::
+
+    items -> activate queue -> poll queue -> download queue
+
+A full queue makes the stage before it wait, so the search is only paged as
+fast as items are downloaded, while thousands of items may be activating
+and hundreds of assets downloading at once. Requests are still limited by
+the client's rate limiter and connection limit.
+'''
+import asyncio
+import logging
+import os
+import time
+
+from . import journal
+from .aio import write_to_file
+from .checksums import Checksums
+from .downloader import _all_status
+from .downloader import _by_status
+from .downloader import _PollSchedule
+from .downloader import ActivationEstimates
+from .downloader import Downloader
+
+_logger = logging.getLogger(__name__)
+_info = _logger.info
+
+
+class AsyncDownloader(_PollSchedule, Downloader):
+    '''A :py:class:`planet.api.downloader.Downloader` running on asyncio.
+
+    `activate` and `download` run their own event loop until complete, so
+    they may be used like those of :py:func:`planet.api.downloader.create`.
+    From a coroutine, await :py:meth:`run` instead.
+
+    :param client: The :py:class:`planet.api.aio.AsyncClientV1`
+    :param int activations: The maximum number of items being activated
+                            and polled at once
+    :param int downloads: The maximum number of concurrent downloads
+    :param estimates: optional
+                      :py:class:`planet.api.downloader.ActivationEstimates`
+                      scheduling activation polls
+    :param journal: optional :py:class:`planet.api.journal.Journal`
+                    recording the state of each item's assets
+    '''
+    # the number of tasks requesting activation, activation requests are
+    # quick so these keep the activate queue moving
+    _activators = 100
+
+    def __init__(self, client, activations=1000, downloads=100,
+                 estimates=None, journal=None):
+        self._client = client
+        self._activations_limit = activations
+        self._downloads_limit = downloads
+        self._estimates = estimates or ActivationEstimates()
+        self._journal = journal
+        self._loop = None
+        self._main = None
+        self._reset(None, None)
+
+    def _reset(self, asset_types, dest):
+        self._asset_types = asset_types
+        self._dest = dest
+        self._checksums = dest and Checksums(dest)
+        self._queues = []
+        self._paging = False
+        self._activating = 0
+        self._downloading = 0
+        self._downloads = 0
+        self._written = 0
+        self._completed = 0
+        self._polls = 0
+        self._activations = 0
+
+    def activate(self, items, asset_types):
+        return self._run_loop(items, asset_types)
+
+    def download(self, items, asset_types, dest):
+        return self._run_loop(items, asset_types, dest)
+
+    def _run_loop(self, items, asset_types, dest=None):
+        loop = asyncio.new_event_loop()
+        try:
+            return loop.run_until_complete(
+                self.run(items, asset_types, dest))
+        finally:
+            # the client's session belongs to this loop
+            loop.run_until_complete(self._client.close())
+            loop.close()
+
+    async def run(self, items, asset_types, dest=None):
+        '''Activate and, if `dest` is provided, download the specified
+        asset_types of the items.
+
+        :param items: a sequence or async iterable of Item representations
+        :param asset_types list: list of asset-type (str)
+        :param dest str: optional download destination directory, must exist
+        :returns: the final :py:meth:`stats`
+        '''
+        if self._main is not None:
+            raise Exception('already running')
+        self._reset(asset_types, dest)
+        self._loop = asyncio.get_event_loop()
+        self._main = asyncio.ensure_future(self._pipeline(items))
+        try:
+            await self._main
+        except asyncio.CancelledError:
+            _info('download cancelled')
+        finally:
+            self._main = None
+            self._estimates.save()
+            if self._checksums:
+                self._checksums.flush()
+        return self.stats()
+
+    async def _pipeline(self, items):
+        activate_q = asyncio.Queue(self._activations_limit)
+        poll_q = asyncio.Queue(self._activations_limit)
+        download_q = asyncio.Queue(self._downloads_limit)
+        self._queues = [activate_q, poll_q, download_q]
+        stages = [
+            (activate_q, self._activate, self._activators),
+            (poll_q, self._poll, self._activations_limit),
+        ]
+        if self._dest:
+            stages.append((download_q, self._download,
+                           self._downloads_limit))
+        workers = [[asyncio.ensure_future(self._worker(queue, do))
+                    for _ in range(count)] for queue, do, count in stages]
+        try:
+            self._paging = True
+            await self._feed(items, activate_q)
+            self._paging = False
+            # each stage is done when its queue is drained after the stage
+            # before it is done
+            for (queue, _, _), tasks in zip(stages, workers):
+                await queue.join()
+                [t.cancel() for t in tasks]
+        finally:
+            self._paging = False
+            for tasks in workers:
+                [t.cancel() for t in tasks]
+            await asyncio.gather(*sum(workers, []), return_exceptions=True)
+
+    async def _feed(self, items, activate_q):
+        if hasattr(items, '__aiter__'):
+            async for item in items:
+                await self._put(item, activate_q)
+        else:
+            for item in items:
+                await self._put(item, activate_q)
+
+    async def _put(self, item, activate_q):
+        self._activating += 1
+        await activate_q.put(item)
+
+    async def _worker(self, queue, do):
+        while True:
+            task = await queue.get()
+            try:
+                await do(task)
+            except asyncio.CancelledError:
+                raise
+            except Exception:
+                logging.exception('unexpected error in %s', do.__name__)
+            finally:
+                queue.task_done()
+
+    def _record(self, item, asset_type, state, **kw):
+        if self._journal is not None:
+            self._journal.set_state(item['id'], asset_type, state, **kw)
+
+    async def _get_assets(self, item):
+        return (await self._client.get_assets(item)).get()
+
+    async def _activate(self, item):
+        try:
+            assets = await self._get_assets(item)
+            asset_types = self._asset_types
+            if not any([t in assets for t in asset_types]):
+                _info('no desired assets in item, skipping')
+                self._activating -= 1
+                return
+            inactive = _by_status(assets, asset_types, 'inactive')
+            if inactive:
+                # activate all at once and poll for them together
+                await asyncio.gather(*[self._client.activate(a)
+                                       for a in inactive])
+                assets = dict(assets)
+                for t in asset_types:
+                    if t in assets and assets[t]['status'] == 'inactive':
+                        assets[t] = dict(assets[t], status='activating')
+            if not _all_status(assets, asset_types,
+                               ['activating', 'active']):
+                status = [assets[t]['status'] for t in asset_types
+                          if t in assets]
+                raise Exception('unexpected state %s' % status)
+        except Exception:
+            self._activating -= 1
+            raise
+        for t in asset_types:
+            if t in assets:
+                self._record(item, t, journal.ACTIVE
+                             if assets[t]['status'] == 'active'
+                             else journal.ACTIVATING)
+        await self._queues[1].put((item, assets))
+
+    async def _poll(self, task):
+        item, assets = task
+        try:
+            start = last = time.time()
+            polls = 0
+            if not self._active(assets):
+                await asyncio.sleep(self._first_delay(item, assets))
+            while not self._active(assets):
+                now = time.time()
+                polled = await self._get_assets(item)
+                self._polls += 1
+                polls += 1
+                self._observe(item, assets, polled, start, last, now)
+                assets, last = polled, now
+                if self._active(assets):
+                    self._activations += 1
+                else:
+                    await asyncio.sleep(self._poll_delay(polls))
+        finally:
+            self._activating -= 1
+        _logger.debug('activation took %d', time.time() - start)
+        asset_types = [t for t in self._asset_types if t in assets]
+        for t in asset_types:
+            self._record(item, t, journal.ACTIVE)
+        if not self._dest:
+            for t in asset_types:
+                self.on_complete(item, assets[t])
+            self._completed += 1
+            return
+        for t in asset_types:
+            if self._journal is not None and \
+                    self._journal.state(item['id'], t) == journal.DONE:
+                continue
+            await self._queues[2].put((item, assets[t]))
+
+    def _write_tracker(self, **kw):
+        if 'skip' in kw:
+            _info('skipping download of %s, already exists',
+                  kw['skip'].name)
+        elif 'wrote' in kw:
+            self._written += kw['wrote']
+
+    async def _download(self, task):
+        item, asset = task
+        self._record(item, asset['type'], journal.DOWNLOADING)
+        self._downloads += 1
+        self._downloading += 1
+        digests = None
+        if asset.get('md5_digest'):
+            digests = {'md5': asset['md5_digest']}
+        try:
+            writer = write_to_file(self._dest, self._write_tracker,
+                                   overwrite=False, digests=digests,
+                                   checksums=self._checksums)
+            body = await self._client.download(asset, writer)
+        except Exception as ex:
+            self._record(item, asset['type'], journal.FAILED,
+                         error=str(ex))
+            _logger.error('download failed: %s', ex)
+            return
+        finally:
+            self._downloading -= 1
+        path = os.path.join(self._dest, body.name)
+        self._record(item, asset['type'], journal.DONE, path=path)
+        self.on_complete(item, asset, path)
+        self._completed += 1
+
+    def stats(self):
+        stats = {
+            'paging': self._paging,
+            'activating': self._activating,
+            'pending': 0,
+            'complete': self._completed,
+            'polls_per_activation': round(self.polls_per_activation(), 2),
+        }
+        if self._dest:
+            stats['downloading'] = self._downloading
+            stats['downloaded'] = '%.2fMB' % (self._written / 1.0e6)
+            if self._queues:
+                stats['pending'] = self._queues[2].qsize()
+        dispatcher = getattr(self._client, 'dispatcher', None)
+        if dispatcher is not None:
+            stats['rate'] = dispatcher.limiter.rates()
+        return stats
+
+    def _cancel(self):
+        if self._main is not None:
+            self._main.cancel()
+
+    def shutdown(self):
+        '''Halt execution, safe to call from any thread.'''
+        loop = self._loop
+        if loop is not None and not loop.is_closed():
+            loop.call_soon_threadsafe(self._cancel)
+        self._client.shutdown()
@@ -0,0 +1,204 @@
+# Copyright 2021 Planet Labs, Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+'''A conditional-GET response cache for the dispatcher.'''
+
+from collections import OrderedDict
+import hashlib
+import json
+import logging
+import os
+import re
+import threading
+import time
+
+from requests import Response
+from requests.compat import urlparse
+from requests.structures import CaseInsensitiveDict
+
+from ._fatomic import atomic_open
+
+log = logging.getLogger(__name__)
+
+# (url path pattern, ttl seconds) - responses younger than the ttl are served
+# without a request, older ones are revalidated with the server.
+DEFAULT_RULES = (
+    (r'/basemaps/v1/', 300),
+    (r'/analytics/(feeds|subscriptions|collections)(/[^/]+)?/?$', 300),
+    (r'/data/v1/item-types/[^/]+/items/[^/]+/assets/?$', 0),
+    (r'/data/v1/item-types/[^/]+/items/[^/]+/?$', 60),
+)
+
+
+class ResponseCache(object):
+    '''A cache of GET responses keyed by URL, parameters and API key.
+
+    Only requests whose URL path matches one of the `rules` are cached. Each
+    rule is a (regular expression, ttl) pair where the first match wins. A
+    cached response younger than the ttl is served directly. Otherwise the
+    request is revalidated using ``If-None-Match``/``If-Modified-Since`` and
+    a ``304 Not Modified`` response is served from the cached copy.
+
+    Responses are kept in memory with least-recently-used eviction and, if a
+    `directory` is provided, also on disk so they survive between processes.
+
+    :param int maxsize: The maximum number of responses held in memory
+    :param str directory: Optional directory to persist responses to
+    :param rules: Sequence of (pattern, ttl seconds), see `DEFAULT_RULES`
+    '''
+
+    def __init__(self, maxsize=256, directory=None, rules=DEFAULT_RULES):
+        self.maxsize = maxsize
+        self.directory = directory
+        self._rules = [(re.compile(p), p, ttl) for p, ttl in rules]
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self._stats = {}
+        if directory and not os.path.isdir(directory):
+            os.makedirs(directory)
+
+    def _rule(self, request):
+        if request.method.upper() != 'GET':
+            return None
+        path = urlparse(request.url).path
+        for regex, pattern, ttl in self._rules:
+            if regex.search(path):
+                return pattern, ttl
+
+    def _key(self, request):
+        params = sorted((request.params or {}).items())
+        auth = request.auth.value if request.auth else ''
+        key = json.dumps([auth, request.url, params], default=str)
+        return hashlib.sha1(key.encode('utf-8')).hexdigest()
+
+    def _count(self, pattern, event):
+        with self._lock:
+            counts = self._stats.setdefault(pattern, {
+                'hits': 0, 'misses': 0, 'revalidated': 0, 'evictions': 0,
+            })
+            counts[event] += 1
+
+    def stats(self):
+        '''Get a dict of statistics for each cache rule pattern:
+
+        - hits: `int` responses served without a request
+        - revalidated: `int` responses served after a 304 Not Modified
+        - misses: `int` responses requested in full
+        - evictions: `int` responses evicted from memory
+        '''
+        with self._lock:
+            return dict((p, dict(c)) for p, c in self._stats.items())
+
+    def _path(self, key):
+        return os.path.join(self.directory, key + '.json')
+
+    def _get(self, key):
+        with self._lock:
+            entry = self._entries.pop(key, None)
+            if entry is not None:
+                self._entries[key] = entry
+                return entry
+        if self.directory:
+            try:
+                with open(self._path(key), 'r') as fp:
+                    entry = json.load(fp)
+            except (IOError, OSError, ValueError):
+                return None
+            self._put(key, entry, persist=False)
+            return entry
+
+    def _put(self, key, entry, persist=True):
+        evicted = []
+        with self._lock:
+            self._entries.pop(key, None)
+            self._entries[key] = entry
+            while len(self._entries) > self.maxsize:
+                evicted.append(self._entries.popitem(last=False)[1])
+        for old in evicted:
+            self._count(old['rule'], 'evictions')
+        if persist and self.directory:
+            try:
+                with atomic_open(self._path(key), 'w') as fp:
+                    fp.write(json.dumps(entry))
+            except (IOError, OSError):
+                log.exception('unable to persist cached response')
+
+    def clear(self):
+        '''Remove all cached responses from memory and disk.'''
+        with self._lock:
+            self._entries.clear()
+        if self.directory:
+            for name in os.listdir(self.directory):
+                if name.endswith('.json'):
+                    os.unlink(os.path.join(self.directory, name))
+
+    def _response(self, entry):
+        resp = Response()
+        resp.status_code = 200
+        resp.url = entry['url']
+        resp.headers = CaseInsensitiveDict(entry['headers'])
+        resp.encoding = entry['encoding']
+        resp._content = entry['content'].encode('utf-8')
+        resp._content_consumed = True
+        return resp
+
+    def fetch(self, request, send):
+        '''Get the response to the request from the cache or by invoking
+        send.
+
+        :param request: The :py:class:`planet.api.models.Request`
+        :param send: function accepting a dict of extra request headers and
+                     returning the HTTP response
+        :returns: the HTTP response
+        '''
+        rule = self._rule(request)
+        if rule is None:
+            return send({})
+        pattern, ttl = rule
+        key = self._key(request)
+        entry = self._get(key)
+        headers = {}
+        if entry is not None:
+            if time.time() - entry['stored'] < ttl:
+                self._count(pattern, 'hits')
+                return self._response(entry)
+            if entry['etag']:
+                headers['If-None-Match'] = entry['etag']
+            if entry['last_modified']:
+                headers['If-Modified-Since'] = entry['last_modified']
+        resp = send(headers)
+        if resp.status_code == 304 and entry is not None:
+            resp.close()
+            entry['stored'] = time.time()
+            self._put(key, entry)
+            self._count(pattern, 'revalidated')
+            return self._response(entry)
+        self._count(pattern, 'misses')
+        etag = resp.headers.get('etag')
+        last_modified = resp.headers.get('last-modified')
+        if resp.status_code == 200 and (ttl or etag or last_modified):
+            try:
+                content = resp.content.decode('utf-8')
+            except UnicodeDecodeError:
+                return resp
+            self._put(key, {
+                'rule': pattern,
+                'url': resp.url,
+                'headers': dict(resp.headers),
+                'encoding': resp.encoding,
+                'content': content,
+                'etag': etag,
+                'last_modified': last_modified,
+                'stored': time.time(),
+            })
+        return resp
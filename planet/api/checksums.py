@@ -0,0 +1,224 @@
+# Copyright 2021 Planet Labs, Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+'''Verification of downloads against expected digests.
+
+Digests are computed as a download is written, see
+:py:meth:`planet.api.models.Body.write`, and the verified digests of the
+files in a directory are recorded in a `.planet-checksums.json` file there,
+so later downloads to the directory can trust an existing file without
+reading it again.
+'''
+import hashlib
+import json
+import os
+import threading
+import time
+
+from ._fatomic import _replace_file
+from .exceptions import ChecksumMismatch
+
+#: The supported digest algorithms, most preferred first
+ALGORITHMS = ('sha256', 'md5')
+
+#: The name of the file recording the digests of a directory's files
+RECORD_NAME = '.planet-checksums.json'
+
+_read_size = 1024 * 1024
+
+
+def preferred(digests):
+    '''Get the most preferred of the expected digests.
+
+    >>> from planet.api.checksums import preferred
+    >>> preferred({'md5': 'A1', 'sha256': 'B2'})
+    {'sha256': 'b2'}
+
+    :param dict digests: hex digests by algorithm name, unsupported
+                         algorithms and empty values are ignored
+    :returns: a dict with the single preferred digest, lower case, or an
+              empty dict
+    '''
+    for algorithm in ALGORITHMS:
+        if (digests or {}).get(algorithm):
+            return {algorithm: digests[algorithm].lower()}
+    return {}
+
+
+class Hasher(object):
+    '''Compute digests of data as it is written and compare them with the
+    expected digests.
+
+    :param str name: The name of the data, for errors
+    :param dict digests: The expected hex digests by algorithm name
+    '''
+
+    def __init__(self, name, digests):
+        self.name = name
+        self.expected = preferred(digests)
+        self.reset()
+
+    def reset(self):
+        '''Start over, e.g. when a download restarts.'''
+        self.size = 0
+        self._hashes = dict((a, hashlib.new(a)) for a in self.expected)
+
+    def update(self, data):
+        self.size += len(data)
+        for h in self._hashes.values():
+            h.update(data)
+
+    def update_file(self, path):
+        '''Hash the content of a file.'''
+        with open(path, 'rb') as fp:
+            for data in iter(lambda: fp.read(_read_size), b''):
+                self.update(data)
+
+    def digests(self):
+        '''Get the hex digests of the data so far.'''
+        return dict((a, h.hexdigest()) for a, h in self._hashes.items())
+
+    def check(self, size=0):
+        '''Raise ChecksumMismatch if the data is not the expected `size`,
+        unless 0, or does not have the expected digests.'''
+        if size and self.size != size:
+            raise ChecksumMismatch(self.name, 'size', size, self.size)
+        for algorithm, actual in self.digests().items():
+            if actual != self.expected[algorithm]:
+                raise ChecksumMismatch(self.name, algorithm,
+                                       self.expected[algorithm], actual)
+
+
+def order_digests(manifest):
+    '''Get the digests of the files in an order's `manifest.json`, by file
+    name.
+
+    :param dict manifest: The decoded manifest
+    :returns: dict of file name to digests
+    '''
+    return dict((os.path.basename(f['path']), f['digests'])
+                for f in manifest.get('files', [])
+                if f.get('path') and f.get('digests'))
+
+
+class Checksums(object):
+    '''The verified digests of files downloaded to a directory and the
+    digests expected of files yet to be downloaded. Safe for use from
+    several threads.
+
+    The record is saved at most once a second as files are recorded, call
+    :py:meth:`flush` once done.
+
+    :param str directory: The directory
+    '''
+    # seconds between saves of the record
+    _save_interval = 1.
+
+    def __init__(self, directory):
+        self.directory = directory or '.'
+        self.path = os.path.join(self.directory, RECORD_NAME)
+        self._lock = threading.Lock()
+        self._expected = {}
+        self._records = None
+        self._dirty = False
+        self._saved = 0
+
+    def _load(self):
+        if self._records is None:
+            try:
+                with open(self.path) as fp:
+                    self._records = json.load(fp)
+            except (IOError, OSError, ValueError):
+                self._records = {}
+        return self._records
+
+    def _save(self):
+        tmp = self.path + '.tmp'
+        with open(tmp, 'w') as fp:
+            json.dump(self._records, fp, indent=1, sort_keys=True)
+        _replace_file(tmp, self.path)
+        self._dirty = False
+        self._saved = time.time()
+
+    def expect(self, digests):
+        '''Add the expected digests of files.
+
+        :param dict digests: file name to digests, see :py:func:`preferred`
+        '''
+        with self._lock:
+            self._expected.update(digests)
+
+    def expected(self, name):
+        '''Get the expected digests of a file or None.'''
+        with self._lock:
+            return self._expected.get(name)
+
+    def record(self, name, digests):
+        '''Record the digests of a file as it is now.
+
+        :param str name: The file name in the directory
+        :param dict digests: The hex digests of its content by algorithm
+        '''
+        st = os.stat(os.path.join(self.directory, name))
+        with self._lock:
+            records = self._load()
+            known = records.get(name, {})
+            if known.get('size') != st.st_size or \
+                    known.get('mtime') != st.st_mtime:
+                known = {'digests': {}}
+            known['digests'].update(digests)
+            known.update(size=st.st_size, mtime=st.st_mtime)
+            records[name] = known
+            self._dirty = True
+            # saving is O(n) in the number of files, so only now and then
+            if time.time() - self._saved >= self._save_interval:
+                self._save()
+
+    def flush(self):
+        '''Save any recorded digests not yet saved.'''
+        with self._lock:
+            if self._dirty:
+                self._save()
+
+    def _recorded(self, name, st):
+        with self._lock:
+            known = self._load().get(name)
+        if known and known['size'] == st.st_size and \
+                known['mtime'] == st.st_mtime:
+            return known['digests']
+        return {}
+
+    def verified(self, name, digests):
+        '''Check if a file exists and has the expected digests. A file with
+        recorded digests is not read again unless it changed since.
+
+        :param str name: The file name in the directory
+        :param dict digests: The expected digests, see :py:func:`preferred`
+        :returns: bool
+        '''
+        path = os.path.join(self.directory, name)
+        try:
+            st = os.stat(path)
+        except OSError:
+            return False
+        expected = preferred(digests)
+        if not expected:
+            return True
+        recorded = self._recorded(name, st)
+        algorithm, = expected
+        if algorithm not in recorded:
+            hasher = Hasher(name, expected)
+            hasher.update_file(path)
+            recorded = hasher.digests()
+            self.record(name, recorded)
+        return recorded[algorithm] == expected[algorithm]
@@ -13,30 +13,55 @@
 # limitations under the License.
 
 import base64
+import functools
 import json
 from .dispatch import RequestsDispatcher
 from . import auth
 from .exceptions import (InvalidIdentity, APIException, NoPermission)
 from . import models
 from . import filters
+from . import sharding
 
 
 class _Base(object):
     '''High-level access to Planet's API.'''
 
     def __init__(self, api_key=None, base_url='https://api.planet.com/',
-                 workers=4):
+                 workers=4, rate_limit=4, burst=None, retry=None,
+                 cache=None, max_rate=None):
         '''
         :param str api_key: API key to use. Defaults to environment variable.
         :param str base_url: The base URL to use. Not required.
         :param int workers: The number of concurrent download workers
+        :param float rate_limit: The initial average requests per second
+                                 to each API (Data, Orders, Basemaps and
+                                 Analytics) across all workers, 0 to
+                                 disable. The rate is raised while requests
+                                 succeed and cut when they are throttled.
+        :param int burst: The number of requests allowed in a burst above
+                          the average rate. Defaults to the rate.
+        :param float max_rate: The maximum average requests per second to
+                               each API. Defaults to four times
+                               `rate_limit`.
+        :param retry: An optional
+                      :py:class:`planet.api.retry.RetryPolicy` controlling
+                      when and how failed requests are retried.
+        :param cache: An optional
+                      :py:class:`planet.api.cache.ResponseCache` for
+                      conditional GET caching of metadata requests.
         '''
         api_key = api_key or auth.find_api_key()
         self.auth = api_key and auth.APIKey(api_key)
         self.base_url = base_url
         if not self.base_url.endswith('/'):
             self.base_url += '/'
-        self.dispatcher = RequestsDispatcher(workers)
+        self.dispatcher = self._create_dispatcher(workers, rate_limit, burst,
+                                                  retry, cache, max_rate)
+
+    def _create_dispatcher(self, workers, rate_limit, burst, retry, cache,
+                           max_rate):
+        return RequestsDispatcher(workers, rate_limit, burst, retry,
+                                  self.base_url, cache, max_rate)
 
     def shutdown(self):
         self.dispatcher._asyncpool.executor.shutdown(wait=False)
@@ -80,25 +105,7 @@ class _Base(object):
                                                   'email': identity,
                                                   'password': credentials
                                               })
-        status = result.status_code
-        if status == 400:
-            raise APIException('invalid parameters, login process has changed')
-        elif status == 401:
-            # do our best to get something out to the user
-            msg = result.text
-            try:
-                msg = json.loads(result.text)['message']
-            finally:
-                raise InvalidIdentity(msg)
-        elif status != 200:
-            raise APIException('%s: %s' % (status, result.text))
-        jwt = result.text
-        payload = jwt.split('.')[1]
-        rem = len(payload) % 4
-        if rem > 0:
-            payload += '=' * (4 - rem)
-        payload = base64.urlsafe_b64decode(payload.encode('utf-8'))
-        return json.loads(payload.decode('utf-8'))
+        return _login_result(result.status_code, result.text)
 
 
 def _patch_stats_request(request):
@@ -167,6 +174,27 @@ class ClientV1(_Base):
             self._url('data/v1/quick-search'), self.auth, params=params,
             body_type=models.Items, data=body, method='POST')).get_body()
 
+    def sharded_search(self, request, shards=4, interval='day', **kw):
+        '''Execute a quick search as several concurrent searches, each
+        matching part of the `acquired` time range of the request. The
+        ranges are chosen using :py:meth:`stats` so each has about the same
+        number of items. Items are merged without duplicates, in the order
+        given by the `sort` option if any.
+
+        :param request: see :ref:`api-search-request`
+        :param int shards: The number of concurrent searches
+        :param str interval: The stats interval used to choose the ranges
+        :param `**kw`: See :py:meth:`quick_search` Options
+        :returns: :py:class:`planet.api.sharding.ShardedItems`
+        :raises planet.api.exceptions.APIException: On API error.
+        '''
+        stats = self.stats(dict(request, interval=interval)).get()
+        boundaries = sharding.shard_boundaries(stats['buckets'], shards)
+        return sharding.ShardedItems(
+            (functools.partial(self.quick_search, shard, **kw)
+             for shard in sharding.shard_requests(request, boundaries)),
+            sort=kw.get('sort'))
+
     def saved_search(self, sid, **kw):
         '''Execute a saved search by search id.
 
@@ -669,3 +697,25 @@ class ClientV1(_Base):
             body_type=models.JSON,
             params=params,
         ).get_body()
+
+
+def _login_result(status, text):
+    '''Decode the JWT of a login response.'''
+    if status == 400:
+        raise APIException('invalid parameters, login process has changed')
+    elif status == 401:
+        # do our best to get something out to the user
+        msg = text
+        try:
+            msg = json.loads(text)['message']
+        finally:
+            raise InvalidIdentity(msg)
+    elif status != 200:
+        raise APIException('%s: %s' % (status, text))
+    jwt = text
+    payload = jwt.split('.')[1]
+    rem = len(payload) % 4
+    if rem > 0:
+        payload += '=' * (4 - rem)
+    payload = base64.urlsafe_b64decode(payload.encode('utf-8'))
+    return json.loads(payload.decode('utf-8'))
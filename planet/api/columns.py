@@ -0,0 +1,163 @@
+# Copyright 2021 Planet Labs, Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+'''Columnar views of search results. This requires the optional `numpy`
+dependency (``pip install planet[columns]``).
+
+Items are read a batch at a time into typed arrays that grow as needed, so a
+large search uses a small fraction of the memory of a list of item dicts and
+can be filtered with vectorized operations::
+
+    cols = client.quick_search(request).to_columns(limit=None)
+    clear = cols[cols['cloud_cover'] < .1]
+'''
+
+import itertools
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+#: The fields read by default
+DEFAULT_FIELDS = ('acquired', 'cloud_cover', 'bbox')
+
+#: Properties read as `datetime64` values
+DATE_FIELDS = ('acquired', 'published', 'updated')
+
+# number of items converted at once
+BATCH_SIZE = 1000
+
+
+class _Column(object):
+    '''An array that grows by doubling as values are appended.'''
+
+    def __init__(self, dtype, shape=()):
+        self.size = 0
+        self._data = np.empty((BATCH_SIZE,) + shape, dtype)
+
+    def extend(self, values):
+        values = np.asarray(values)
+        end = self.size + len(values)
+        if values.dtype.kind == 'U' and \
+                values.dtype.itemsize > self._data.dtype.itemsize:
+            # widen to fit the longest string
+            self._data = self._data.astype(values.dtype)
+        if end > len(self._data):
+            grown = np.empty((max(end, 2 * len(self._data)),) +
+                             self._data.shape[1:], self._data.dtype)
+            grown[:self.size] = self._data[:self.size]
+            self._data = grown
+        self._data[self.size:end] = values
+        self.size = end
+
+    def values(self):
+        return self._data[:self.size]
+
+
+def _date(value):
+    if value is None:
+        return 'NaT'
+    # numpy does not parse timezones, the API uses UTC
+    return value[:-1] if value.endswith('Z') else value
+
+
+def _number(value):
+    return np.nan if value is None else value
+
+
+def _string(value):
+    return u'' if value is None else value
+
+
+def _positions(coordinates):
+    if coordinates and isinstance(coordinates[0], (int, float)):
+        yield coordinates
+    else:
+        for part in coordinates:
+            for position in _positions(part):
+                yield position
+
+
+def _bbox(item):
+    '''The (xmin, ymin, xmax, ymax) of the item's geometry.'''
+    geometry = item.get('geometry') or {}
+    positions = list(_positions(geometry.get('coordinates') or []))
+    if not positions:
+        return (np.nan,) * 4
+    xs = [p[0] for p in positions]
+    ys = [p[1] for p in positions]
+    return (min(xs), min(ys), max(xs), max(ys))
+
+
+def _field(field):
+    '''Get the (name, dtype, shape, getter) of a field.'''
+    if isinstance(field, tuple):
+        name, dtype = field
+    else:
+        name, dtype = field, None
+    if name == 'bbox':
+        return name, dtype or 'f8', (4,), _bbox
+    if name in DATE_FIELDS and dtype is None:
+        dtype = 'datetime64[us]'
+        convert = _date
+    elif dtype is None or np.dtype(dtype).kind == 'f':
+        dtype = dtype or 'f8'
+        convert = _number
+    elif np.dtype(dtype).kind == 'U':
+        convert = _string
+    else:
+        def convert(value):
+            return value
+
+    def get(item):
+        return convert(item.get('properties', {}).get(name))
+    return name, dtype, (), get
+
+
+def to_columns(items, fields=DEFAULT_FIELDS):
+    '''Read items into a structured array with an 'id' field and one field
+    per requested field.
+
+    Properties named in :py:data:`DATE_FIELDS` are read as `datetime64`,
+    missing values as `NaT`. Other properties are read as floats, missing
+    values as `nan`, unless a dtype is given with a (name, dtype) pair, e.g.
+    `('item_type', 'U')`. The field 'bbox' is the (xmin, ymin, xmax, ymax) of
+    each item's geometry.
+
+    :param items: iter of items
+    :param fields: sequence of property names or (name, dtype) pairs
+    :returns: :py:class:`numpy.ndarray`
+    '''
+    if np is None:
+        raise ImportError('columns require numpy, pip install planet[columns]')
+    fields = [('id', 'U', (), lambda item: item['id'])] + \
+        [_field(f) for f in fields]
+    columns = [_Column(dtype, shape) for _, dtype, shape, _ in fields]
+    items = iter(items)
+    while True:
+        batch = list(itertools.islice(items, BATCH_SIZE))
+        if not batch:
+            break
+        for (_, dtype, _, get), column in zip(fields, columns):
+            values = [get(item) for item in batch]
+            if np.dtype(dtype).kind != 'U':
+                values = np.array(values, dtype)
+            column.extend(values)
+    dtype = [(name, column.values().dtype, shape)
+             for (name, _, shape, _), column in zip(fields, columns)]
+    size = columns[0].size
+    result = np.empty(size, dtype)
+    for (name, _, _, _), column in zip(fields, columns):
+        result[name] = column.values()
+    return result
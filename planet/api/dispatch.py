@@ -12,6 +12,8 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 
+from concurrent.futures import Future
+import json
 import logging
 import os
 import re
@@ -20,14 +22,26 @@ import time
 from requests_futures.sessions import FuturesSession
 from requests import Request
 from requests import Session
+from requests.adapters import HTTPAdapter
 from . utils import check_status
 from . models import Response
+from . exceptions import APIException
 from . exceptions import InvalidAPIKey
 from . exceptions import TooManyRequests
+from . metrics import Hooks
+from . retry import RetryPolicy
+from . transport import RequestsTransport
 from . __version__ import __version__
 from requests.compat import urlparse
 
 
+# (connect, read) timeouts in seconds for each class of request. The read
+# timeout is the longest wait for any data, not for the whole response.
+DEFAULT_TIMEOUTS = {
+    'api': (10, 90),
+    'download': (10, 60),
+}
+
 USE_STRICT_SSL = not (os.getenv('DISABLE_STRICT_SSL', '').lower() == 'true')
 
 log = logging.getLogger(__name__)
@@ -43,33 +57,190 @@ def _is_subdomain_of_tld(url1, url2):
     return orig_host.split('.')[-2:] == re_host.split('.')[-2:]
 
 
-class _Throttler(object):
-    '''A context manager that allows at most ops/sec
-    to avoid request throttling for all client operations.
+try:
+    _now = time.monotonic
+except AttributeError:
+    # python 2
+    _now = time.time
+
+
+class _TokenBucket(object):
+    '''A thread-safe token-bucket rate limiter that allows at most `rate`
+    operations per second on average with bursts of up to `burst` operations.
+
+    Unlike a mutex around the whole operation, the lock here only guards the
+    token accounting. Each caller reserves a token (possibly going into debt)
+    and then sleeps, if needed, outside of the lock so any number of requests
+    may be in flight while the overall request rate stays within budget.
+
+    A `rate` of 0 or None disables limiting.
     '''
 
-    def __init__(self, ops=4):
-        self._cond = threading.Semaphore()
-        self._wait = 1./ops
+    def __init__(self, rate=4, burst=None):
+        self._lock = threading.Lock()
+        self._last = _now()
+        self._tokens = None
+        self.configure(rate, burst)
 
-    def __enter__(self):
-        self._cond.acquire()
-        self._t = time.time()
+    def configure(self, rate, burst=None):
+        '''Change the rate and burst capacity. Tokens accumulated so far
+        are retained up to the new capacity.'''
+        with self._lock:
+            self._configure(rate, burst)
 
-    def __exit__(self, *exc):
-        w = self._wait - (time.time() - self._t)
-        if w > 0:
-            time.sleep(w)
-        self._cond.release()
-        return False
+    def _configure(self, rate, burst):
+        # the lock must be held
+        self.rate = float(rate or 0)
+        self.burst = float(burst or max(1, self.rate))
+        if self._tokens is None:
+            self._tokens = self.burst
+        else:
+            self._tokens = min(self._tokens, self.burst)
+
+    def _reserve(self):
+        with self._lock:
+            if not self.rate:
+                return 0
+            now = _now()
+            self._tokens = min(
+                self.burst, self._tokens + (now - self._last) * self.rate)
+            self._last = now
+            self._tokens -= 1
+            if self._tokens >= 0:
+                return 0
+            # in debt, wait until our token has been refilled
+            return -self._tokens / self.rate
+
+    def acquire(self):
+        '''Take a token, blocking until one is available.
+
+        :returns: the time in seconds spent waiting
+        '''
+        wait = self._reserve()
+        if wait > 0:
+            time.sleep(wait)
+        return wait
 
     def wrap(self, f):
         def w(*a, **kw):
-            with self:
-                return f(*a, **kw)
+            self.acquire()
+            return f(*a, **kw)
         return w
 
 
+# without an explicit maximum, the rate may grow to this multiple of the
+# starting rate while requests succeed
+MAX_RATE_FACTOR = 4
+
+
+class _AIMDBucket(_TokenBucket):
+    '''A _TokenBucket whose rate adapts to feedback from the server using
+    additive-increase/multiplicative-decrease.
+
+    Each successful request raises the rate by `increase` / rate, so the rate
+    grows by about `increase` requests per second every second, up to
+    `max_rate` (by default `MAX_RATE_FACTOR` times the starting rate). A
+    throttled request multiplies the rate by `decrease`, down to `min_rate`.
+    Requests already in flight when the rate is cut are likely to be
+    throttled as well, so further cuts are ignored until the requests made
+    at the old rate have had time to complete.
+    '''
+
+    def __init__(self, rate=4, burst=None, max_rate=None, min_rate=.2,
+                 increase=.5, decrease=.5):
+        self._fixed_burst = burst
+        self.max_rate = float(max_rate or (rate or 0) * MAX_RATE_FACTOR)
+        self.min_rate = min(min_rate, rate or 0)
+        self.increase = increase
+        self.decrease = decrease
+        self.used = False
+        self._cut = None
+        _TokenBucket.__init__(self, rate, burst)
+
+    def _reserve(self):
+        self.used = True
+        return _TokenBucket._reserve(self)
+
+    def success(self):
+        '''A request completed without being throttled.'''
+        with self._lock:
+            if self.rate and self.rate < self.max_rate:
+                rate = min(self.max_rate,
+                           self.rate + self.increase / self.rate)
+                self._configure(rate, self._fixed_burst)
+
+    def throttled(self):
+        '''A request was throttled by the server.'''
+        with self._lock:
+            now = _now()
+            if not self.rate or (self._cut is not None and
+                                 now - self._cut < max(1, 1 / self.rate)):
+                return
+            self._cut = now
+            rate = max(self.min_rate, self.rate * self.decrease)
+            log.debug('throttled, reducing rate from %.2f to %.2f',
+                      self.rate, rate)
+            self._configure(rate, self._fixed_burst)
+
+
+# url path prefixes of the API families that are rate limited separately
+API_FAMILIES = (
+    ('data', '/data/'),
+    ('orders', '/compute/ops/'),
+    ('basemaps', '/basemaps/'),
+    ('analytics', '/analytics/'),
+)
+
+
+class _RateLimiter(object):
+    '''Rate limits requests with a separate :py:class:`_AIMDBucket` for each
+    API family (see `API_FAMILIES`), so being throttled by one API does not
+    slow requests to the others. Requests to other URLs share one bucket.
+    '''
+
+    def __init__(self, rate=4, burst=None, max_rate=None):
+        families = [f for f, _ in API_FAMILIES] + ['other']
+        self._buckets = dict((f, _AIMDBucket(rate, burst, max_rate))
+                             for f in families)
+
+    def bucket(self, request):
+        path = urlparse(request.url).path
+        for family, prefix in API_FAMILIES:
+            if path.startswith(prefix):
+                return self._buckets[family]
+        return self._buckets['other']
+
+    def _reserve(self, request):
+        return self.bucket(request)._reserve()
+
+    def acquire(self, request):
+        '''Take a token for the request's API family, blocking until one is
+        available.
+
+        :returns: the time in seconds spent waiting
+        '''
+        return self.bucket(request).acquire()
+
+    def feedback(self, request, error=None):
+        '''Adjust the rate of the request's API family after a request
+        completes.
+
+        :param error: The exception raised by the request, if any
+        '''
+        if error is None:
+            self.bucket(request).success()
+        elif isinstance(error, TooManyRequests):
+            self.bucket(request).throttled()
+
+    def rates(self):
+        '''Get the current rate of each API family used so far.
+
+        :returns: dict of family to requests per second
+        '''
+        return dict((f, round(b.rate, 2)) for f, b in self._buckets.items()
+                    if b.used)
+
+
 class RedirectSession(Session):
     '''This exists to override the existing behavior of requests that will
     strip Authorization headers from any redirect requests that resolve to a
@@ -93,6 +264,89 @@ class RedirectSession(Session):
                     )
 
 
+def _count_connects(pool):
+    '''Count the connections a pool opens in `pool.connects`, including
+    reconnects of pooled connections that were dropped, which urllib3's
+    `num_connections` does not count.'''
+    pool.connects = 0
+    new_conn = pool._new_conn
+
+    def _new_conn():
+        conn = new_conn()
+        connect = conn.connect
+
+        def counted():
+            pool.connects += 1
+            return connect()
+        conn.connect = counted
+        return conn
+    pool._new_conn = _new_conn
+    return pool
+
+
+class _PoolAdapter(HTTPAdapter):
+    '''An HTTPAdapter with connection pools sized to the dispatcher
+    concurrency that counts connections opened against requests for each
+    host so connection reuse (keep-alive) can be verified.
+    '''
+
+    def __init__(self, maxsize, hosts=10):
+        self._lock = threading.Lock()
+        # counts from pools evicted from the pool manager
+        self._retired = {}
+        HTTPAdapter.__init__(self, pool_connections=hosts,
+                             pool_maxsize=maxsize)
+
+    def init_poolmanager(self, *args, **kwargs):
+        HTTPAdapter.init_poolmanager(self, *args, **kwargs)
+        new_pool = self.poolmanager._new_pool
+        self.poolmanager._new_pool = \
+            lambda *a, **kw: _count_connects(new_pool(*a, **kw))
+        pools = self.poolmanager.pools
+        dispose = pools.dispose_func
+
+        def retire(pool):
+            with self._lock:
+                self._count(self._retired, pool)
+            if dispose:
+                dispose(pool)
+        pools.dispose_func = retire
+
+    def resize(self, maxsize):
+        '''Change the number of connections kept per host, closing those
+        already pooled.'''
+        if maxsize != self._pool_maxsize:
+            self.poolmanager.clear()
+            self.init_poolmanager(self._pool_connections, maxsize,
+                                  block=self._pool_block)
+
+    def _count(self, stats, pool):
+        host = '%s://%s' % (pool.scheme, pool.host)
+        if pool.port and pool.port != pool.ConnectionCls.default_port:
+            host += ':%s' % pool.port
+        counts = stats.setdefault(host, {
+            'requests': 0,
+            'connections': 0,
+            'reused': 0,
+        })
+        counts['requests'] += pool.num_requests
+        counts['connections'] += getattr(pool, 'connects',
+                                         pool.num_connections)
+        counts['reused'] = max(0, counts['requests'] - counts['connections'])
+
+    def pool_stats(self):
+        with self._lock:
+            stats = dict((h, dict(c)) for h, c in self._retired.items())
+        pools = self.poolmanager.pools
+        for key in pools.keys():
+            pool = pools.get(key)
+            if pool is not None:
+                self._count(stats, pool)
+        for counts in stats.values():
+            counts['maxsize'] = self._pool_maxsize
+        return stats
+
+
 def _get_user_agent():
     return 'planet-client-python/%s' % __version__
 
@@ -110,35 +364,82 @@ def _headers(request):
     return headers
 
 
-def _do_request(sess, req, **kwargs):
-    for i in range(5):
+class _SingleFlight(object):
+    '''Coalesces identical concurrent calls. While a call for a key is in
+    progress, other callers with the same key wait for it and share its
+    result (or exception) instead of making their own call.'''
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._calls = {}
+        self._stats = {'calls': 0, 'coalesced': 0}
+
+    def do(self, key, func):
+        with self._lock:
+            call = self._calls.get(key)
+            leader = call is None
+            if leader:
+                call = self._calls[key] = Future()
+                self._stats['calls'] += 1
+            else:
+                self._stats['coalesced'] += 1
+        if not leader:
+            return call.result()
         try:
-            _log_request(req)
-            t = time.time()
-            resp = sess.request(
-                req.method, req.url, data=req.data, headers=_headers(req),
-                params=req.params, verify=USE_STRICT_SSL, **kwargs
-            )
-            # futures session returns futures so only check actual responses
-            # for futures these will be checked in the wrapper model
-            if hasattr(resp, 'status_code'):
-                check_status(resp)
-                # only log non-async calls
-                log.debug('request took %.03f', time.time() - t)
-            return resp
-        except TooManyRequests:
-            time.sleep(1)
-    raise Exception('too many throttles, giving up')
+            result = func()
+        except Exception as ex:
+            call.set_exception(ex)
+            raise
+        else:
+            call.set_result(result)
+            return result
+        finally:
+            with self._lock:
+                del self._calls[key]
+
+    def stats(self):
+        with self._lock:
+            return dict(self._stats)
+
+
+def _flight_key(request):
+    auth = request.auth.value if request.auth else ''
+    params = sorted((request.params or {}).items())
+    return json.dumps([auth, request.url, params], default=str)
 
 
 class RequestsDispatcher(object):
 
-    def __init__(self, workers=4):
+    def __init__(self, workers=4, rate_limit=4, burst=None, retry=None,
+                 base_url=None, cache=None, max_rate=None, timeouts=None,
+                 transport=None):
         # general session for sync api calls
         self.session = RedirectSession()
         self.session.headers.update({'User-Agent': _get_user_agent()})
-        # ensure all calls to the session are throttled
-        self.session.request = _Throttler().wrap(self.session.request)
+        self._workers = workers
+        # the default pool of 10 connections per host drops connections when
+        # workers exceeds it. API calls can be made from every worker and the
+        # calling thread while redirects (downloads) only come from workers.
+        self._adapters = {
+            'api': _PoolAdapter(workers + 1),
+            'redirect': _PoolAdapter(workers),
+        }
+        for prefix in ('https://', 'http://'):
+            self.session.mount(prefix, self._adapters['redirect'])
+        if base_url:
+            self.session.mount(base_url, self._adapters['api'])
+        # all requests are rate limited, adapting to throttling per API
+        self.limiter = _RateLimiter(rate_limit, burst, max_rate)
+        self.retry = retry or RetryPolicy()
+        self.cache = cache
+        self.hooks = Hooks()
+        # identical concurrent GETs share one request
+        self._flights = _SingleFlight()
+        self.timeouts = dict(DEFAULT_TIMEOUTS, **(timeouts or {}))
+        # API requests go through the transport, downloads the session
+        self.transport = transport or RequestsTransport(self.session,
+                                                        USE_STRICT_SSL)
+        self._header_cache = {}
         # the asyncpool is reserved for long-running async tasks
         self._asyncpool = FuturesSession(
             max_workers=workers,
@@ -147,12 +448,119 @@ class RequestsDispatcher(object):
     def response(self, request):
         return Response(request, self)
 
+    def add_listener(self, listener):
+        '''Add a :py:class:`planet.api.metrics.Listener` to be notified
+        of request activity.'''
+        self.hooks.add(listener)
+
+    def remove_listener(self, listener):
+        self.hooks.remove(listener)
+
+    def set_download_segments(self, segments):
+        '''Size the redirect (download) connection pools for workers that
+        each write a download with `segments` concurrent range requests,
+        see :py:meth:`planet.api.models.Body.write`.'''
+        self._adapters['redirect'].resize(self._workers * segments)
+
+    def pool_stats(self):
+        '''Get connection pool statistics, separately for the API host and
+        any redirect targets (e.g. download storage hosts). For each host:
+
+        - requests: `int` number of requests made
+        - connections: `int` number of connections opened, including
+          reconnects of pooled connections that were dropped
+        - reused: `int` number of requests using an existing connection
+        - maxsize: `int` the maximum number of pooled connections
+        '''
+        return dict((k, a.pool_stats()) for k, a in self._adapters.items())
+
+    def _headers(self, req):
+        # the headers only depend on the key and whether there is a body
+        key = (req.auth and req.auth.value, bool(req.data))
+        headers = self._header_cache.get(key)
+        if headers is None:
+            headers = self._header_cache[key] = _headers(req)
+        return headers.copy()
+
+    def _send(self, req, headers, stream, timeout):
+        if stream:
+            return self.session.request(
+                req.method, req.url, data=req.data, headers=headers,
+                params=req.params, verify=USE_STRICT_SSL, stream=True,
+                timeout=timeout)
+        return self.transport.request(req.method, req.url, req.params,
+                                      req.data, headers, timeout)
+
+    def _do_request(self, req, headers=None, stream=False):
+        timeout = self.timeouts['download' if stream else 'api']
+        attempt, wait = 0, 0
+        while True:
+            attempt += 1
+            throttled = self.limiter.acquire(req)
+            if throttled:
+                self.hooks.throttle_wait(req, throttled)
+            _log_request(req)
+            self.hooks.request_start(req)
+            t = time.time()
+            resp = None
+            try:
+                request_headers = self._headers(req)
+                request_headers.update(headers or {})
+                resp = self._send(req, request_headers, stream, timeout)
+                elapsed = time.time() - t
+                self.hooks.request_end(req, resp, elapsed)
+                # not modified is only possible for conditional requests
+                if resp.status_code != 304:
+                    check_status(resp)
+                self.limiter.feedback(req)
+                self.retry.record(req, attempt, elapsed)
+                return resp
+            except (APIException,) + self.retry.connection_errors as ex:
+                elapsed = time.time() - t
+                self.limiter.feedback(req, ex)
+                if resp is None:
+                    self.hooks.request_end(req, None, elapsed, ex)
+                wait, reason = self.retry.get_wait(req, attempt, wait, resp,
+                                                   ex)
+                self.retry.record(req, attempt, elapsed, wait, reason,
+                                  failed=wait is None)
+                if wait is None:
+                    raise
+                self.hooks.request_retry(req, attempt, wait, reason)
+                if resp is not None:
+                    resp.close()
+                time.sleep(wait)
+
+    def _stream(self, request, headers=None):
+        return self._do_request(request, headers=headers, stream=True)
+
     def _dispatch_async(self, request, callback):
-        return _do_request(self._asyncpool, request, stream=True,
-                           background_callback=callback)
+        def run():
+            resp = self._stream(request)
+            callback(self.session, resp)
+            return resp
+        return self._asyncpool.executor.submit(run)
+
+    def coalesce_stats(self):
+        '''Get statistics of GET request coalescing:
+
+        - calls: `int` number of GET requests made
+        - coalesced: `int` number of GET requests that instead shared the
+          response of an identical request already in progress
+        '''
+        return self._flights.stats()
+
+    def _fetch(self, request):
+        if self.cache is None:
+            return self._do_request(request)
+        return self.cache.fetch(request, lambda headers: self._do_request(
+            request, headers=headers))
 
     def _dispatch(self, request, callback=None):
-        return _do_request(self.session, request)
+        if request.method.upper() != 'GET':
+            return self._fetch(request)
+        return self._flights.do(_flight_key(request),
+                                lambda: self._fetch(request))
 
     # @todo delete me w/ v0 removal
     def dispatch_request(self, method, url, auth=None, params=None, data=None):
@@ -165,4 +573,5 @@ class RequestsDispatcher(object):
             })
         req = Request(method, url, params=params, data=data, headers=headers)
         _log_request(req)
-        return self.session.send(req.prepare(), verify=USE_STRICT_SSL)
+        return self.session.send(req.prepare(), verify=USE_STRICT_SSL,
+                                 timeout=self.timeouts['api'])
@@ -11,12 +11,20 @@
 # WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
 # See the License for the specific language governing permissions and
 # limitations under the License.
+import heapq
+import itertools
+import json
 import logging
 import os
 import threading
 import time
+from ._fatomic import atomic_open
+from .checksums import Checksums
+from .checksums import order_digests
+from . import journal
 from .utils import write_to_file
-from planet.api.exceptions import (RequestCancelled, NoPermission)
+from planet.api.exceptions import (RequestCancelled, NoPermission,
+                                   ChecksumMismatch)
 try:
     import Queue as queue
 except ImportError:
@@ -37,6 +45,66 @@ _logger = logging.getLogger(__name__)
 _debug = _logger.debug
 _info = _logger.info
 
+#: A file for persisting activation time estimates between runs
+ESTIMATES_FILE = os.path.join(os.path.expanduser('~'),
+                              '.planet-activation.json')
+
+
+def _item_type(item):
+    return item.get('properties', {}).get('item_type', '')
+
+
+class ActivationEstimates(object):
+    '''Running estimates of the seconds taken to activate assets, by item
+    type and asset type. Each estimate is an exponentially weighted moving
+    average of observed activations.
+
+    :param str path: optional JSON file the estimates are read from and
+                     saved to, otherwise they are only kept in memory
+    :param float weight: The weight of each new observation
+    '''
+
+    def __init__(self, path=None, weight=.3):
+        self.path = path
+        self.weight = weight
+        self._lock = threading.Lock()
+        self._estimates = {}
+        if path:
+            try:
+                with open(path) as fp:
+                    self._estimates = json.load(fp)
+            except (IOError, OSError, ValueError):
+                pass
+
+    def _key(self, item_type, asset_type):
+        return '%s/%s' % (item_type, asset_type)
+
+    def get(self, item_type, asset_type):
+        '''Get the estimated seconds to activate an asset or None.'''
+        with self._lock:
+            return self._estimates.get(self._key(item_type, asset_type))
+
+    def observe(self, item_type, asset_type, seconds):
+        '''Update the estimate with an observed activation time.'''
+        key = self._key(item_type, asset_type)
+        with self._lock:
+            old = self._estimates.get(key)
+            if old is not None:
+                seconds = old + self.weight * (seconds - old)
+            self._estimates[key] = seconds
+
+    def save(self):
+        '''Save the estimates if there is a file.'''
+        if not self.path:
+            return
+        with self._lock:
+            contents = json.dumps(self._estimates, indent=1, sort_keys=True)
+        try:
+            with atomic_open(self.path, 'w') as fp:
+                fp.write(contents)
+        except (IOError, OSError) as ex:
+            _info('could not save activation estimates: %s', ex)
+
 
 class _Stage(object):
     '''A _Stage performs some sequence in an activate/poll/download cycle.
@@ -68,6 +136,9 @@ class _Stage(object):
     re-queueing tasks without being deadlock prone (e.g. pull vs. push) and
     simplifies cancellation of the entire pipeline.
     '''
+    # an optional journal.Journal recording the state of each item's assets
+    _journal = None
+
     def __init__(self, source, size=0, max_dps=0):
         self._source = source
         self._running = True
@@ -79,6 +150,11 @@ class _Stage(object):
         self._results = queue.Queue()
         self._min_sleep = 1. / max_dps if max_dps else 0
         self._cond = threading.Condition()
+        # set when the source has new results, see _sleep
+        self._woken = False
+        self._downstream = None
+        if isinstance(source, _Stage):
+            source._downstream = self
 
     def work(self):
         return len(self._tasks) + (1 if self._doing else 0)
@@ -86,13 +162,27 @@ class _Stage(object):
     def start(self):
         threading.Thread(target=self._run).start()
 
-    def next(self):
+    def next(self, block=True):
         try:
-            return self._results.get()
+            return self._results.get(block)
         except queue.Empty:
             if not self._alive():
                 return False
 
+    def _put(self, result):
+        '''Make a result available and wake the stage reading them.'''
+        self._results.put(result)
+        if self._downstream is not None:
+            self._downstream._wake()
+
+    def _wake(self):
+        self._cond.acquire()
+        try:
+            self._woken = True
+            self._cond.notify_all()
+        finally:
+            self._cond.release()
+
     def _i(self, msg, *args):
         _info(type(self).__name__ + ' : ' + msg, *args)
 
@@ -102,6 +192,10 @@ class _Stage(object):
     def _cancel(self, result):
         pass
 
+    def _record(self, item, asset_type, state, **kw):
+        if self._journal is not None:
+            self._journal.set_state(item['id'], asset_type, state, **kw)
+
     def cancel(self):
         # this makes us not alive
         self._cancelled = True
@@ -111,7 +205,7 @@ class _Stage(object):
         # drain any results and cancel them
         while not self._results.empty():
             self._results.get()
-        self._results.put(False)
+        self._put(False)
         # notify any sleepers
         try:
             self._cond.acquire()
@@ -138,7 +232,10 @@ class _Stage(object):
             try:
                 # @todo minor refactor
                 # bleh, next wants an iterator, not just a __next__
-                if hasattr(self._source, 'next'):
+                if isinstance(self._source, _Stage):
+                    # pending tasks are not held up waiting for more
+                    n = self._source.next(block=not self._tasks)
+                elif hasattr(self._source, 'next'):
                     n = self._source.next()
                 else:
                     n = next(self._source)
@@ -148,13 +245,25 @@ class _Stage(object):
             self._running = n is not False
             if n:
                 n = self._task(n)
-                n and self._tasks.insert(0, n)
+                n and self._add_task(n)
             else:
                 break
 
+    def _add_task(self, task):
+        self._tasks.insert(0, task)
+
+    def _next_task(self):
+        '''Remove and return the next task to do, None if none is ready.'''
+        return self._tasks.pop(0) if self._tasks else None
+
+    def _wait_time(self, elapsed):
+        '''The seconds to wait after a 'do' that took `elapsed` seconds.'''
+        return self._min_sleep - elapsed
+
     def _process_task(self):
-        if self._tasks:
-            self._doing = self._tasks.pop(0)
+        task = self._next_task()
+        if task is not None:
+            self._doing = task
             try:
                 self._do(self._doing)
             except Exception:
@@ -164,23 +273,42 @@ class _Stage(object):
                 return
             self._doing = None
 
+    def _sleep(self, wait, wakeable):
+        '''Sleep for `wait` seconds unless cancelled or, if `wakeable`, the
+        source has new results.'''
+        deadline = time.time() + wait
+        # waiting on the condition allows interrupting sleep
+        self._cond.acquire()
+        try:
+            while not self._cancelled and not (wakeable and self._woken):
+                remaining = deadline - time.time()
+                if remaining <= 0:
+                    break
+                self._cond.wait(remaining)
+        finally:
+            self._cond.release()
+
     def _run(self):
         while self._alive():
+            # results put from now on wake the stage
+            self._woken = False
             self._get_tasks()
             t = time.time()
             self._process_task()
             # note - this is conservative compared to timer invocation.
             # allow _at most_ 1 'do' per min_sleep
-            wait = self._min_sleep - (time.time() - t)
+            elapsed = time.time() - t
+            wait = self._wait_time(elapsed)
             if wait > 0 and not self._cancelled:
                 self._d('sleep for %.2f', wait)
-                # waiting on the condition allows interrupting sleep
-                self._cond.acquire()
-                self._cond.wait(wait)
-                self._cond.release()
+                throttle = min(wait, self._min_sleep - elapsed)
+                if throttle > 0:
+                    self._sleep(throttle, False)
+                # waiting for a task to be due ends early with new results
+                self._sleep(wait - max(throttle, 0), True)
 
         # sentinel value to indicate we're done
-        self._results.put(False)
+        self._put(False)
 
 
 class _AStage(_Stage):
@@ -189,6 +317,28 @@ class _AStage(_Stage):
         self._client = client
         self._asset_types = asset_types
 
+    def _activate(self, assets):
+        '''Request activation of the assets concurrently. The client's rate
+        limiter keeps the requests within the rate budget.'''
+        errors = []
+
+        def activate(asset):
+            try:
+                self._client.activate(asset)
+            except Exception as ex:
+                errors.append(ex)
+
+        threads = [threading.Thread(target=activate, args=(a,))
+                   for a in assets[1:]]
+        for thread in threads:
+            thread.daemon = True
+            thread.start()
+        activate(assets[0])
+        for thread in threads:
+            thread.join()
+        if errors:
+            raise errors[0]
+
     def _do(self, item):
         assets = self._client.get_assets(item).get()
         if not any([t in assets for t in self._asset_types]):
@@ -196,53 +346,154 @@ class _AStage(_Stage):
             return
         inactive = _by_status(assets, self._asset_types, 'inactive')
         if inactive:
-            # still need activation, try the first inactive
-            self._client.activate(inactive[0])
-            self._tasks.append(item)
-            return
+            # activate all at once and poll for them together
+            self._activate(inactive)
+            assets = dict(assets)
+            for t in self._asset_types:
+                if t in assets and assets[t]['status'] == 'inactive':
+                    assets[t] = dict(assets[t], status='activating')
 
         if _all_status(assets, self._asset_types, ['activating', 'active']):
-            self._results.put((item, assets))
+            for t in self._asset_types:
+                if t in assets:
+                    self._record(item, t, journal.ACTIVE
+                                 if assets[t]['status'] == 'active'
+                                 else journal.ACTIVATING)
+            self._put((item, assets))
         else:
             # hmmm
             status = [assets[t]['status'] for t in self._asset_types]
             raise Exception('unexpected state %s' % status)
 
 
-class _PStage(_Stage):
-    _min_poll_interval = 5
+class _PollSchedule(object):
+    '''Schedules the status polls of activating assets, shared by the
+    threaded and asyncio downloaders.
 
-    def __init__(self, source, client, asset_types):
+    The first poll of an item is scheduled from the estimated activation
+    time of its assets and later polls back off exponentially from
+    `_min_poll_interval` to `_max_poll_interval`. Users provide
+    `_asset_types`, `_estimates` and the `_polls` and `_activations`
+    counters.'''
+    _min_poll_interval = 5
+    _max_poll_interval = 120
+    # the first poll is at this fraction of the estimated activation time
+    _first_poll = .9
+
+    def _active(self, assets):
+        return _all_status(assets, self._asset_types, ['active'])
+
+    def _first_delay(self, item, assets):
+        estimates = [self._estimates.get(_item_type(item), t)
+                     for t in self._asset_types
+                     if t in assets and assets[t]['status'] != 'active']
+        estimate = max([e for e in estimates if e is not None] or [0])
+        return max(self._min_poll_interval, self._first_poll * estimate)
+
+    def _poll_delay(self, polls):
+        return min(self._max_poll_interval,
+                   self._min_poll_interval * 2 ** (polls - 1))
+
+    def _observe(self, item, before, after, start, last, now):
+        # an asset became active some time between the last poll and now
+        for t in self._asset_types:
+            if t not in after or after[t]['status'] != 'active' or \
+                    before[t]['status'] == 'active':
+                continue
+            seconds = (last + now) / 2. - start
+            if last == start:
+                # active by the first poll, so the activation is censored:
+                # it took at most now - start, which only corrects a longer
+                # estimate
+                estimate = self._estimates.get(_item_type(item), t)
+                if estimate is None or estimate <= now - start:
+                    continue
+                seconds = now - start
+            self._estimates.observe(_item_type(item), t, seconds)
+
+    def polls_per_activation(self):
+        '''The mean number of polls of the items that were activated.'''
+        if not self._activations:
+            return 0.
+        return self._polls / float(self._activations)
+
+
+class _PStage(_PollSchedule, _Stage):
+    '''Polls activating assets. Tasks are kept in a heap by the time their
+    next poll is due so the stage sleeps until then, and each poll is
+    O(log n) in the number of activating items.'''
+
+    def __init__(self, source, client, asset_types, estimates=None):
         _Stage.__init__(self, source, 100, max_dps=2)
         self._client = client
         self._asset_types = asset_types
+        self._estimates = estimates or ActivationEstimates()
+        # breaks ties between tasks due at the same time, oldest first
+        self._seq = itertools.count()
+        self._polls = 0
+        self._activations = 0
 
     def _task(self, t):
         item, assets = t
         now = time.time()
-        return item, assets, now, now
+        # the item, its assets, when polling started, the number of polls
+        # and when the last poll was
+        return item, assets, now, 0, now
+
+    def _schedule(self, task, due):
+        heapq.heappush(self._tasks, (due, next(self._seq), task))
+
+    def _add_task(self, task):
+        item, assets, start, _, _ = task
+        due = start
+        if not self._active(assets):
+            due += self._first_delay(item, assets)
+        self._schedule(task, due)
+
+    def _next_task(self):
+        tasks = self._tasks
+        if tasks and tasks[0][0] <= time.time():
+            return heapq.heappop(tasks)[2]
+        return None
+
+    def _wait_time(self, elapsed):
+        wait = _Stage._wait_time(self, elapsed)
+        tasks = self._tasks
+        if tasks:
+            wait = max(wait, tasks[0][0] - time.time())
+        return wait
 
     def _do(self, task):
-        item, assets, start, last = task
-        now = time.time()
-        # don't poll until min interval elapsed
-        if now - last > self._min_poll_interval:
-            assets = self._client.get_assets(item).get()
-            last = now
-        if _all_status(assets, self._asset_types, ['active']):
+        item, assets, start, polls, last = task
+        if not self._active(assets):
+            now = time.time()
+            polled = self._client.get_assets(item).get()
+            self._polls += 1
+            polls += 1
+            self._observe(item, assets, polled, start, last, now)
+            assets, last = polled, now
+            if self._active(assets):
+                self._activations += 1
+        if self._active(assets):
             _debug('activation took %d', time.time() - start)
-            self._results.put((item, assets))
+            for t in self._asset_types:
+                if t in assets:
+                    self._record(item, t, journal.ACTIVE)
+            self._put((item, assets))
         else:
-            self._tasks.append((item, assets, start, last))
+            self._schedule((item, assets, start, polls, last),
+                           time.time() + self._poll_delay(polls))
 
 
 class _DStage(_Stage):
-    def __init__(self, source, client, asset_types, dest):
+    def __init__(self, source, client, asset_types, dest, segments=1):
         # @todo max pool should reflect client workers
         _Stage.__init__(self, source, 4, max_dps=2)
         self._client = client
         self._asset_types = asset_types
         self._dest = dest
+        self._segments = segments
+        self._checksums = Checksums(dest)
         self._write_lock = threading.Lock()
         self._written = 0
         self._downloads = 0
@@ -250,6 +501,9 @@ class _DStage(_Stage):
     def _task(self, t):
         item, assets = t
         for at in self._asset_types:
+            if self._journal is not None and \
+                    self._journal.state(item['id'], at) == journal.DONE:
+                continue
             self._tasks.append((item, assets[at]))
 
     def cancel(self):
@@ -278,11 +532,18 @@ class _DStage(_Stage):
 
     def _do(self, task):
         item, asset = task
+        digests = None
+        if asset.get('md5_digest'):
+            digests = {'md5': asset['md5_digest']}
+        # a journaled job keeps partial files to resume
         writer = write_to_file(
-            self._dest, self._write_tracker(item, asset), overwrite=False)
+            self._dest, self._write_tracker(item, asset), overwrite=False,
+            segments=self._segments, resume=self._journal is not None,
+            digests=digests, checksums=self._checksums)
+        self._record(item, asset['type'], journal.DOWNLOADING)
         self._downloads += 1
-        self._results.put((item, asset,
-                           self._client.download(asset, writer)))
+        self._put((item, asset,
+                   self._client.download(asset, writer)))
 
 
 class Downloader(object):
@@ -309,6 +570,12 @@ class Downloader(object):
         - downloaded: `string` representation of MB transferred
         - complete: `int` number of completed downloads
         - pending: `int` number of items awaiting download
+        - rate: `dict` current requests per second of each API family
+          in use, adjusted as requests are throttled
+        - coalesced: `int` number of requests that shared the response of
+          an identical request already in progress
+        - polls_per_activation: `float` mean number of status polls of the
+          items that needed activating
         '''
         raise NotImplementedError()
 
@@ -344,8 +611,15 @@ class Downloader(object):
 
 
 class _Downloader(Downloader):
-    def __init__(self, client, **opts):
+    def __init__(self, client, segments=1, estimates=None, journal=None,
+                 **opts):
         self._client = client
+        self._segments = segments
+        if segments > 1:
+            # each concurrent download holds a connection per segment
+            client.dispatcher.set_download_segments(segments)
+        self._estimates = estimates or ActivationEstimates()
+        self._journal = journal
         self._opts = opts
         self._stages = []
         self._completed = 0
@@ -360,20 +634,28 @@ class _Downloader(Downloader):
     def _init(self, items, asset_types, dest):
         client = self._client
         astage = _AStage(items, client, asset_types)
-        pstage = _PStage(astage, client, asset_types)
+        pstage = _PStage(astage, client, asset_types, self._estimates)
         self._stages = [
             astage,
             pstage
         ]
         if dest:
-            dstage = _DStage(pstage, client, asset_types, dest)
+            dstage = _DStage(pstage, client, asset_types, dest,
+                             self._segments)
             self._stages.append(dstage)
             self._dest = dest
 
+        for stage in self._stages:
+            stage._journal = self._journal
+
         # sneaky little hack to allow tests to inject options
         self._apply_opts(vars())
         self._completed = 0
 
+    def _record(self, item, asset, state, **kw):
+        if self._journal is not None and asset:
+            self._journal.set_state(item['id'], asset['type'], state, **kw)
+
     def _run(self, items, asset_types, dest=None):
         if self._stages:
             raise Exception('already running')
@@ -402,14 +684,26 @@ class _Downloader(Downloader):
                         body = self._waiting.wait()
                         self._waiting = None
                         dl = os.path.join(self._dest, body.name)
-                        self.on_complete(item, asset, dl)
+                        self._record(item, asset, journal.DONE, path=dl)
+                        # order results are neither items nor assets
+                        if asset is not None:
+                            self.on_complete(item, asset, dl)
                     except RequestCancelled:
                         pass
+                    except ChecksumMismatch as ex:
+                        self._waiting = None
+                        self._record(item, asset, journal.FAILED,
+                                     error=str(ex))
+                        _logger.error('download failed: %s', ex)
                 self._completed += 1
             except StopIteration:
                 break
+        if dest:
+            # the last stage downloads
+            last._checksums.flush()
         stats = self.stats()
         self._stages = []
+        self._estimates.save()
         return stats
 
     def _apply_opts(self, to):
@@ -432,6 +726,7 @@ class _Downloader(Downloader):
             'activating': 0,
             'pending': 0,
             'complete': 0,
+            'polls_per_activation': 0.,
         }
         if len(self._stages) == 3:
             stats['downloading'] = 0
@@ -447,15 +742,25 @@ class _Downloader(Downloader):
             stats['downloaded'] = mb_written
         stats['paging'] = astage._running
         stats['activating'] = astage.work() + pstage.work()
+        stats['polls_per_activation'] = round(
+            pstage.polls_per_activation(), 2)
         stats['pending'] = (dstage.work() if dstage else 0)
         stats['complete'] = self._completed
+        self._add_dispatch_stats(stats)
         return stats
 
+    def _add_dispatch_stats(self, stats):
+        dispatcher = getattr(self._client, 'dispatcher', None)
+        if dispatcher is not None:
+            stats['rate'] = dispatcher.limiter.rates()
+            stats['coalesced'] = dispatcher.coalesce_stats()['coalesced']
+
     def shutdown(self):
         for s in self._stages:
             s.cancel()
         self._waiting and self._waiting.cancel()
         self._stages = []
+        self._estimates.save()
         self._client.shutdown()
 
 
@@ -465,10 +770,12 @@ class _MosaicDownloadStage(_DStage):
 
     def _do(self, task):
         func = self._write_tracker(task, None)
-        writer = write_to_file(self._dest, func, overwrite=False)
+        writer = write_to_file(self._dest, func, overwrite=False,
+                               segments=self._segments,
+                               checksums=self._checksums)
         try:
-            self._results.put((task, {'type': 'quad'},
-                               self._client.download_quad(task, writer)))
+            self._put((task, {'type': 'quad'},
+                       self._client.download_quad(task, writer)))
             self._downloads += 1
         except NoPermission:
             _info('No download permisson for %s, skipping', task['id'])
@@ -480,7 +787,8 @@ class _MosaicDownloader(_Downloader):
 
     def _init(self, items, asset_types, dest):
         client = self._client
-        dstage = _MosaicDownloadStage(items, client, asset_types, dest)
+        dstage = _MosaicDownloadStage(items, client, asset_types, dest,
+                                      self._segments)
         self._dest = dest
         self._stages.append(dstage)
         self._apply_opts(vars())
@@ -504,19 +812,56 @@ class _MosaicDownloader(_Downloader):
         stats['downloaded'] = mb_written
         stats['pending'] = dstage.work()
         stats['complete'] = self._completed
+        self._add_dispatch_stats(stats)
         return stats
 
 
+def _is_manifest(result):
+    return isinstance(result, dict) and \
+        os.path.basename(result.get('name', '')) == 'manifest.json'
+
+
 class _OrderDownloadStage(_DStage):
+    # manifest results, read before the other results so those are verified
+    # as they are written
+    _manifests = ()
+
     def _task(self, t):
-        return t
+        # order results or their locations
+        return t['location'] if isinstance(t, dict) else t
 
     def _do(self, task):
         func = self._write_tracker(task, None)
-        writer = write_to_file(self._dest, func, overwrite=False)
+        writer = write_to_file(self._dest, func, overwrite=False,
+                               segments=self._segments,
+                               checksums=self._checksums)
         self._downloads += 1
-        self._results.put((task,
-                           self._client.download_location(task, writer)))
+        # shaped like an asset download, with no asset
+        self._put((task, None,
+                   self._client.download_location(task, writer)))
+
+    def _run(self):
+        for result in self._manifests:
+            if self._cancelled:
+                break
+            try:
+                self.read_manifest(result)
+            except Exception:
+                # the other results are still downloaded, unverified
+                logging.exception('could not read %s', result['name'])
+        _DStage._run(self)
+
+    def read_manifest(self, result):
+        '''Download an order's manifest and expect its digests of the other
+        results.'''
+        default_name = os.path.basename(result['name'])
+
+        def writer(body):
+            path = os.path.join(self._dest, body.name or default_name)
+            body.write(path)
+            with open(path) as fp:
+                self._checksums.expect(order_digests(json.load(fp)))
+        self._client.download_location(result['location'], writer).wait()
 
 
 class _OrderDownloader(_Downloader):
@@ -525,7 +870,13 @@ class _OrderDownloader(_Downloader):
 
     def _init(self, items, asset_types, dest):
         client = self._client
-        dstage = _OrderDownloadStage(items, client, asset_types, dest)
+        items = list(items)
+        manifests = [r for r in items if _is_manifest(r)]
+        items = [r for r in items if not _is_manifest(r)]
+        dstage = _OrderDownloadStage(iter(items), client, asset_types, dest,
+                                     self._segments)
+        # the stage reads the manifests in its thread
+        dstage._manifests = manifests
         self._dest = dest
         self._stages.append(dstage)
         self._apply_opts(vars())
@@ -549,6 +900,7 @@ class _OrderDownloader(_Downloader):
         stats['downloaded'] = mb_written
         stats['pending'] = dstage.work()
         stats['complete'] = self._completed
+        self._add_dispatch_stats(stats)
         return stats
 
 
@@ -556,6 +908,16 @@ def create(client, mosaic=False, order=False, **kw):
     '''Create a Downloader with the provided client.
 
     :param mosaic bool: If True, the Downloader will fetch mosaic quads.
+    :param order bool: If True, the Downloader will fetch order results.
+    :param segments int: The number of concurrent range requests used to
+                         download each large file. Defaults to 1.
+    :param estimates: optional :py:class:`ActivationEstimates` scheduling
+                      activation polls, e.g. persisted in
+                      :py:data:`ESTIMATES_FILE`. Defaults to estimates kept in
+                      memory.
+    :param journal: optional :py:class:`planet.api.journal.Journal`
+                    recording the state of each item's assets so the job
+                    can be resumed. Partial downloads are kept to resume.
     :returns: :py:Class:`planet.api.downloader.Downloader`
     '''
     if mosaic:
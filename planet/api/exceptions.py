@@ -61,3 +61,24 @@ class InvalidIdentity(APIException):
 class RequestCancelled(Exception):
     '''Internal exception when a request is cancelled'''
     pass
+
+
+class StalledTransfer(Exception):
+    '''A download was slower than the minimum throughput for too long'''
+
+    def __init__(self, throughput):
+        Exception.__init__(self, 'transfer stalled at %.0f bytes/s' %
+                           throughput)
+        self.throughput = throughput
+
+
+class ChecksumMismatch(Exception):
+    '''A download did not have the expected size or digest'''
+
+    def __init__(self, name, kind, expected, actual):
+        Exception.__init__(self, '%s %s is %s, expected %s' %
+                           (name, kind, actual, expected))
+        self.name = name
+        self.kind = kind
+        self.expected = expected
+        self.actual = actual
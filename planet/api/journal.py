@@ -0,0 +1,249 @@
+# Copyright 2021 Planet Labs, Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+'''A crash-safe journal of a download job.
+
+The journal is a SQLite database, in WAL mode, recording the job's options,
+each item of the search with the state of each of its requested assets and
+the URL of the next page of the search. A job that was stopped or killed can
+be resumed from its journal without paging the search again or repeating the
+requests for assets already downloaded::
+
+    journal = Journal('job.db')
+    journal.begin(['analytic', 'udm2'], dest)
+    items = journal.record(client.quick_search(request))
+    downloader.create(client, journal=journal).download(
+        items, ['analytic', 'udm2'], dest)
+
+and later::
+
+    journal = Journal('job.db')
+    job = journal.job()
+    downloader.create(client, journal=journal).download(
+        journal.resume(client), job['asset_types'], job['dest'])
+'''
+import json
+import sqlite3
+import threading
+import time
+
+from . import models
+
+#: The states of a journaled asset
+QUEUED = 'queued'
+ACTIVATING = 'activating'
+ACTIVE = 'active'
+DOWNLOADING = 'downloading'
+DONE = 'done'
+FAILED = 'failed'
+STATES = (QUEUED, ACTIVATING, ACTIVE, DOWNLOADING, DONE, FAILED)
+
+_SCHEMA = '''
+CREATE TABLE IF NOT EXISTS job (
+    key TEXT PRIMARY KEY,
+    value TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS items (
+    seq INTEGER PRIMARY KEY AUTOINCREMENT,
+    id TEXT NOT NULL UNIQUE,
+    item TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS assets (
+    item_id TEXT NOT NULL,
+    asset_type TEXT NOT NULL,
+    state TEXT NOT NULL,
+    path TEXT,
+    error TEXT,
+    updated REAL NOT NULL,
+    PRIMARY KEY (item_id, asset_type)
+);
+'''
+
+
+class Journal(object):
+    '''The journal of a download job, safe for use from several threads.
+
+    :param str path: The SQLite database file, created if needed
+    '''
+    # pending items are read from the database this many at a time
+    _batch_size = 1000
+
+    def __init__(self, path):
+        self.path = path
+        self._lock = threading.Lock()
+        # autocommit, transactions are explicit
+        self._db = sqlite3.connect(path, check_same_thread=False,
+                                   isolation_level=None)
+        self._db.execute('PRAGMA journal_mode=WAL')
+        # WAL is durable across process crashes with NORMAL
+        self._db.execute('PRAGMA synchronous=NORMAL')
+        self._db.executescript(_SCHEMA)
+
+    def close(self):
+        with self._lock:
+            self._db.close()
+
+    def _get(self, key, default=None):
+        row = self._db.execute('SELECT value FROM job WHERE key = ?',
+                               (key,)).fetchone()
+        return default if row is None else json.loads(row[0])
+
+    def _set(self, key, value):
+        self._db.execute('INSERT OR REPLACE INTO job VALUES (?, ?)',
+                         (key, json.dumps(value)))
+
+    def begin(self, asset_types, dest=None, limit=None):
+        '''Record the options of a new job.
+
+        :param asset_types: The asset types to download
+        :param str dest: The download destination
+        :param int limit: optional limit to the number of items
+        :raises ValueError: if the journal already has a job
+        '''
+        with self._lock:
+            if self._get('asset_types') is not None:
+                raise ValueError('journal %s already has a job' % self.path)
+            self._db.execute('BEGIN')
+            self._set('asset_types', list(asset_types))
+            self._set('dest', dest)
+            self._set('limit', limit)
+            self._set('cursor', None)
+            self._set('paged', False)
+            self._db.execute('COMMIT')
+
+    def job(self):
+        '''Get the options of the job.
+
+        :returns: dict with 'asset_types', 'dest' and 'limit'
+        :raises ValueError: if the journal has no job
+        '''
+        with self._lock:
+            asset_types = self._get('asset_types')
+            if asset_types is None:
+                raise ValueError('journal %s has no job' % self.path)
+            return {'asset_types': asset_types, 'dest': self._get('dest'),
+                    'limit': self._get('limit')}
+
+    def _add_page(self, items, cursor):
+        '''Record a page of items and the URL of the next page in one
+        transaction.'''
+        asset_types = self._get('asset_types')
+        now = time.time()
+        self._db.execute('BEGIN')
+        try:
+            for item in items:
+                self._db.execute(
+                    'INSERT OR IGNORE INTO items (id, item) VALUES (?, ?)',
+                    (item['id'], json.dumps(item)))
+                self._db.executemany(
+                    'INSERT OR IGNORE INTO assets (item_id, asset_type, '
+                    'state, updated) VALUES (?, ?, ?, ?)',
+                    [(item['id'], t, QUEUED, now) for t in asset_types])
+            self._set('cursor', cursor)
+            self._set('paged', cursor is None)
+            self._db.execute('COMMIT')
+        except Exception:
+            self._db.execute('ROLLBACK')
+            raise
+
+    def _count(self):
+        return self._db.execute('SELECT COUNT(*) FROM items').fetchone()[0]
+
+    def record(self, paged):
+        '''Iterate over the items of a search, recording each page of items
+        before they are produced.
+
+        :param paged: The first :py:class:`planet.api.models.Paged` page of
+                      the search
+        :returns: iter of items
+        '''
+        limit = self.job()['limit']
+        for page in paged.iter():
+            items = page.get()[page.ITEM_KEY]
+            cursor = page._next_url()
+            with self._lock:
+                if limit is not None and \
+                        self._count() + len(items) >= limit:
+                    items = items[:max(0, limit - self._count())]
+                    cursor = None
+                self._add_page(items, cursor)
+            for item in items:
+                yield item
+            if cursor is None:
+                break
+
+    def _pending(self):
+        # read a batch at a time, releasing the lock between batches
+        seq = 0
+        while True:
+            with self._lock:
+                rows = self._db.execute(
+                    'SELECT seq, item FROM items WHERE seq > ? AND id IN '
+                    '(SELECT item_id FROM assets WHERE state != ?) '
+                    'ORDER BY seq LIMIT ?',
+                    (seq, DONE, self._batch_size)).fetchall()
+            for seq, item in rows:
+                yield json.loads(item)
+            if len(rows) < self._batch_size:
+                break
+
+    def resume(self, client):
+        '''Iterate over the items of the job that are not yet downloaded,
+        then continue paging the search where it stopped.
+
+        :param client: The :py:class:`planet.api.ClientV1`
+        :returns: iter of items
+        '''
+        for item in self._pending():
+            yield item
+        with self._lock:
+            cursor = self._get('cursor')
+            paged = self._get('paged')
+        if paged or not cursor:
+            return
+        request = models.Request(cursor, client.auth,
+                                 body_type=models.Items)
+        page = client.dispatcher.response(request).get_body()
+        for item in self.record(page):
+            yield item
+
+    def set_state(self, item_id, asset_type, state, path=None, error=None):
+        '''Record the state of an item's asset. An asset that is done stays
+        done, e.g. when the other assets of its item are activated again.
+
+        :param str state: One of :py:data:`STATES`
+        '''
+        with self._lock:
+            self._db.execute(
+                'UPDATE assets SET state = ?, path = ?, error = ?, '
+                'updated = ? WHERE item_id = ? AND asset_type = ? AND '
+                'state != ?',
+                (state, path, error, time.time(), item_id, asset_type, DONE))
+
+    def state(self, item_id, asset_type):
+        '''Get the state of an item's asset or None.'''
+        with self._lock:
+            row = self._db.execute(
+                'SELECT state FROM assets WHERE item_id = ? AND '
+                'asset_type = ?', (item_id, asset_type)).fetchone()
+        return row and row[0]
+
+    def counts(self):
+        '''Get the number of assets in each state.
+
+        :returns: dict of state to count
+        '''
+        with self._lock:
+            rows = self._db.execute(
+                'SELECT state, COUNT(*) FROM assets GROUP BY state')
+            return dict(rows.fetchall())
@@ -0,0 +1,365 @@
+# Copyright 2021 Planet Labs, Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+'''Instrumentation of requests made by the dispatcher.
+
+Add a :py:class:`Listener` to a dispatcher to be notified as requests start,
+end and are retried. The :py:class:`Metrics` listener collects per-endpoint
+statistics that can be read with :py:meth:`Metrics.snapshot` or exported in
+the Prometheus text format with :py:meth:`Metrics.prometheus`::
+
+    metrics = Metrics()
+    client.dispatcher.add_listener(metrics)
+    ...
+    print(metrics.prometheus())
+'''
+
+import bisect
+import logging
+import re
+import threading
+
+from requests.compat import urlparse
+from requests.exceptions import Timeout
+
+log = logging.getLogger(__name__)
+
+try:
+    _TIMEOUTS = (Timeout, TimeoutError)
+except NameError:
+    # python 2
+    _TIMEOUTS = (Timeout,)
+
+# collections in which the next path segment is an identifier
+_ID_COLLECTIONS = frozenset([
+    'assets', 'collections', 'items', 'mosaics', 'orders', 'quads',
+    'searches', 'series', 'subscriptions',
+])
+# path segments shaped like generated identifiers anywhere: uuids, long hex
+# strings and long tokens
+_ID_SEGMENT = re.compile(r'^([0-9a-fA-F-]{16,}|[A-Za-z0-9_=-]{32,})$')
+_VERSION_SEGMENT = re.compile(r'^v\d+$')
+
+
+def _is_id(segment, previous):
+    if not segment or _VERSION_SEGMENT.match(segment):
+        return False
+    return previous in _ID_COLLECTIONS or bool(_ID_SEGMENT.match(segment))
+
+
+def endpoint_template(url):
+    '''Reduce a URL to an endpoint template by replacing path segments that
+    are identifiers with ``{id}`` so metrics have a bounded number of
+    labels. A segment is an identifier if it follows a collection such as
+    ``items`` or ``searches``, or is shaped like a uuid or long token. Names
+    like item types are kept.
+
+    >>> from planet.api.metrics import endpoint_template
+    >>> print(endpoint_template(
+    ...     'https://api.planet.com/data/v1/item-types/PSScene/items/'
+    ...     '20210101_180000_0f4e/assets/'))
+    /data/v1/item-types/PSScene/items/{id}/assets/
+    >>> print(endpoint_template(
+    ...     'https://api.planet.com/compute/ops/orders/v2/'
+    ...     '7b4c8e2e-0d9a-4c9e-9a5e-2f6b1f8e0f3c?x=1'))
+    /compute/ops/orders/v2/{id}
+    '''
+    segments = urlparse(url).path.split('/')
+    return '/'.join(['{id}' if _is_id(s, p) else s
+                     for p, s in zip([''] + segments, segments)])
+
+
+class Listener(object):
+    '''Base class for dispatcher instrumentation. All methods do nothing and
+    subclasses override those of interest. Methods may be called from any
+    thread.'''
+
+    def request_start(self, request):
+        '''A request is about to be sent.
+
+        :param request: The :py:class:`planet.api.models.Request`
+        '''
+
+    def request_end(self, request, response, elapsed, error=None):
+        '''An attempt to make a request has completed.
+
+        :param request: The :py:class:`planet.api.models.Request`
+        :param response: The HTTP response or None on connection error
+        :param float elapsed: Seconds taken by the attempt
+        :param error: The exception raised by the attempt, if any
+        '''
+
+    def request_retry(self, request, attempt, wait, reason):
+        '''A request attempt failed and will be retried.
+
+        :param int attempt: The number of the failed attempt (from 1)
+        :param float wait: Seconds until the next attempt
+        :param str reason: The reason for retrying (e.g. 'throttled')
+        '''
+
+    def throttle_wait(self, request, wait):
+        '''A request was delayed by the client-side rate limiter.
+
+        :param float wait: Seconds the request waited
+        '''
+
+    def transfer_stalled(self, request, throughput):
+        '''A streaming download fell below the minimum throughput and was
+        abandoned. It will be restarted unless it is also aborted.
+
+        :param float throughput: The bytes per second at the time
+        '''
+
+    def transfer_aborted(self, request, error):
+        '''A streaming download failed part way and was not restarted.
+
+        :param error: The exception ending the transfer
+        '''
+
+
+class Hooks(Listener):
+    '''Dispatches notifications to any number of listeners. Listener errors
+    are logged and otherwise ignored.'''
+
+    def __init__(self):
+        self._listeners = ()
+
+    def add(self, listener):
+        self._listeners = self._listeners + (listener,)
+
+    def remove(self, listener):
+        self._listeners = tuple(
+            li for li in self._listeners if li is not listener)
+
+    def _notify(self, method, *args, **kw):
+        for listener in self._listeners:
+            try:
+                getattr(listener, method)(*args, **kw)
+            except Exception:
+                log.exception('error in listener %s', listener)
+
+    def request_start(self, request):
+        self._notify('request_start', request)
+
+    def request_end(self, request, response, elapsed, error=None):
+        self._notify('request_end', request, response, elapsed, error)
+
+    def request_retry(self, request, attempt, wait, reason):
+        self._notify('request_retry', request, attempt, wait, reason)
+
+    def throttle_wait(self, request, wait):
+        self._notify('throttle_wait', request, wait)
+
+    def transfer_stalled(self, request, throughput):
+        self._notify('transfer_stalled', request, throughput)
+
+    def transfer_aborted(self, request, error):
+        self._notify('transfer_aborted', request, error)
+
+
+def _bytes_out(request):
+    data = request.data or ''
+    if not isinstance(data, bytes):
+        data = data.encode('utf-8')
+    return len(data)
+
+
+def _bytes_in(response):
+    length = response.headers.get('content-length')
+    if length is not None:
+        return int(length)
+    # only count content that has already been read
+    if getattr(response, '_content_consumed', False):
+        return len(response.content or b'')
+    return 0
+
+
+class Metrics(Listener):
+    '''Collects per-endpoint request metrics: latency histograms, status code
+    counts, retries (including throttled requests), bytes sent and received,
+    stalled and aborted downloads, and time spent waiting in the rate
+    limiter. Attempts that failed without a response are counted with a
+    status of 'timeout' or 'error'.
+
+    :param buckets: The upper bounds in seconds of the latency histogram
+    '''
+
+    BUCKETS = (.01, .025, .05, .1, .25, .5, 1., 2.5, 5., 10., 30., 60.)
+
+    def __init__(self, buckets=BUCKETS):
+        self.buckets = tuple(sorted(buckets))
+        self._lock = threading.Lock()
+        self._endpoints = {}
+        self._throttle_wait = 0.
+        self._throttle_waits = 0
+
+    def _endpoint(self, request):
+        key = (request.method.upper(), endpoint_template(request.url))
+        ep = self._endpoints.get(key)
+        if ep is None:
+            ep = self._endpoints[key] = {
+                'count': 0,
+                'sum': 0.,
+                'buckets': [0] * (len(self.buckets) + 1),
+                'status': {},
+                'retries': {},
+                'bytes_out': 0,
+                'bytes_in': 0,
+                'stalls': 0,
+                'aborts': 0,
+            }
+        return ep
+
+    def request_end(self, request, response, elapsed, error=None):
+        if response is not None:
+            status = str(response.status_code)
+        elif isinstance(error, _TIMEOUTS):
+            status = 'timeout'
+        else:
+            status = 'error'
+        bytes_in = 0 if response is None else _bytes_in(response)
+        with self._lock:
+            ep = self._endpoint(request)
+            ep['count'] += 1
+            ep['sum'] += elapsed
+            ep['buckets'][bisect.bisect_left(self.buckets, elapsed)] += 1
+            ep['status'][status] = ep['status'].get(status, 0) + 1
+            ep['bytes_out'] += _bytes_out(request)
+            ep['bytes_in'] += bytes_in
+
+    def request_retry(self, request, attempt, wait, reason):
+        with self._lock:
+            retries = self._endpoint(request)['retries']
+            retries[reason] = retries.get(reason, 0) + 1
+
+    def transfer_stalled(self, request, throughput):
+        with self._lock:
+            self._endpoint(request)['stalls'] += 1
+
+    def transfer_aborted(self, request, error):
+        with self._lock:
+            self._endpoint(request)['aborts'] += 1
+
+    def throttle_wait(self, request, wait):
+        with self._lock:
+            self._throttle_wait += wait
+            self._throttle_waits += 1
+
+    def snapshot(self):
+        '''Get a copy of the current metrics as a dict::
+
+            {
+              'endpoints': {
+                'GET /data/v1/item-types/PSScene/items/{id}/assets/': {
+                  'count': 10, 'sum': 1.2,
+                  'buckets': {0.01: 0, ..., '+Inf': 10},
+                  'status': {'200': 9, '429': 1},
+                  'retries': {'throttled': 1},
+                  'bytes_out': 0, 'bytes_in': 12345,
+                  'stalls': 0, 'aborts': 0,
+                }
+              },
+              'throttle_wait': 3.5,
+              'throttle_waits': 14,
+            }
+
+        Histogram buckets are cumulative.
+        '''
+        with self._lock:
+            endpoints = {}
+            for (method, template), ep in self._endpoints.items():
+                ep = dict(ep)
+                cumulative, total = {}, 0
+                for bound, cnt in zip(self.buckets + ('+Inf',),
+                                      ep['buckets']):
+                    total += cnt
+                    cumulative[bound] = total
+                ep['buckets'] = cumulative
+                ep['status'] = dict(ep['status'])
+                ep['retries'] = dict(ep['retries'])
+                endpoints['%s %s' % (method, template)] = ep
+            return {
+                'endpoints': endpoints,
+                'throttle_wait': self._throttle_wait,
+                'throttle_waits': self._throttle_waits,
+            }
+
+    def prometheus(self, prefix='planet_client'):
+        '''Export the current metrics in the Prometheus text format.
+
+        :param str prefix: The prefix of each metric name
+        :returns: str
+        '''
+        snapshot = self.snapshot()
+        lines = []
+
+        def metric(name, kind, help, samples):
+            name = '%s_%s' % (prefix, name)
+            lines.append('# HELP %s %s' % (name, help))
+            lines.append('# TYPE %s %s' % (name, kind))
+            for suffix, labels, value in samples:
+                labels = ','.join('%s="%s"' % (k, _escape(v))
+                                  for k, v in labels)
+                labels = '{%s}' % labels if labels else ''
+                lines.append('%s%s%s %s' % (name, suffix, labels,
+                                            _number(value)))
+
+        durations, statuses, retries, sent, received = [], [], [], [], []
+        stalls, aborts = [], []
+        for key, ep in sorted(snapshot['endpoints'].items()):
+            method, endpoint = key.split(' ', 1)
+            labels = [('method', method), ('endpoint', endpoint)]
+            for bound, cnt in ep['buckets'].items():
+                le = bound if bound == '+Inf' else _number(bound)
+                durations.append(('_bucket', labels + [('le', le)], cnt))
+            durations.append(('_sum', labels, ep['sum']))
+            durations.append(('_count', labels, ep['count']))
+            for status, cnt in sorted(ep['status'].items()):
+                statuses.append(('', labels + [('status', status)], cnt))
+            for reason, cnt in sorted(ep['retries'].items()):
+                retries.append(('', labels + [('reason', reason)], cnt))
+            sent.append(('', labels, ep['bytes_out']))
+            received.append(('', labels, ep['bytes_in']))
+            stalls.append(('', labels, ep['stalls']))
+            aborts.append(('', labels, ep['aborts']))
+
+        metric('request_duration_seconds', 'histogram',
+               'Request latency by endpoint.', durations)
+        metric('requests_total', 'counter',
+               'Completed request attempts by endpoint and status.',
+               statuses)
+        metric('request_retries_total', 'counter',
+               'Retried request attempts by endpoint and reason.', retries)
+        metric('request_bytes_sent_total', 'counter',
+               'Request body bytes sent by endpoint.', sent)
+        metric('response_bytes_received_total', 'counter',
+               'Response body bytes received by endpoint.', received)
+        metric('transfer_stalls_total', 'counter',
+               'Downloads restarted or aborted for low throughput.', stalls)
+        metric('transfer_aborts_total', 'counter',
+               'Downloads that failed part way.', aborts)
+        metric('throttle_wait_seconds_total', 'counter',
+               'Time spent waiting in the client rate limiter.',
+               [('', [], snapshot['throttle_wait'])])
+        metric('throttle_waits_total', 'counter',
+               'Requests delayed by the client rate limiter.',
+               [('', [], snapshot['throttle_waits'])])
+        return '\n'.join(lines) + '\n'
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"')
+
+
+def _number(value):
+    return repr(float(value)) if isinstance(value, float) else str(value)
@@ -12,16 +12,172 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 
+from . import _partial
 from ._fatomic import atomic_open
+from .checksums import Hasher
+from .exceptions import APIException
+from .exceptions import ChecksumMismatch
 from .exceptions import RequestCancelled
+from .exceptions import StalledTransfer
 from .utils import get_filename
 from .utils import check_status
 from .utils import GeneratorAdapter
 from datetime import datetime
-import itertools
+import io
 import json
+import logging
+import os
+import socket
+import threading
+import time
+
+from requests.exceptions import ConnectionError
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+try:
+    import Queue as queue
+except ImportError:
+    # renamed in 3
+    import queue
+try:
+    import httplib
+except ImportError:
+    # renamed in 3
+    import http.client as httplib
+
+log = logging.getLogger(__name__)
 
 chunk_size = 32 * 1024
+# bodies are read directly into a reusable buffer when possible, with reads
+# sized to take about read_interval seconds at the observed bandwidth
+min_read_size = 64 * 1024
+max_read_size = 8 * 1024 * 1024
+read_interval = .1
+# progress callbacks are made at most every progress_interval seconds unless
+# progress_bytes have been written since the last one
+progress_interval = .25
+progress_bytes = 16 * 1024 * 1024
+# bodies of at least segment_min_size bytes can be written with concurrent
+# range requests, see Body.write
+segment_min_size = 16 * 1024 * 1024
+# a download slower than stall_throughput bytes per second over a period of
+# stall_window seconds is abandoned and restarted up to stall_restarts times
+stall_throughput = 8 * 1024
+stall_window = 30
+stall_restarts = 3
+# a download that does not have the expected digests is written again up to
+# checksum_retries times
+checksum_retries = 2
+
+
+class _Watchdog(object):
+    '''Measures throughput over consecutive windows of `window` seconds and
+    raises StalledTransfer when a window falls below `throughput`.'''
+
+    def __init__(self, throughput, window):
+        self.throughput = throughput
+        self.window = window
+        self._start = time.time()
+        self._bytes = 0
+
+    def update(self, size):
+        self._bytes += size
+        now = time.time()
+        elapsed = now - self._start
+        if elapsed >= self.window:
+            rate = self._bytes / elapsed
+            if rate < self.throughput:
+                raise StalledTransfer(rate)
+            self._start, self._bytes = now, 0
+
+
+def _readinto_chunks(fp):
+    '''Read a file into a reusable buffer, producing memoryviews of the
+    buffer that are only valid until the next is produced. The read size
+    adapts to the observed bandwidth.'''
+    size = min_read_size
+    view = memoryview(bytearray(size))
+    while True:
+        start = time.time()
+        try:
+            count = fp.readinto(view[:size])
+        except (socket.error, httplib.HTTPException) as ex:
+            raise ConnectionError(ex)
+        if not count:
+            return
+        elapsed = time.time() - start
+        yield view[:count]
+        if count == size and elapsed < read_interval / 2 and \
+                size < max_read_size:
+            size *= 2
+            if size > len(view):
+                view = memoryview(bytearray(size))
+        elif elapsed > read_interval * 2 and size > min_read_size:
+            size //= 2
+
+
+def _pwrite(fp, data, offset):
+    '''Write all of data at offset, without moving the file position if
+    os.pwrite is available.'''
+    if not hasattr(os, 'pwrite'):
+        fp.seek(offset)
+        fp.write(data)
+        return
+    fd = fp.fileno()
+    data = memoryview(data)
+    while data:
+        count = os.pwrite(fd, data, offset)
+        data, offset = data[count:], offset + count
+
+
+class _Segment(object):
+    '''A [start, end) range of a body being written, `pos` is the end of
+    the bytes written so far and `response` is the response being read, if
+    any.'''
+
+    def __init__(self, start, end, response=None):
+        self.start = self.pos = start
+        self.end = end
+        self.response = response
+
+
+def _split(intervals, parts):
+    '''Split [start, end) intervals into about `parts` intervals, in
+    proportion to their lengths.'''
+    total = sum(end - start for start, end in intervals)
+    ranges = []
+    if not total:
+        return ranges
+    for start, end in intervals:
+        count = max(1, int(round(parts * (end - start) / float(total))))
+        bounds = [start + (end - start) * i // count
+                  for i in range(count + 1)]
+        ranges.extend(zip(bounds[:-1], bounds[1:]))
+    return ranges
+
+
+def _preallocate(fp, size):
+    try:
+        os.posix_fallocate(fp.fileno(), 0, size)
+    except (AttributeError, OSError):
+        fp.truncate(size)
+
+
+def _limit(iterator, limit):
+    '''Like itertools.islice(iterator, limit) but closes the iterator as soon
+    as the limit is reached so it can release resources.'''
+    try:
+        if limit <= 0:
+            return
+        for count, value in enumerate(iterator, 1):
+            yield value
+            if count >= limit:
+                return
+    finally:
+        iterator.close()
 
 
 class Response(object):
@@ -115,6 +271,36 @@ class Body(object):
     def __iter__(self):
         return (c for c in self.response.iter_content(chunk_size=chunk_size))
 
+    def _direct_fp(self):
+        '''The underlying http.client response if the body can be read from
+        it directly: it has not been read yet and is not content encoded.'''
+        fp = getattr(getattr(self.response, 'raw', None), '_fp', None)
+        if not isinstance(fp, io.BufferedIOBase) or \
+                getattr(self.response, '_content_consumed', True) or \
+                self.response.headers.get('content-encoding',
+                                          'identity') != 'identity':
+            return None
+        return fp
+
+    def _iter_chunks(self):
+        fp = self._direct_fp()
+        if fp is None:
+            return iter(self)
+        return self._iter_direct(fp)
+
+    def _iter_direct(self, fp):
+        try:
+            for chunk in _readinto_chunks(fp):
+                yield chunk
+        finally:
+            if fp.isclosed():
+                # read to the end, the connection goes back to the pool
+                self.response._content_consumed = True
+                self.response.raw.release_conn()
+            else:
+                # the rest of the body is unread, the connection is unusable
+                self.response.close()
+
     def last_modified(self):
         '''Read the last-modified header as a datetime, if present.'''
         lm = self.response.headers.get('last-modified', None)
@@ -125,56 +311,391 @@ class Body(object):
         '''Get the decoded text content from the response'''
         return self.response.content.decode('utf-8')
 
-    def _write(self, fp, callback):
+    def _notify(self, event, *args):
+        hooks = getattr(self._dispatcher, 'hooks', None)
+        if hooks is not None:
+            getattr(hooks, event)(self._request, *args)
+
+    def _restart(self, fp):
+        '''Discard what has been written and request the body again.'''
+        try:
+            fp.seek(0)
+            fp.truncate()
+        except (AttributeError, IOError, OSError, ValueError):
+            return False
+        self.response = self._dispatcher._stream(self._request)
+        return True
+
+    def _chunks(self, fp):
+        '''Iterate over the body, restarting a stalled or broken transfer
+        from the beginning. None is produced when a restart happens.'''
+        restarts = 0
+        while True:
+            watchdog = _Watchdog(stall_throughput, stall_window)
+            try:
+                for chunk in self._iter_chunks():
+                    watchdog.update(len(chunk))
+                    yield chunk
+                return
+            except (StalledTransfer, ConnectionError) as ex:
+                self.response.close()
+                if isinstance(ex, StalledTransfer):
+                    self._notify('transfer_stalled', ex.throughput)
+                if self._cancel or restarts >= stall_restarts or \
+                        not self._restart(fp):
+                    self._notify('transfer_aborted', ex)
+                    raise
+                restarts += 1
+                yield None
+
+    def _write(self, fp, callback, hasher=None):
         total = 0
+        # bytes reported, including by an attempt that was restarted
+        reported = 0
+        last_report = time.time()
         if not callback:
             def noop(*a, **kw):
                 pass
             callback = noop
         callback(start=self)
-        for chunk in self:
+        for chunk in self._chunks(fp):
             if self._cancel:
                 raise RequestCancelled()
+            if chunk is None:
+                if total > reported:
+                    callback(wrote=total - reported, total=total)
+                reported, total = max(reported, total), 0
+                if hasher:
+                    hasher.reset()
+                continue
             fp.write(chunk)
-            size = len(chunk)
-            total += size
-            callback(wrote=size, total=total)
+            if hasher:
+                hasher.update(chunk)
+            total += len(chunk)
+            if total > reported:
+                now = time.time()
+                if now - last_report >= progress_interval or \
+                        total - reported >= progress_bytes:
+                    callback(wrote=total - reported, total=total)
+                    reported, last_report = total, now
+        if total > reported:
+            callback(wrote=total - reported, total=total)
+        if hasher:
+            hasher.check(self.size)
         # seems some responses don't have a content-length header
         if self.size == 0:
             self.size = total
         callback(finish=self)
 
-    def write(self, file=None, callback=None):
+    def _segmentable(self, segments):
+        return segments > 1 and self.size >= segment_min_size and \
+            self._ranges_accepted()
+
+    def _ranges_accepted(self):
+        headers = self.response.headers
+        return headers.get('accept-ranges') == 'bytes' and \
+            headers.get('content-encoding', 'identity') == 'identity'
+
+    def _source(self):
+        headers = self.response.headers
+        return {
+            'url': self._request.url,
+            'size': self.size,
+            'etag': headers.get('etag'),
+            'last_modified': headers.get('last-modified'),
+        }
+
+    def _range(self, start, end):
+        '''Request bytes start to end of the body, or None if the server
+        does not return the range.'''
+        headers = {'Range': 'bytes=%d-%d' % (start, end - 1)}
+        source = self._source()
+        validator = source['etag'] or source['last_modified']
+        if validator:
+            # the whole body is returned if it changed
+            headers['If-Range'] = validator
+        response = self._dispatcher._stream(self._request, headers=headers)
+        if response.status_code != 206:
+            response.close()
+            return None
+        return response
+
+    def _range_chunks(self, response, length):
+        body = Body(self._request, response, self._dispatcher)
+        for chunk in body._iter_chunks():
+            if len(chunk) >= length:
+                yield chunk[:length]
+                return
+            length -= len(chunk)
+            yield chunk
+        raise ConnectionError('body ended %d bytes early' % length)
+
+    def _write_range(self, fp, lock, segment, stop):
+        '''Write a segment of the body, read from its response or a range
+        request, to the same offsets of the file. A stalled or broken
+        transfer is resumed from where it stopped.'''
+        restarts = 0
+        while segment.pos < segment.end:
+            watchdog = _Watchdog(stall_throughput, stall_window)
+            try:
+                if segment.response is None:
+                    segment.response = self._range(segment.pos, segment.end)
+                    if segment.response is None:
+                        raise APIException('range request not supported')
+                for chunk in self._range_chunks(segment.response,
+                                                segment.end - segment.pos):
+                    watchdog.update(len(chunk))
+                    # nothing is written once stopped, the file may be closed
+                    with lock:
+                        if self._cancel or stop.is_set():
+                            raise RequestCancelled()
+                        _pwrite(fp, chunk, segment.pos)
+                        segment.pos += len(chunk)
+            except (StalledTransfer, ConnectionError) as ex:
+                if isinstance(ex, StalledTransfer):
+                    self._notify('transfer_stalled', ex.throughput)
+                if self._cancel or stop.is_set() or \
+                        restarts >= stall_restarts:
+                    self._notify('transfer_aborted', ex)
+                    raise
+                restarts += 1
+            finally:
+                if segment.response is not None:
+                    segment.response.close()
+                segment.response = None
+
+    def _write_ranges(self, fp, callback, segments, done=(), partial=None):
+        '''Write segments of the body concurrently. Progress is recorded in
+        the optional partial file along with the intervals already
+        `done`.'''
+        lock = threading.Lock()
+        stop = threading.Event()
+        previous = sum(end - start for start, end in done)
+        errors = []
+
+        def run(segment):
+            try:
+                self._write_range(fp, lock, segment, stop)
+            except Exception as ex:
+                errors.append(ex)
+                stop.set()
+
+        def written():
+            with lock:
+                return sum(s.pos - s.start for s in segments)
+
+        def completed():
+            with lock:
+                return list(done) + [[s.start, s.pos] for s in segments]
+
+        threads = [threading.Thread(target=run, args=(segment,))
+                   for segment in segments]
+        for thread in threads:
+            thread.daemon = True
+            thread.start()
+        if callback:
+            callback(start=self)
+        reported = 0
+        try:
+            for thread in threads:
+                while thread.is_alive():
+                    thread.join(progress_interval)
+                    if partial:
+                        partial.save(completed())
+                    total = written()
+                    if callback and total > reported:
+                        callback(wrote=total - reported,
+                                 total=previous + total)
+                        reported = total
+        finally:
+            if any(thread.is_alive() for thread in threads):
+                # interrupted, stop the writers before the file is closed
+                with lock:
+                    stop.set()
+                for segment in segments:
+                    response = segment.response
+                    if response is not None:
+                        response.close()
+            if partial:
+                partial.save(completed())
+        # a segment may finish between reports, report its last bytes
+        total = written()
+        if callback and total > reported:
+            callback(wrote=total - reported, total=previous + total)
+        if errors:
+            raise errors[0]
+        if callback:
+            callback(finish=self)
+
+    def _write_segmented(self, fp, callback, segments):
+        '''Write the body with concurrent range requests, falling back to a
+        single request if the server does not return ranges.'''
+        ranges = _split([[0, self.size]], segments)
+        # the body already being read provides the first range, the second is
+        # requested here to check that the server returns ranges
+        second = self._range(*ranges[1])
+        if second is None:
+            return self._write(fp, callback)
+        responses = [self.response, second] + [None] * (len(ranges) - 2)
+        _preallocate(fp, self.size)
+        self._write_ranges(fp, callback, [
+            _Segment(start, end, response)
+            for (start, end), response in zip(ranges, responses)])
+
+    def _resumable(self):
+        source = self._source()
+        return self.size > 0 and self._ranges_accepted() and \
+            bool(source['etag'] or source['last_modified'])
+
+    def _check_file(self, path, digests):
+        hasher = Hasher(self.name or path, digests)
+        hasher.update_file(path)
+        hasher.check(self.size)
+
+    def _write_resumable(self, filename, callback, segments, digests=None):
+        '''Write the body through a partial file, continuing an earlier
+        partial download of the same content.'''
+        if self.size < segment_min_size:
+            segments = 1
+        partial = _partial.PartialFile(filename, self._source())
+        done = partial.completed()
+        if done:
+            ranges = _split(_partial.missing(done, self.size), segments)
+            first = self._range(*ranges[0]) if ranges else None
+            if ranges and first is None:
+                # the server no longer returns ranges, start over
+                done = []
+            else:
+                log.info('resuming %s', partial.path)
+                self.response.close()
+                responses = [first] + [None] * (len(ranges) - 1)
+        if not done:
+            ranges = _split([[0, self.size]], segments)
+            responses = [self.response] + [None] * (len(ranges) - 1)
+        fp = partial.open(resume=bool(done))
+        try:
+            if not done:
+                _preallocate(fp, self.size)
+            self._write_ranges(fp, callback, [
+                _Segment(start, end, response)
+                for (start, end), response in zip(ranges, responses)
+            ], done, partial)
+        finally:
+            partial.close()
+        if digests:
+            try:
+                self._check_file(partial.path, digests)
+            except ChecksumMismatch:
+                partial.discard()
+                raise
+        partial.commit()
+
+    def _write_file(self, filename, callback, segments, resume, digests):
+        if resume and self._resumable():
+            return self._write_resumable(filename, callback, segments,
+                                         digests)
+        with atomic_open(filename, 'wb') as fp:
+            if self._segmentable(segments):
+                self._write_segmented(fp, callback, segments)
+                if digests:
+                    # the body is not written in order, hash the file
+                    fp.flush()
+                    self._check_file(fp.name, digests)
+            else:
+                self._write(fp, callback,
+                            Hasher(filename, digests) if digests else None)
+
+    def write(self, file=None, callback=None, segments=1, resume=False,
+              digests=None):
         '''Write the contents of the body to the optionally provided file and
         providing progress to the optional callback. The callback will be
         invoked 3 different ways:
 
         * First as ``callback(start=self)``
-        * For each chunk of data written as
-          ``callback(wrote=chunk_size_in_bytes, total=all_byte_cnt)``
+        * As data is written, at most every `progress_interval` seconds
+          unless `progress_bytes` have been written, as
+          ``callback(wrote=byte_cnt_since_last_call, total=all_byte_cnt)``
         * Upon completion as ``callback(finish=self)``
 
+        When writing to a file name, a body of at least `segment_min_size`
+        bytes from a server that accepts range requests can be written with
+        `segments` concurrent requests, each for part of the body.
+
+        With `resume`, a body from a server that accepts range requests and
+        provides an ETag or Last-Modified header is written to `file + .part`
+        and moved into place when complete. If the write is interrupted, a
+        later write of the same content to the same file continues from the
+        bytes recorded in `file + .part.json`.
+
+        With `digests`, the body is hashed as it is written and
+        `ChecksumMismatch` is raised if it does not have the expected size
+        and digest. A file name is only replaced by a verified body, a body
+        that does not verify is requested again up to `checksum_retries`
+        times. Bodies written out of order, with `segments` or `resume`, are
+        hashed from the file once complete.
+
         :param file: file name or file-like object
         :param callback: optional progress callback
+        :param int segments: optional number of concurrent range requests
+        :param bool resume: keep and continue partial files
+        :param dict digests: optional expected hex digests by algorithm, see
+                             :py:func:`planet.api.checksums.preferred`
         '''
         if not file:
             file = self.name
         if not file:
             raise ValueError('no file name provided or discovered in response')
         if hasattr(file, 'write'):
-            self._write(file, callback)
-        else:
-            with atomic_open(file, 'wb') as fp:
-                self._write(fp, callback)
+            self._write(file, callback,
+                        Hasher(self.name, digests) if digests else None)
+            return
+        attempt = 0
+        while True:
+            try:
+                return self._write_file(file, callback, segments, resume,
+                                        digests)
+            except ChecksumMismatch as ex:
+                attempt += 1
+                if self._cancel or attempt > checksum_retries:
+                    raise
+                log.warning('%s, downloading again', ex)
+                self._notify('request_retry', attempt, 0, 'checksum')
+                self.response = self._dispatcher._stream(self._request)
+                self.size = int(
+                    self.response.headers.get('content-length', 0))
+
+
+def _orjson_loads(content):
+    return orjson.loads(content)
+
+
+# decodes the UTF-8 bytes of a JSON response, None to let requests decode it
+json_loads = _orjson_loads if orjson is not None else None
 
 
 class JSON(Body):
     '''A Body that contains JSON'''
 
-    def get(self):
-        '''Get the response as a JSON dict'''
+    _json = None
+
+    def _decode(self):
+        content = getattr(self.response, 'content', None)
+        if json_loads is not None and isinstance(content, bytes):
+            try:
+                return json_loads(content)
+            except ValueError:
+                # not UTF-8, let requests detect the encoding
+                pass
         return self.response.json()
 
+    def get(self):
+        '''Get the response as a JSON dict. The response is only decoded once
+        and the same dict is returned on each call, so it should not be
+        modified.'''
+        if self._json is None:
+            self._json = self._decode()
+        return self._json
+
 
 class Paged(JSON):
 
@@ -182,9 +703,12 @@ class Paged(JSON):
     LINKS_KEY = '_links'
     NEXT_KEY = '_next'
 
-    def next(self):
+    def _next_url(self):
         links = self.get()[self.LINKS_KEY]
-        next_ = links.get(self.NEXT_KEY, None)
+        return links.get(self.NEXT_KEY, None)
+
+    def next(self):
+        next_ = self._next_url()
         if next_:
             request = Request(next_, self._request.auth, body_type=type(self))
             return self._dispatcher.response(request).get_body()
@@ -195,18 +719,68 @@ class Paged(JSON):
             yield page
             page = page.next()
 
-    def iter(self, pages=None):
+    def _prefetched_pages(self, depth):
+        '''Iterate over the pages like _pages while a background thread
+        fetches up to `depth` pages ahead. Closing the iterator stops the
+        thread after any request in progress.'''
+        pages = queue.Queue()
+        cond = threading.Condition()
+        # pages fetched but not yet consumed, and whether to stop
+        state = {'ahead': 0, 'stop': False}
+
+        def fetch():
+            page = self
+            try:
+                while page is not None:
+                    with cond:
+                        while state['ahead'] >= depth and not state['stop']:
+                            cond.wait()
+                        if state['stop']:
+                            return
+                        state['ahead'] += 1
+                    page = page.next()
+                    pages.put(page)
+            except Exception as ex:
+                pages.put(ex)
+
+        thread = threading.Thread(target=fetch)
+        thread.daemon = True
+        thread.start()
+        try:
+            page = self
+            while page is not None:
+                yield page
+                page = pages.get()
+                with cond:
+                    state['ahead'] -= 1
+                    cond.notify()
+                if isinstance(page, Exception):
+                    raise page
+        finally:
+            with cond:
+                state['stop'] = True
+                cond.notify()
+
+    def _iter_pages(self, prefetch):
+        if prefetch:
+            return self._prefetched_pages(prefetch)
+        return self._pages()
+
+    def iter(self, pages=None, prefetch=0):
         '''Get an iterator of pages.
 
         :param int pages: optional limit to number of pages
+        :param int prefetch: optional number of pages to fetch in the
+                             background while the current page is consumed
         :return: iter of this and subsequent pages
         '''
-        i = self._pages()
+        i = self._iter_pages(prefetch)
         if pages is not None:
-            i = itertools.islice(i, pages)
+            i = _limit(i, pages)
         return i
 
-    def json_encode(self, out, limit=None, sort_keys=False, indent=None):
+    def json_encode(self, out, limit=None, sort_keys=False, indent=None,
+                    prefetch=0):
         '''Encode the results of this paged response as JSON writing to the
         provided file-like `out` object. This function will iteratively read
         as many pages as present, streaming the contents out as JSON.
@@ -215,33 +789,41 @@ class Paged(JSON):
         :param int limit: optional maximum number of items to write
         :param bool sort_keys: if True, output keys sorted, default is False
         :param bool indent: if True, indent output, default is False
+        :param int prefetch: optional number of pages to fetch in the
+                             background while the current page is written
         '''
-        stream = self._json_stream(limit)
+        stream = self._json_stream(limit, prefetch)
         enc = json.JSONEncoder(indent=indent, sort_keys=sort_keys)
         for chunk in enc.iterencode(stream):
             out.write(u'%s' % chunk)
 
-    def items_iter(self, limit):
+    def items_iter(self, limit, prefetch=0):
         '''Get an iterator of the 'items' in each page. Instead of a feature
         collection from each page, the iterator yields the features.
 
         :param int limit: The number of 'items' to limit to.
+        :param int prefetch: optional number of pages to fetch in the
+                             background while the current page is consumed
         :return: iter of items in page
         '''
-
-        pages = (page.get() for page in self._pages())
-        items = itertools.chain.from_iterable(
-            (p[self.ITEM_KEY] for p in pages)
-        )
+        items = self._items(self._iter_pages(prefetch))
         if limit is not None:
-            items = itertools.islice(items, limit)
+            items = _limit(items, limit)
         return items
 
-    def _json_stream(self, limit):
+    def _items(self, pages):
+        try:
+            for page in pages:
+                for item in page.get()[self.ITEM_KEY]:
+                    yield item
+        finally:
+            pages.close()
+
+    def _json_stream(self, limit, prefetch=0):
         items = self.get()[self.ITEM_KEY]
         # if there are no results, the GeneratorAdapter doesn't play well
         if len(items):
-            items = GeneratorAdapter(self.items_iter(limit))
+            items = GeneratorAdapter(self.items_iter(limit, prefetch))
         else:
             items = []
         return {
@@ -252,8 +834,8 @@ class Paged(JSON):
 # GeoJSON feature
 class Features(Paged):
 
-    def _json_stream(self, limit):
-        stream = super(Features, self)._json_stream(limit)
+    def _json_stream(self, limit, prefetch=0):
+        stream = super(Features, self)._json_stream(limit, prefetch)
         json_body = self.get()
         # patch back in the count if present
         if 'count' in json_body:
@@ -263,7 +845,21 @@ class Features(Paged):
 
 
 class Items(Features):
-    pass
+
+    def to_columns(self, fields=None, limit=None, prefetch=0):
+        '''Read the items of all pages into a NumPy structured array. This
+        requires the optional `numpy` dependency.
+
+        :param fields: sequence of property names or (name, dtype) pairs,
+                       see :py:func:`planet.api.columns.to_columns`
+        :param int limit: The number of items to limit to.
+        :param int prefetch: optional number of pages to fetch in the
+                             background
+        :returns: :py:class:`numpy.ndarray`
+        '''
+        from . import columns
+        return columns.to_columns(self.items_iter(limit, prefetch),
+                                  fields or columns.DEFAULT_FIELDS)
 
 
 class Searches(Paged):
@@ -283,15 +879,13 @@ class AnalyticsPaged(Paged):
     NEXT_KEY = 'next'
     ITEM_KEY = 'data'
 
-    def next(self):
+    def _next_url(self):
         links = self.get()[self.LINKS_KEY]
         next_ = None
         for link in links:
             if link['rel'] == self.NEXT_KEY:
                 next_ = link['href']
-        if next_:
-            request = Request(next_, self._request.auth, body_type=type(self))
-            return self._dispatcher.response(request).get_body()
+        return next_
 
 
 # The analytics API returns two conceptual types of objects: WFS3-compliant
@@ -0,0 +1,179 @@
+# Copyright 2021 Planet Labs, Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+'''Retry policies for requests made by the dispatcher.'''
+
+import calendar
+import email.utils
+import logging
+import random
+import threading
+import time
+
+from requests.exceptions import ConnectionError
+from requests.exceptions import Timeout
+
+from .exceptions import TooManyRequests
+
+log = logging.getLogger(__name__)
+
+IDEMPOTENT_METHODS = frozenset(['GET', 'HEAD', 'PUT', 'DELETE', 'OPTIONS'])
+RETRY_STATUS = frozenset([500, 502, 503, 504])
+
+
+def parse_retry_after(value, now=None):
+    '''Parse a Retry-After header value, either delay-seconds or an HTTP-date,
+    into a number of seconds to wait.
+
+    >>> from planet.api.retry import parse_retry_after
+    >>> parse_retry_after('3')
+    3.0
+    >>> parse_retry_after('Wed, 21 Oct 2015 07:28:05 GMT',
+    ...                   now=1445412480)
+    5.0
+    >>> parse_retry_after('soon') is None
+    True
+
+    :returns: seconds (float) or None if the value cannot be understood
+    '''
+    if not value:
+        return None
+    value = value.strip()
+    if value.isdigit():
+        return float(value)
+    parsed = email.utils.parsedate_tz(value)
+    if parsed is None:
+        return None
+    when = calendar.timegm(parsed[:9]) - (parsed[9] or 0)
+    now = time.time() if now is None else now
+    return max(0., float(when - now))
+
+
+class RetryPolicy(object):
+    '''A RetryPolicy decides whether a failed request should be attempted
+    again and how long to wait beforehand.
+
+    Throttled requests (HTTP 429 that are not over quota) are always retried.
+    Idempotent requests are also retried on 5xx responses, connection errors
+    and timeouts. The wait honors any ``Retry-After`` header provided by the
+    server and otherwise uses exponential backoff with decorrelated jitter
+    so concurrent clients do not retry in lock-step.
+
+    The policy records timing for every attempt, see :py:meth:`stats`.
+
+    :param int max_attempts: The total number of attempts before giving up
+    :param float base: The minimum backoff in seconds
+    :param float cap: The maximum backoff in seconds
+    '''
+
+    # exception types considered to be connection failures
+    connection_errors = (ConnectionError, Timeout)
+    # the subset of connection failures that are timeouts
+    timeout_errors = (Timeout,)
+
+    def __init__(self, max_attempts=5, base=.5, cap=30., rand=None):
+        self.max_attempts = max_attempts
+        self.base = base
+        self.cap = cap
+        self._random = rand or random.Random()
+        self._lock = threading.Lock()
+        self._stats = {
+            'attempts': 0,
+            'retries': 0,
+            'failures': 0,
+            'request_time': 0.,
+            'retry_wait': {},
+        }
+
+    def reason(self, request, response=None, error=None):
+        '''Classify a failure as retryable.
+
+        :returns: a short reason string or None if not retryable
+        '''
+        if isinstance(error, TooManyRequests):
+            return 'throttled'
+        if request.method.upper() not in IDEMPOTENT_METHODS:
+            return None
+        if isinstance(error, self.timeout_errors):
+            return 'timeout'
+        if isinstance(error, self.connection_errors):
+            return 'connection'
+        status = getattr(response, 'status_code', None)
+        if status in RETRY_STATUS:
+            return 'server'
+        return None
+
+    def backoff(self, last_wait):
+        '''Decorrelated jitter: a random wait between the base and three
+        times the previous wait, capped.'''
+        upper = max(self.base, last_wait * 3)
+        return min(self.cap, self._random.uniform(self.base, upper))
+
+    def get_wait(self, request, attempt, last_wait, response=None,
+                 error=None):
+        '''Determine how long to wait before the next attempt.
+
+        :param request: The :py:class:`planet.api.models.Request`
+        :param int attempt: The number of the attempt that failed (from 1)
+        :param float last_wait: The previous wait in seconds (0 initially)
+        :param response: The HTTP response, if any
+        :param error: The exception raised by the attempt
+        :returns: a (wait, reason) tuple, wait is None to give up
+        '''
+        reason = self.reason(request, response, error)
+        if reason is None or attempt >= self.max_attempts:
+            return None, reason
+        wait = None
+        if response is not None:
+            wait = parse_retry_after(response.headers.get('Retry-After'))
+        if wait is None:
+            wait = self.backoff(last_wait)
+        return min(wait, self.cap), reason
+
+    def record(self, request, attempt, elapsed, wait=None, reason=None,
+               failed=False):
+        '''Record the timing of an attempt.
+
+        :param float elapsed: Seconds spent making the request
+        :param float wait: Seconds waited before retrying, if retrying
+        :param str reason: The retry reason, if retrying
+        :param bool failed: True if the request ultimately failed
+        '''
+        log.debug('%s %s attempt %d took %.03f%s', request.method,
+                  request.url, attempt, elapsed,
+                  ', retrying (%s) in %.03f' % (reason, wait)
+                  if wait is not None else '')
+        with self._lock:
+            stats = self._stats
+            stats['attempts'] += 1
+            stats['request_time'] += elapsed
+            if failed:
+                stats['failures'] += 1
+            if wait is not None:
+                stats['retries'] += 1
+                waits = stats['retry_wait']
+                waits[reason] = waits.get(reason, 0.) + wait
+
+    def stats(self):
+        '''Get a dict of the recorded statistics:
+
+        - attempts: `int` total number of attempts made
+        - retries: `int` number of attempts that were retried
+        - failures: `int` number of requests that failed after retrying
+        - request_time: `float` seconds spent in all attempts
+        - retry_wait: `dict` of retry reason to seconds spent waiting
+        '''
+        with self._lock:
+            stats = dict(self._stats)
+            stats['retry_wait'] = dict(stats['retry_wait'])
+            return stats
@@ -0,0 +1,328 @@
+# Copyright 2021 Planet Labs, Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+'''Parallel searches split into `acquired` time ranges.
+
+Search results are paged with a cursor so a single search can only be read
+one page at a time. A large search can instead be split into shards, each
+covering part of the `acquired` range, that are read concurrently. Shard
+boundaries are chosen from a stats histogram so that each shard has about
+the same number of items.
+
+Each search returns its items in the order given by its `sort` so the items of
+several searches can also be merged in that order, see
+:py:func:`merge_sorted`.
+'''
+
+import collections
+import heapq
+import itertools
+import json
+import logging
+import threading
+
+from . import filters
+from .models import _limit
+from .utils import GeneratorAdapter
+
+try:
+    import Queue as queue
+except ImportError:
+    # renamed in 3
+    import queue
+
+log = logging.getLogger(__name__)
+
+# the number of recent item ids checked for duplicates. The shards do not
+# overlap so an item is only seen twice if it is returned on both sides of a
+# boundary, which happens close together when merging in order.
+DEDUPE_SIZE = 10000
+
+
+def shard_boundaries(buckets, shards):
+    '''Choose the times splitting a stats histogram into `shards` ranges with
+    about the same number of items. Fewer boundaries are returned if the
+    histogram is too coarse.
+
+    >>> from planet.api.sharding import shard_boundaries
+    >>> buckets = [{'start_time': '2020-0%d-01T00:00:00.000000Z' % m,
+    ...             'count': c} for m, c in enumerate([10, 30, 20, 40], 1)]
+    >>> shard_boundaries(buckets, 2)
+    ['2020-03-01T00:00:00.000000Z']
+    >>> shard_boundaries(buckets, 4)
+    ['2020-02-01T00:00:00.000000Z', '2020-03-01T00:00:00.000000Z', \
+'2020-04-01T00:00:00.000000Z']
+
+    :param buckets: The 'buckets' of a stats response
+    :param int shards: The desired number of shards
+    :returns: list of ISO-8601 times, each the start of a shard after the
+              first
+    '''
+    buckets = sorted(buckets, key=lambda b: b['start_time'])
+    total = sum(b['count'] for b in buckets)
+    boundaries = []
+    seen = 0
+    for bucket in buckets:
+        # start a shard at the bucket if the shards before it are closer
+        # to full without the bucket than with it
+        target = total * (len(boundaries) + 1) / float(shards)
+        if seen and seen + bucket['count'] / 2. >= target and \
+                len(boundaries) < shards - 1:
+            boundaries.append(bucket['start_time'])
+        seen += bucket['count']
+    return boundaries
+
+
+def shard_requests(request, boundaries):
+    '''Split a search request into one request per range between
+    `boundaries`. The first and last shards are open ended so together they
+    match the same items as the request.
+
+    :param request: see :ref:`api-search-request`
+    :param boundaries: sorted ISO-8601 times
+    :returns: list of requests
+    '''
+    edges = [None] + list(boundaries) + [None]
+    shards = []
+    for start, end in zip(edges[:-1], edges[1:]):
+        bounds = {}
+        if start:
+            bounds['gte'] = start
+        if end:
+            bounds['lt'] = end
+        shard = dict(request)
+        if bounds:
+            shard['filter'] = filters.and_filter(
+                request['filter'], filters.date_range('acquired', **bounds))
+        shards.append(shard)
+    return shards
+
+
+class _Descending(object):
+    '''Wrap a value to reverse its ordering.'''
+    __slots__ = ('value',)
+
+    def __init__(self, value):
+        self.value = value
+
+    def __lt__(self, other):
+        return other.value < self.value
+
+    def __eq__(self, other):
+        return self.value == other.value
+
+
+def sort_key(sort):
+    '''Get a function returning the key that orders items as the API does
+    for a sort specification. Items without the field are ordered last.
+
+    >>> from planet.api.sharding import sort_key
+    >>> key = sort_key('acquired desc')
+    >>> items = [{'properties': {'acquired': a}} for a in ('2019', '2020')]
+    >>> [i['properties']['acquired'] for i in sorted(items, key=key)]
+    ['2020', '2019']
+
+    :param sort: A `field asc|desc` str, as for the `sort` option of
+                 :py:meth:`planet.api.ClientV1.quick_search`, or a
+                 (field, order) pair
+    :returns: function of an item
+    '''
+    field, order = sort.split() if hasattr(sort, 'split') else sort
+    if order not in ('asc', 'desc'):
+        raise ValueError('invalid sort order: %s' % order)
+    wrap = _Descending if order == 'desc' else lambda v: v
+
+    def key(item):
+        value = item.get('properties', {}).get(field)
+        if value is None:
+            return (True, None)
+        return (False, wrap(value))
+    return key
+
+
+def merge_sorted(streams, sort):
+    '''Merge iterators of items, each already in `sort` order, into one
+    iterator in `sort` order. Only the next item of each iterator is held in
+    memory. The iterators are closed when the merged iterator is.
+
+    :param streams: sequence of item iterators, e.g. from
+                    :py:meth:`planet.api.models.Paged.items_iter`
+    :param sort: The sort specification, see :py:func:`sort_key`
+    :returns: iter of items
+    '''
+    key = sort_key(sort)
+    streams = [iter(s) for s in streams]
+    heap = []
+    try:
+        for index, stream in enumerate(streams):
+            for item in stream:
+                heap.append((key(item), index, item))
+                break
+        heapq.heapify(heap)
+        while heap:
+            _, index, item = heap[0]
+            yield item
+            for item in streams[index]:
+                heapq.heapreplace(heap, (key(item), index, item))
+                break
+            else:
+                heapq.heappop(heap)
+    finally:
+        for stream in streams:
+            close = getattr(stream, 'close', None)
+            if close:
+                close()
+
+
+class _RecentIds(object):
+    '''The last `size` ids added.'''
+
+    def __init__(self, size):
+        self._size = size
+        self._ids = collections.OrderedDict()
+
+    def add(self, id):
+        '''Add an id, returning False if it is one of the last added.'''
+        if id in self._ids:
+            return False
+        self._ids[id] = None
+        if len(self._ids) > self._size:
+            self._ids.popitem(last=False)
+        return True
+
+    def __len__(self):
+        return len(self._ids)
+
+
+class ShardedItems(object):
+    '''The items of several searches read concurrently and merged into one
+    stream, without duplicates. If `sort` is provided the items are merged in
+    that order, which must be the order of each search, otherwise items are
+    produced in no particular order.
+
+    Duplicates are only looked for among the last :py:data:`DEDUPE_SIZE`
+    items, so memory use does not grow with the number of items.
+
+    Iterating more than once runs the searches again.
+
+    :param searches: sequence of functions that each return
+                     :py:class:`planet.api.models.Items`
+    :param int buffer: The maximum number of items read ahead of the consumer
+                       when not sorted
+    :param sort: optional sort specification, see :py:func:`sort_key`
+    '''
+
+    def __init__(self, searches, buffer=1000, sort=None):
+        self._searches = list(searches)
+        self._buffer = buffer
+        self._sort = sort
+
+    def _run(self, search, items, stop, prefetch):
+        def put(value):
+            while not stop.is_set():
+                try:
+                    items.put(value, timeout=.1)
+                    return True
+                except queue.Full:
+                    pass
+            return False
+
+        try:
+            it = search().items_iter(None, prefetch=prefetch)
+            try:
+                for item in it:
+                    if not put(item):
+                        return
+            finally:
+                it.close()
+        except Exception as ex:
+            log.debug('search failed: %s', ex)
+            put(ex)
+        finally:
+            # None marks the end of this search
+            put(None)
+
+    def _merged(self, prefetch):
+        items = queue.Queue(self._buffer)
+        stop = threading.Event()
+        for search in self._searches:
+            thread = threading.Thread(target=self._run,
+                                      args=(search, items, stop, prefetch))
+            thread.daemon = True
+            thread.start()
+        running = len(self._searches)
+        seen = _RecentIds(DEDUPE_SIZE)
+        try:
+            while running:
+                item = items.get()
+                if item is None:
+                    running -= 1
+                elif isinstance(item, Exception):
+                    raise item
+                elif seen.add(item['id']):
+                    yield item
+        finally:
+            stop.set()
+
+    def _ordered(self, prefetch):
+        # each search reads ahead only by prefetching its pages
+        streams = [search().items_iter(None, prefetch=prefetch)
+                   for search in self._searches]
+        merged = merge_sorted(streams, self._sort)
+        seen = _RecentIds(DEDUPE_SIZE)
+        try:
+            for item in merged:
+                if seen.add(item['id']):
+                    yield item
+        finally:
+            merged.close()
+
+    def items_iter(self, limit, prefetch=0):
+        '''Get an iterator of the items of all searches.
+
+        :param int limit: The number of items to limit to.
+        :param int prefetch: optional number of pages each search fetches in
+                             the background
+        :return: iter of items
+        '''
+        if self._sort:
+            items = self._ordered(prefetch)
+        else:
+            items = self._merged(prefetch)
+        if limit is not None:
+            items = _limit(items, limit)
+        return items
+
+    def json_encode(self, out, limit=None, sort_keys=False, indent=None,
+                    prefetch=0):
+        '''Encode the items as a GeoJSON FeatureCollection writing to the
+        provided file-like `out` object. See
+        :py:meth:`planet.api.models.Paged.json_encode`.'''
+        items = self.items_iter(limit, prefetch)
+        # an empty GeneratorAdapter would not encode as a list
+        try:
+            features = GeneratorAdapter(
+                itertools.chain([next(items)], items))
+        except StopIteration:
+            features = []
+        stream = {'type': 'FeatureCollection', 'features': features}
+        enc = json.JSONEncoder(indent=indent, sort_keys=sort_keys)
+        for chunk in enc.iterencode(stream):
+            out.write(u'%s' % chunk)
+
+    def to_columns(self, fields=None, limit=None, prefetch=0):
+        '''Read the items into a NumPy structured array. See
+        :py:meth:`planet.api.models.Items.to_columns`.'''
+        from . import columns
+        return columns.to_columns(self.items_iter(limit, prefetch),
+                                  fields or columns.DEFAULT_FIELDS)
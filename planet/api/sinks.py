@@ -0,0 +1,339 @@
+# Copyright 2021 Planet Labs, Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+'''Sinks stream items to a binary file in other formats than a GeoJSON
+FeatureCollection. Items are written a batch at a time so memory use does not
+grow with the number of items::
+
+    with open_sink('csv', out, fields=['id', 'acquired']) as sink:
+        sink.write(client.quick_search(request).items_iter(None))
+
+The Parquet and Arrow sinks require the optional `pyarrow` dependency
+(``pip install planet[arrow]``) and zstd compression requires the optional
+`zstandard` dependency (``pip install planet[zstd]``).
+'''
+
+import csv
+import gzip
+import io
+import itertools
+import json
+import numbers
+import sys
+
+from .models import orjson
+
+#: The formats supported by :py:func:`open_sink`
+FORMATS = ('ndjson', 'csv', 'parquet', 'arrow')
+
+#: The compressions supported by the text formats
+COMPRESSIONS = ('gzip', 'zstd')
+
+#: The column of the Parquet and Arrow formats holding properties that do
+#: not fit the other columns
+OTHER_FIELD = 'other_properties'
+
+# number of items written at once, each batch is a row group when the format
+# has them
+BATCH_SIZE = 1000
+
+PY2 = sys.version_info[0] == 2
+text_type = type(u'')
+
+
+def _value(item, field):
+    if field == 'id':
+        return item['id']
+    if field == 'geometry':
+        return item.get('geometry')
+    return item.get('properties', {}).get(field)
+
+
+def _fields(items):
+    '''Infer the fields of a batch: 'id' and each property, sorted.'''
+    props = set()
+    for item in items:
+        props.update(item.get('properties', {}))
+    return ['id'] + sorted(props)
+
+
+def _json(value):
+    return json.dumps(value, separators=(',', ':'))
+
+
+class _Compressed(object):
+    '''Compress writes to a binary file without closing it.'''
+
+    def __init__(self, out, compression):
+        if compression == 'gzip':
+            self._writer = gzip.GzipFile(fileobj=out, mode='wb')
+            self._finish = self._writer.close
+        elif compression == 'zstd':
+            try:
+                import zstandard
+            except ImportError:
+                raise ImportError('zstd compression requires zstandard')
+            self._writer = zstandard.ZstdCompressor().stream_writer(out)
+            self._finish = lambda: self._writer.flush(zstandard.FLUSH_FRAME)
+        else:
+            raise ValueError('unsupported compression: %s' % compression)
+
+    def write(self, data):
+        self._writer.write(data)
+
+    def flush(self):
+        pass
+
+    def close(self):
+        self._finish()
+
+
+class Sink(object):
+    '''Write items to a binary file.
+
+    :param out: A binary file-like object
+    '''
+
+    def __init__(self, out):
+        self._out = out
+
+    def write(self, items):
+        '''Write all items, a batch at a time.
+
+        :param items: iter of items
+        '''
+        items = iter(items)
+        while True:
+            batch = list(itertools.islice(items, BATCH_SIZE))
+            if not batch:
+                break
+            self.write_batch(batch)
+
+    def write_batch(self, items):
+        '''Write a list of items.'''
+        raise NotImplementedError()
+
+    def close(self):
+        '''Finish writing. The file is not closed.'''
+        pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+
+class _TextSink(Sink):
+
+    def __init__(self, out, compression=None):
+        if compression:
+            out = _Compressed(out, compression)
+        super(_TextSink, self).__init__(out)
+
+    def close(self):
+        if isinstance(self._out, _Compressed):
+            self._out.close()
+        else:
+            self._out.flush()
+
+
+class NDJSONSink(_TextSink):
+    '''Write items as newline delimited JSON.
+
+    :param out: A binary file-like object
+    :param str compression: optional 'gzip' or 'zstd'
+    '''
+
+    def write_batch(self, items):
+        if orjson is not None:
+            lines = [orjson.dumps(item) for item in items]
+        else:
+            lines = [_json(item).encode('utf-8') for item in items]
+        lines.append(b'')
+        self._out.write(b'\n'.join(lines))
+
+
+class CSVSink(_TextSink):
+    '''Write items as CSV with a header row. Values that are not strings or
+    numbers are written as JSON.
+
+    :param out: A binary file-like object
+    :param fields: optional sequence of 'id', 'geometry' or property names,
+                   defaults to 'id' and the properties of the first items
+    :param str compression: optional 'gzip' or 'zstd'
+    '''
+
+    def __init__(self, out, fields=None, compression=None):
+        super(CSVSink, self).__init__(out, compression)
+        self._fields = fields
+        self._header = True
+
+    def _cell(self, value):
+        if value is None:
+            return ''
+        if isinstance(value, (dict, list, bool)):
+            value = _json(value)
+        if PY2 and isinstance(value, text_type):
+            value = value.encode('utf-8')
+        return value
+
+    def write_batch(self, items):
+        if self._fields is None:
+            self._fields = _fields(items)
+        buf = io.BytesIO() if PY2 else io.StringIO(newline='')
+        writer = csv.writer(buf, lineterminator='\n')
+        if self._header:
+            writer.writerow([self._cell(f) for f in self._fields])
+            self._header = False
+        writer.writerows([self._cell(_value(item, f)) for f in self._fields]
+                         for item in items)
+        data = buf.getvalue()
+        self._out.write(data if PY2 else data.encode('utf-8'))
+
+
+class ArrowSink(Sink):
+    '''Write items as a Parquet or Arrow IPC file, one row group or record
+    batch per batch of items. Numeric properties are written as doubles,
+    booleans as booleans and other values as strings, JSON encoded if not
+    strings. The geometry is written as GeoJSON.
+
+    The type of each column is that of its values in the first items. With
+    the default fields, properties without a column, or with a value of
+    another type than their column, are written as a JSON object in the
+    :py:data:`OTHER_FIELD` column. Otherwise such values are written as
+    nulls.
+
+    :param out: A binary file-like object
+    :param fields: optional sequence of 'id', 'geometry' or property names,
+                   defaults to 'id', the properties of the first items and
+                   'geometry'
+    :param str format: 'parquet' or 'arrow'
+    '''
+
+    def __init__(self, out, fields=None, format='parquet'):
+        try:
+            import pyarrow
+        except ImportError:
+            raise ImportError('%s output requires pyarrow' % format)
+        if format not in ('parquet', 'arrow'):
+            raise ValueError('unsupported format: %s' % format)
+        super(ArrowSink, self).__init__(out)
+        self._pa = pyarrow
+        self._format = format
+        self._fields = fields
+        self._other = False
+        self._schema = None
+        self._writer = None
+
+    def _type(self, values):
+        pa = self._pa
+        for value in values:
+            if isinstance(value, bool):
+                return pa.bool_()
+            if isinstance(value, (int, float)):
+                return pa.float64()
+            if value is not None:
+                break
+        return pa.string()
+
+    def _fits(self, value, kind):
+        pa = self._pa
+        if value is None or kind == pa.string():
+            return True
+        if kind == pa.bool_():
+            return isinstance(value, bool)
+        return isinstance(value, numbers.Real) and \
+            not isinstance(value, bool)
+
+    def _array(self, values, kind):
+        pa = self._pa
+        if kind == pa.float64():
+            values = [None if v is None else float(v) for v in values]
+        elif kind == pa.string():
+            values = [v if v is None or isinstance(v, text_type) else
+                      _json(v) for v in values]
+        return pa.array(values, type=kind)
+
+    def _open(self, columns):
+        pa = self._pa
+        fields = [(f, self._type(values)) for f, values in columns]
+        if self._other:
+            fields.append((OTHER_FIELD, pa.string()))
+        self._schema = pa.schema(fields)
+        if self._format == 'parquet':
+            import pyarrow.parquet as pq
+            self._writer = pq.ParquetWriter(self._out, self._schema)
+        else:
+            self._writer = pa.ipc.new_file(self._out, self._schema)
+
+    def write_batch(self, items):
+        if self._fields is None:
+            self._fields = _fields(items) + ['geometry']
+            self._other = True
+        columns = [(f, [_value(item, f) for item in items])
+                   for f in self._fields]
+        if self._writer is None:
+            self._open(columns)
+        # the properties of each item that do not fit the columns
+        others = [{} for _ in items]
+        arrays = []
+        for (f, values), field in zip(columns, self._schema):
+            for i, value in enumerate(values):
+                if not self._fits(value, field.type):
+                    others[i][f] = value
+                    values[i] = None
+            arrays.append(self._array(values, field.type))
+        if self._other:
+            known = set(self._fields)
+            for item, other in zip(items, others):
+                for name, value in item.get('properties', {}).items():
+                    if name not in known:
+                        other[name] = value
+            arrays.append(self._array([other or None for other in others],
+                                      self._pa.string()))
+        batch = self._pa.RecordBatch.from_arrays(arrays, self._schema.names)
+        if self._format == 'parquet':
+            self._writer.write_table(self._pa.Table.from_batches([batch]))
+        else:
+            self._writer.write_batch(batch)
+
+    def close(self):
+        if self._writer is not None:
+            self._writer.close()
+
+
+def open_sink(format, out, fields=None, compression=None):
+    '''Get a sink for a format.
+
+    :param str format: One of :py:data:`FORMATS`
+    :param out: A binary file-like object
+    :param fields: optional sequence of fields for the csv, parquet and arrow
+                   formats
+    :param str compression: optional compression for the ndjson and csv
+                            formats, one of :py:data:`COMPRESSIONS`
+    :returns: :py:class:`Sink`
+    :raises ValueError: if the options are not supported by the format
+    :raises ImportError: if an optional dependency is missing
+    '''
+    if format not in FORMATS:
+        raise ValueError('unsupported format: %s' % format)
+    if compression and format not in ('ndjson', 'csv'):
+        raise ValueError('%s output cannot be compressed' % format)
+    if fields and format == 'ndjson':
+        raise ValueError('ndjson output includes all fields')
+    if format == 'ndjson':
+        return NDJSONSink(out, compression)
+    if format == 'csv':
+        return CSVSink(out, fields, compression)
+    return ArrowSink(out, fields, format)
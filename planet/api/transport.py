@@ -0,0 +1,245 @@
+# Copyright 2021 Planet Labs, Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+'''Transports send the API requests made by the
+:py:class:`planet.api.dispatch.RequestsDispatcher`.
+
+The default :py:class:`RequestsTransport` uses the dispatcher's requests
+session. :py:class:`Urllib3Transport` sends requests directly with urllib3,
+avoiding the per-request overhead of requests (hooks, cookie merging and
+proxy lookup), which is noticeable when making many small metadata
+requests. It uses the proxies of the environment, looked up once per host,
+follows redirects like the requests session and verifies certificates
+unless `DISABLE_STRICT_SSL` is set::
+
+    client = ClientV1()
+    client.dispatcher.transport = Urllib3Transport()
+
+Transports are only used for API requests. Downloads always use the requests
+session so redirects to storage hosts are handled as described in
+:py:class:`planet.api.dispatch.RedirectSession`.
+'''
+
+import re
+
+import certifi
+from requests import Response
+from requests.compat import urlencode
+from requests.compat import urljoin
+from requests.compat import urlparse
+from requests.exceptions import ConnectionError
+from requests.exceptions import ConnectTimeout
+from requests.exceptions import ReadTimeout
+from requests.exceptions import TooManyRedirects
+from requests.structures import CaseInsensitiveDict
+from requests.utils import get_auth_from_url
+from requests.utils import get_encoding_from_headers
+from requests.utils import getproxies
+from requests.utils import should_bypass_proxies
+import urllib3
+from urllib3 import exceptions as urllib3_exceptions
+
+_REDIRECT_STATUS = frozenset([301, 302, 303, 307, 308])
+
+
+class Transport(object):
+    '''The interface of a transport.'''
+
+    def request(self, method, url, params=None, data=None, headers=None,
+                timeout=None):
+        '''Send a request, reading the whole response.
+
+        :param str method: The HTTP method
+        :param str url: The URL, without the query parameters
+        :param dict params: Optional query parameters
+        :param data: Optional request body
+        :param dict headers: Request headers, in addition to the transport's
+                             own (e.g. User-Agent)
+        :param timeout: Optional (connect, read) timeout in seconds
+        :returns: :py:class:`requests.Response`
+        :raises requests.exceptions.ConnectionError: on connection failure
+        :raises requests.exceptions.Timeout: on timeout
+        '''
+        raise NotImplementedError()
+
+    def close(self):
+        '''Release any pooled connections.'''
+        pass
+
+
+class RequestsTransport(Transport):
+    '''Send requests with a requests session.
+
+    :param session: The :py:class:`requests.Session`
+    :param verify: Verify TLS certificates
+    '''
+
+    def __init__(self, session, verify=True):
+        self.session = session
+        self.verify = verify
+
+    def request(self, method, url, params=None, data=None, headers=None,
+                timeout=None):
+        return self.session.request(method, url, params=params, data=data,
+                                    headers=headers, timeout=timeout,
+                                    verify=self.verify)
+
+    def close(self):
+        self.session.close()
+
+
+class Urllib3Transport(Transport):
+    '''Send requests directly with a urllib3 pool, reusing precomputed
+    default headers.
+
+    :param int maxsize: The number of connections to keep per host
+    :param str user_agent: The User-Agent header, defaults to that of the
+                           client
+    :param verify: Verify TLS certificates, defaults to
+                   :py:data:`planet.api.dispatch.USE_STRICT_SSL`
+    :param dict proxies: Proxy URLs by scheme, defaults to those of the
+                         environment
+    :param int max_redirects: The number of redirects followed
+    '''
+
+    def __init__(self, maxsize=10, user_agent=None, verify=None,
+                 proxies=None, max_redirects=30):
+        from .dispatch import _get_user_agent
+        from .dispatch import USE_STRICT_SSL
+        if user_agent is None:
+            user_agent = _get_user_agent()
+        if verify is None:
+            verify = USE_STRICT_SSL
+        self._headers = {
+            'User-Agent': user_agent,
+            'Accept': '*/*',
+            'Accept-Encoding': 'gzip, deflate',
+        }
+        if verify:
+            self._pool_kw = dict(maxsize=maxsize, cert_reqs='CERT_REQUIRED',
+                                 ca_certs=certifi.where())
+        else:
+            self._pool_kw = dict(maxsize=maxsize, cert_reqs='CERT_NONE')
+        self._pool = urllib3.PoolManager(**self._pool_kw)
+        self._proxies = getproxies() if proxies is None else proxies
+        self.max_redirects = max_redirects
+        # the pool of each proxy, and of each host by scheme and host
+        self._proxy_pools = {}
+        self._hosts = {}
+
+    def _proxy_pool(self, proxy):
+        pool = self._proxy_pools.get(proxy)
+        if pool is None:
+            username, password = get_auth_from_url(proxy)
+            headers = None
+            if username:
+                headers = urllib3.make_headers(
+                    proxy_basic_auth='%s:%s' % (username, password))
+            pool = self._proxy_pools[proxy] = urllib3.ProxyManager(
+                proxy, proxy_headers=headers, **self._pool_kw)
+        return pool
+
+    def _pool_for(self, url):
+        '''The pool, or proxy pool, for a URL.'''
+        parsed = urlparse(url)
+        key = (parsed.scheme, parsed.netloc)
+        pool = self._hosts.get(key)
+        if pool is None:
+            proxy = self._proxies.get(parsed.scheme) or \
+                self._proxies.get('all')
+            if proxy and not should_bypass_proxies(
+                    url, no_proxy=self._proxies.get('no')):
+                pool = self._proxy_pool(proxy)
+            else:
+                pool = self._pool
+            self._hosts[key] = pool
+        return pool
+
+    def request(self, method, url, params=None, data=None, headers=None,
+                timeout=None):
+        if params:
+            url = _add_params(url, params)
+        all_headers = self._headers.copy()
+        all_headers.update(headers or {})
+        if data is not None and not isinstance(data, bytes):
+            data = data.encode('utf-8')
+        if timeout is not None:
+            if not isinstance(timeout, tuple):
+                timeout = (timeout, timeout)
+            timeout = urllib3.Timeout(connect=timeout[0], read=timeout[1])
+        for _ in range(self.max_redirects + 1):
+            raw = self._send(method, url, data, all_headers, timeout)
+            location = raw.headers.get('Location')
+            if raw.status not in _REDIRECT_STATUS or not location:
+                return _response(url, raw)
+            method, url, data, all_headers = _redirect(
+                raw.status, method, url, urljoin(url, location), data,
+                all_headers)
+        raise TooManyRedirects('exceeded %d redirects' % self.max_redirects)
+
+    def _send(self, method, url, data, headers, timeout):
+        try:
+            return self._pool_for(url).request(
+                method, url, body=data, headers=headers, timeout=timeout,
+                retries=False, redirect=False, preload_content=True)
+        except urllib3_exceptions.NewConnectionError as ex:
+            raise ConnectionError(ex)
+        except urllib3_exceptions.ConnectTimeoutError as ex:
+            raise ConnectTimeout(ex)
+        except urllib3_exceptions.ReadTimeoutError as ex:
+            raise ReadTimeout(ex)
+        except urllib3_exceptions.HTTPError as ex:
+            raise ConnectionError(ex)
+
+    def close(self):
+        self._pool.clear()
+        for pool in self._proxy_pools.values():
+            pool.clear()
+
+
+def _add_params(url, params):
+    return '%s%s%s' % (url, '&' if '?' in url else '?',
+                       urlencode(params, doseq=True))
+
+
+def _redirect(status, method, url, redirect, data, headers):
+    '''The request following a redirect, changing the method as requests
+    does and handling authorization as the
+    :py:class:`planet.api.dispatch.RedirectSession` does.'''
+    from .dispatch import _is_subdomain_of_tld
+    if method != 'HEAD' and (status in (302, 303) or
+                             status == 301 and method == 'POST'):
+        method, data = 'GET', None
+        headers = dict(headers)
+        headers.pop('Content-Type', None)
+    auth = headers.get('Authorization')
+    if auth and not _is_subdomain_of_tld(url, redirect):
+        headers = dict(headers)
+        headers.pop('Authorization')
+        key = re.match(r'api-key (\S+)', auth)
+        if key:
+            redirect = _add_params(redirect, {'api_key': key.group(1)})
+    return method, redirect, data, headers
+
+
+def _response(url, raw):
+    resp = Response()
+    resp.status_code = raw.status
+    resp.reason = raw.reason
+    resp.headers = CaseInsensitiveDict(raw.headers)
+    resp.encoding = get_encoding_from_headers(resp.headers)
+    resp.url = url
+    resp.raw = raw
+    resp._content = raw.data
+    resp._content_consumed = True
+    return resp
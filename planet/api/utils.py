@@ -24,6 +24,7 @@ import string
 import threading
 from requests.compat import urlparse
 from ._fatomic import atomic_open
+from .checksums import preferred
 
 _ISO_FMT = '%Y-%m-%dT%H:%M:%S.%f+00:00'
 
@@ -227,7 +228,8 @@ def get_random_filename(content_type=None):
     return name
 
 
-def write_to_file(directory=None, callback=None, overwrite=True):
+def write_to_file(directory=None, callback=None, overwrite=True, segments=1,
+                  resume=False, digests=None, checksums=None):
     '''Create a callback handler for asynchronous Body handling.
 
     If provided, the callback will be invoked as described in
@@ -238,16 +240,43 @@ def write_to_file(directory=None, callback=None, overwrite=True):
     The name of the file written to will be determined from the Body.name
     property.
 
+    A download with expected digests is verified as it is written. With
+    `checksums`, the digests of verified files are recorded and an existing
+    file is only skipped if it has the expected digests.
+
     :param directory str: The optional directory to write to.
     :param callback func: An optional callback to receive notification of
                           write progress.
     :param overwrite bool: Overwrite any existing files. Defaults to True.
+    :param segments int: The number of concurrent range requests used to
+                         write large files. Defaults to 1.
+    :param resume bool: Continue interrupted downloads from their partial
+                        files. Defaults to False.
+    :param digests dict: The optional expected digests of the download,
+                         otherwise those expected by `checksums` are used.
+    :param checksums: An optional
+                      :py:class:`planet.api.checksums.Checksums` of the
+                      directory.
     '''
 
     def writer(body):
         file = os.path.join(directory or '.', body.name)
-        if overwrite or not os.path.exists(file):
-            body.write(file, callback)
+        expected = digests
+        if expected is None and checksums is not None:
+            expected = checksums.expected(body.name)
+        if overwrite or not os.path.exists(file) or \
+                checksums is not None and expected and \
+                not checksums.verified(body.name, expected):
+            opts = {}
+            if segments > 1:
+                opts['segments'] = segments
+            if resume:
+                opts['resume'] = True
+            if expected:
+                opts['digests'] = expected
+            body.write(file, callback, **opts)
+            if checksums is not None and expected:
+                checksums.record(body.name, preferred(expected))
         else:
             if callback:
                 callback(skip=body)
@@ -18,6 +18,7 @@ import sys
 
 from planet import api
 from planet.api.__version__ import __version__
+from planet.api.cache import ResponseCache
 from planet.api.utils import write_planet_json
 from .util import call_and_wrap
 
@@ -56,6 +57,20 @@ def configure_logging(verbosity):
 @click.option('-w', '--workers', default=4,
               help=('The number of concurrent downloads when requesting '
                     'multiple scenes. - Default 4'))
+@click.option('--rate-limit', default=4.0, type=float,
+              help=('The initial average requests per second to each API '
+                    'across all workers, 0 to disable. Cut when throttled '
+                    'and raised again while requests succeed. - Default 4'))
+@click.option('--max-rate', default=None, type=float,
+              help=('The maximum average requests per second to each API. '
+                    '- Default is four times the rate limit'))
+@click.option('--burst', default=None, type=int,
+              help=('The number of requests allowed in a burst above the '
+                    'rate limit. - Default is the rate limit'))
+@click.option('--cache-dir', envvar='PL_CACHE_DIR',
+              type=click.Path(file_okay=False, resolve_path=True),
+              help=('Cache metadata responses in this directory and '
+                    'revalidate them with the API or ENV PL_CACHE_DIR'))
 @click.option('-v', '--verbose', count=True, help='Specify verbosity')
 @click.option('-k', '--api-key',
               help='Valid API key - or via ENV variable %s' % api.auth.ENV_KEY)
@@ -63,7 +78,8 @@ def configure_logging(verbosity):
               help='Change the base Planet API URL or ENV PL_API_BASE_URL'
                    ' - Default https://api.planet.com/')
 @click.version_option(version=__version__, message='%(version)s')
-def cli(context, verbose, api_key, base_url, workers):
+def cli(context, verbose, api_key, base_url, workers, rate_limit, max_rate,
+        burst, cache_dir):
     '''Planet API Client'''
 
     configure_logging(verbose)
@@ -71,8 +87,15 @@ def cli(context, verbose, api_key, base_url, workers):
     client_params.clear()
     client_params['api_key'] = api_key
     client_params['workers'] = workers
+    client_params['rate_limit'] = rate_limit
+    if max_rate:
+        client_params['max_rate'] = max_rate
+    if burst:
+        client_params['burst'] = burst
     if base_url:
         client_params['base_url'] = base_url
+    if cache_dir:
+        client_params['cache'] = ResponseCache(directory=cache_dir)
 
 
 @cli.command('help')
@@ -14,10 +14,13 @@
 
 import click
 
+from planet.api.sinks import COMPRESSIONS
+from planet.api.sinks import FORMATS
 from .types import (
     AssetType,
     AssetTypePerm,
     DateRange,
+    FieldList,
     GeomFilter,
     FilterJSON,
     ItemType,
@@ -113,6 +116,37 @@ ndjson_option = click.option('--ndjson', is_flag=True, help=(
 ))
 
 
+output_format_option = click.option(
+    '--format', 'output_format', default='json',
+    type=click.Choice(('json',) + FORMATS), help=(
+        'Output format, parquet and arrow require pyarrow. - Default json'
+    )
+)
+
+output_fields_option = click.option('--fields', type=FieldList(), help=(
+    'Comma separated fields of csv, parquet or arrow output: id, geometry or '
+    'property names. Default: all properties'
+))
+
+compress_option = click.option(
+    '--compress', type=click.Choice(COMPRESSIONS), help=(
+        'Compress ndjson or csv output'
+    )
+)
+
+
+def output_format_opts(fun):
+    '''Decorator for the output format options of item listings'''
+    return output_format_option(output_fields_option(compress_option(fun)))
+
+
+segments_option = click.option(
+    '--segments', default=1, type=click.IntRange(1), help=(
+        'Download each large file with this many concurrent range '
+        'requests. - Default 1'
+    )
+)
+
 sort_order = click.option(
     '--sort', type=SortSpec(), help=(
         'Specify sort ordering as published/acquired asc/desc'
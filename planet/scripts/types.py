@@ -288,6 +288,16 @@ class SortSpec(CompositeParamType):
         return ' '.join(val)
 
 
+class FieldList(click.ParamType):
+    name = 'field,...'
+
+    def convert(self, val, param, ctx):
+        fields = [f.strip() for f in val.split(',') if f.strip()]
+        if not fields:
+            raise click.BadParameter('no fields specified')
+        return fields
+
+
 class BoundingBox(click.ParamType):
     name = 'bbox'
 
@@ -29,6 +29,7 @@ from click import termui
 
 from planet import api
 from planet.api import filters
+from planet.api import sinks
 
 
 def _split(value):
@@ -159,6 +160,10 @@ def click_exception(ex):
     raise click.ClickException(msg)
 
 
+# pages of results fetched ahead while writing paged responses
+PAGE_PREFETCH = 2
+
+
 def echo_json_response(response, pretty, limit=None, ndjson=False):
     '''Wrapper to echo JSON with optional 'pretty' printing. If pretty is not
     provided explicity and stdout is a terminal (and not redirected or piped),
@@ -172,12 +177,13 @@ def echo_json_response(response, pretty, limit=None, ndjson=False):
         nl = True
     try:
         if ndjson and hasattr(response, 'items_iter'):
-            items = response.items_iter(limit)
+            items = response.items_iter(limit, prefetch=PAGE_PREFETCH)
             for item in items:
                 click.echo(json.dumps(item))
         elif not ndjson and hasattr(response, 'json_encode'):
             response.json_encode(click.get_text_stream('stdout'), limit=limit,
-                                 indent=indent, sort_keys=sort_keys)
+                                 indent=indent, sort_keys=sort_keys,
+                                 prefetch=PAGE_PREFETCH)
         else:
             res = response.get_raw()
             if len(res) == 0:  # if the body is empty, just return the status
@@ -193,6 +199,24 @@ def echo_json_response(response, pretty, limit=None, ndjson=False):
         raise click.ClickException(str(ioe))
 
 
+def echo_items_response(response, output_format, limit=None, fields=None,
+                        compression=None):
+    '''Write the items of a paged response to stdout in one of the formats of
+    :py:func:`planet.api.sinks.open_sink`.'''
+    try:
+        sink = sinks.open_sink(output_format,
+                               click.get_binary_stream('stdout'),
+                               fields=fields, compression=compression)
+    except (ImportError, ValueError) as ex:
+        raise click.UsageError(str(ex))
+    try:
+        with sink:
+            sink.write(response.items_iter(limit, prefetch=PAGE_PREFETCH))
+    except IOError as ioe:
+        # hide scary looking broken pipe stack traces
+        raise click.ClickException(str(ioe))
+
+
 def read(value, split=False):
     '''Get the value of an option interpreting as a file implicitly or
     explicitly and falling back to the value if not explicitly specified.
@@ -27,8 +27,10 @@ from .opts import (
     asset_type_perms,
     filter_opts,
     limit_option,
+    output_format_opts,
     pretty,
     search_request_opts,
+    segments_option,
     sort_order
 )
 from .types import (
@@ -46,6 +48,7 @@ from .util import (
     click_exception,
     filter_from_opts,
     downloader_output,
+    echo_items_response,
     echo_json_response,
     read,
     search_req_from_opts,
@@ -56,6 +59,7 @@ from planet.api.utils import (
     handle_interrupt
 )
 from planet.api import downloader
+from planet.api.journal import Journal
 from planet.api.utils import write_to_file
 
 filter_opts_epilog = '\nFilter Formats:\n\n' + \
@@ -91,14 +95,28 @@ def filter_dump(**kw):
 @pretty
 @asset_type_perms
 @search_request_opts
-def quick_search(limit, pretty, sort, **kw):
+@click.option('--shards', default=1, type=click.IntRange(1),
+              help=('Split the search into this many concurrent searches '
+                    'by acquired date. Results are only ordered with '
+                    '--sort. - Default 1'))
+@output_format_opts
+def quick_search(limit, pretty, sort, shards, output_format, fields,
+                 compress, **kw):
     '''Execute a quick search.'''
     req = search_req_from_opts(**kw)
     cl = clientv1()
     page_size = min(limit, MAX_PAGE_SIZE)
-    echo_json_response(call_and_wrap(
-        cl.quick_search, req, page_size=page_size, sort=sort
-    ), pretty, limit)
+    if shards > 1:
+        response = call_and_wrap(cl.sharded_search, req, shards,
+                                 page_size=page_size, sort=sort)
+    else:
+        response = call_and_wrap(cl.quick_search, req, page_size=page_size,
+                                 sort=sort)
+    if output_format == 'json':
+        echo_json_response(response, pretty, limit)
+    else:
+        echo_items_response(response, output_format, limit, fields,
+                            compress)
 
 
 @data.command('create-search', epilog=filter_opts_epilog)
@@ -162,6 +180,15 @@ def _disable_item_type(ctx, param, value):
     return value
 
 
+def _disable_job_opts(ctx, param, value):
+    # a resumed job has the options of the journaled job
+    if value:
+        for p in ctx.command.params:
+            if p.name in ('item_type', 'asset_type'):
+                p.required = False
+    return value
+
+
 @asset_type_option
 @search_request_opts
 @click.option('--search-id', is_eager=True, callback=_disable_item_type,
@@ -179,20 +206,47 @@ def _disable_item_type(ctx, param, value):
     'Location to download files to'), type=click.Path(
     exists=True, resolve_path=True, writable=True, file_okay=False))
 @limit_option(None)
+@segments_option
+@click.option('--journal', type=click.Path(dir_okay=False, writable=True),
+              help=('Record the progress of the download in this file so it '
+                    'can be resumed with --resume'))
+@click.option('--resume', is_eager=True, callback=_disable_job_opts,
+              type=click.Path(exists=True, dir_okay=False), help=(
+                  'Resume the download recorded in this journal file'))
+@click.option('--activation-estimates',
+              type=click.Path(dir_okay=False, writable=True), help=(
+                  'Learn activation times across runs in this file to '
+                  'schedule status polls, e.g. %s' %
+                  downloader.ESTIMATES_FILE))
 @data.command('download', epilog=filter_opts_epilog)
 def download(asset_type, dest, limit, sort, search_id, dry_run, activate_only,
-             quiet, **kw):
+             quiet, segments, journal, resume, activation_estimates, **kw):
     '''Activate and download'''
     cl = clientv1()
     page_size = min(limit or MAX_PAGE_SIZE, MAX_PAGE_SIZE)
     asset_type = list(chain.from_iterable(asset_type))
+    job = None
+    if resume:
+        # the journal has the job's search, limit and options
+        if journal or search_id or dry_run or activate_only or sort or \
+                limit is not None or asset_type or any(kw[s] for s in kw):
+            raise click.ClickException(
+                'search and job options not supported with resume')
+        job = Journal(resume)
+        try:
+            opts = job.job()
+        except ValueError as ex:
+            raise click.ClickException(str(ex))
+        asset_type, dest = opts['asset_types'], opts['dest']
     # even though we're using functionality from click.Path, this was needed
     # to detect inability to write on Windows in a read-only vagrant mount...
     # @todo check/report upstream
     if not activate_only and not check_writable(dest):
         raise click.ClickException(
             'download destination "%s" is not writable' % dest)
-    if search_id:
+    if resume:
+        search = None
+    elif search_id:
         if dry_run:
             raise click.ClickException(
                 'dry-run not supported with saved search')
@@ -216,23 +270,47 @@ def download(asset_type, dest, limit, sort, search_id, dry_run, activate_only,
             return
         else:
             search, search_arg = cl.quick_search, req
+    if journal:
+        if activate_only:
+            raise click.ClickException(
+                'activate-only not supported with journal')
+        job = Journal(journal)
+        try:
+            job.begin(asset_type, dest, limit)
+        except ValueError as ex:
+            raise click.ClickException(
+                '%s, use --resume to continue it' % ex)
 
-    dl = downloader.create(cl)
+    # activation times are only learned across runs if asked to
+    estimates = downloader.ActivationEstimates(activation_estimates)
+    dl = downloader.create(cl, segments=segments, estimates=estimates,
+                           journal=job)
     output = downloader_output(dl, disable_ansi=quiet)
     # delay initial item search until downloader output initialized
     output.start()
     try:
-        items = search(search_arg, page_size=page_size, sort=sort)
+        if search is not None:
+            items = search(search_arg, page_size=page_size, sort=sort)
     except Exception as ex:
         output.cancel()
         click_exception(ex)
+    if resume:
+        items = job.resume(cl)
+    elif job:
+        items = job.record(items)
+    else:
+        items = items.items_iter(limit)
     func = dl.activate if activate_only else dl.download
-    args = [items.items_iter(limit), asset_type]
+    args = [items, asset_type]
     if not activate_only:
         args.append(dest)
     # invoke the function within an interrupt handler that will shut everything
     # down properly
-    handle_interrupt(dl.shutdown, func, *args)
+    try:
+        handle_interrupt(dl.shutdown, func, *args)
+    finally:
+        if job:
+            job.close()
 
 
 @cli.group('mosaics')
@@ -339,12 +417,13 @@ def quad_contributions(name, quad, pretty):
     exists=True, resolve_path=True, writable=True, file_okay=False
 ))
 @limit_option(None)
-def download_quads(name, bbox, rbox, quiet, dest, limit):
+@segments_option
+def download_quads(name, bbox, rbox, quiet, dest, limit, segments):
     '''Download quads from a mosaic'''
     bbox = bbox or rbox
     cl = clientv1()
 
-    dl = downloader.create(cl, mosaic=True)
+    dl = downloader.create(cl, mosaic=True, segments=segments)
     output = downloader_output(dl, disable_ansi=quiet)
     output.start()
     try:
@@ -769,13 +848,15 @@ def create_order(pretty, **kwargs):
         exists=True, resolve_path=True, writable=True, file_okay=False
 ))
 @pretty
-def download_order(order_id, dest, quiet, pretty):
+@segments_option
+def download_order(order_id, dest, quiet, pretty, segments):
     '''Download an order by given order ID'''
     cl = clientv1()
-    dl = downloader.create(cl, order=True)
+    dl = downloader.create(cl, order=True, segments=segments)
 
     output = downloader_output(dl, disable_ansi=quiet)
     output.start()
 
-    items = cl.get_individual_order(order_id).items_iter(limit=None)
-    handle_interrupt(dl.shutdown, dl.download, items, [], dest)
+    # the results, with names, so the manifest is recognized
+    results = cl.get_individual_order(order_id).get_results()
+    handle_interrupt(dl.shutdown, dl.download, results, [], dest)
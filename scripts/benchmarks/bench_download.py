@@ -0,0 +1,111 @@
+# Copyright 2021 Planet Labs, Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+'''Compare the CPU time of writing a download with iter_content and with
+direct reads into a reusable buffer. The body is served by a local server in
+another process so only the client's CPU time is measured.
+
+    python scripts/benchmarks/bench_download.py [-m 1024] [-r 3]
+'''
+import argparse
+import multiprocessing
+import os
+import time
+
+from planet import api
+from planet.api import models
+from planet.api.models import Body
+from planet.api.models import Request
+
+try:
+    from BaseHTTPServer import BaseHTTPRequestHandler, HTTPServer
+except ImportError:
+    from http.server import BaseHTTPRequestHandler, HTTPServer
+
+BLOCK = os.urandom(1024 * 1024)
+
+try:
+    cpu_time = time.process_time
+except AttributeError:
+    cpu_time = time.clock
+
+
+class _Handler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+
+    def do_GET(self):
+        blocks = int(self.path.strip('/'))
+        self.send_response(200)
+        self.send_header('Content-Length', str(blocks * len(BLOCK)))
+        self.end_headers()
+        for _ in range(blocks):
+            self.wfile.write(BLOCK)
+
+    def log_message(self, *args):
+        pass
+
+
+def serve(queue):
+    server = HTTPServer(('127.0.0.1', 0), _Handler)
+    queue.put(server.server_port)
+    server.serve_forever()
+
+
+def run(client, url, direct):
+    request = Request(url, client.auth, body_type=Body)
+    body = Body(request, client.dispatcher._stream(request),
+                client.dispatcher)
+    if not direct:
+        body._direct_fp = lambda: None
+    calls = [0]
+
+    def callback(**kw):
+        calls[0] += 1
+    with open(os.devnull, 'wb') as fp:
+        t, cpu = time.time(), cpu_time()
+        body.write(fp, callback)
+        return time.time() - t, cpu_time() - cpu, calls[0]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('-m', '--megabytes', type=int, default=1024)
+    parser.add_argument('-r', '--repeat', type=int, default=3)
+    args = parser.parse_args()
+
+    queue = multiprocessing.Queue()
+    server = multiprocessing.Process(target=serve, args=(queue,))
+    server.daemon = True
+    server.start()
+    base = 'http://127.0.0.1:%s/' % queue.get()
+    url = '%s%d' % (base, args.megabytes)
+    client = api.ClientV1('benchmark', base_url=base, rate_limit=0)
+    try:
+        for name, direct in (('iter_content', False), ('readinto', True)):
+            if not direct:
+                # the previous per-chunk progress reporting
+                models.progress_interval = 0
+            else:
+                models.progress_interval = .25
+            best = min(run(client, url, direct) for _ in range(args.repeat))
+            elapsed, cpu, calls = best
+            print('%-12s %5d MB %6.2fs %7.0f MB/s cpu %5.2fs %7d callbacks' %
+                  (name, args.megabytes, elapsed, args.megabytes / elapsed,
+                   cpu, calls))
+    finally:
+        client.shutdown()
+        server.terminate()
+
+
+if __name__ == '__main__':
+    main()
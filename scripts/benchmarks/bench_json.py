@@ -0,0 +1,122 @@
+# Copyright 2021 Planet Labs, Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+'''Measure JSON decoding when streaming paged search results, as done by
+`planet data search`, over pages built from the tests/fixtures searches.
+
+    python scripts/benchmarks/bench_json.py [-p 200]
+
+Each mode reports the number of times a page was decoded and the CPU time
+taken to stream all pages.
+'''
+import argparse
+import io
+import json
+import os
+import time
+
+import requests
+
+from planet.api import models
+
+FIXTURES = os.path.join(os.path.dirname(__file__), '..', '..', 'tests',
+                        'fixtures')
+
+
+class _Response(object):
+
+    def __init__(self, body):
+        self.body = body
+
+    def get_body(self):
+        return self.body
+
+
+class _Dispatcher(object):
+    '''Serves a chain of pages from memory.'''
+
+    def __init__(self, pages):
+        self.pages = pages
+
+    def response(self, request):
+        index = int(request.url.split('/')[1])
+        return _Response(self.page(request.body_type, index))
+
+    def page(self, body_type, index):
+        resp = requests.Response()
+        resp.status_code = 200
+        resp._content = self.pages[index]
+        resp.encoding = 'utf-8'
+        return body_type(models.Request('page/%d' % index, None,
+                                        body_type=body_type), resp, self)
+
+
+def make_pages(count):
+    features = []
+    for name in ('search.geojson', 'search-by-aoi.geojson'):
+        with open(os.path.join(FIXTURES, name)) as fp:
+            features.extend(json.load(fp)['features'])
+    pages = []
+    for i in range(count):
+        nxt = 'page/%d' % (i + 1) if i + 1 < count else None
+        pages.append(json.dumps({
+            'type': 'FeatureCollection',
+            'features': features,
+            '_links': {'_next': nxt},
+        }).encode('utf-8'))
+    return pages
+
+
+class _Uncached(models.Items):
+    '''The previous behavior: decode on every call.'''
+
+    def get(self):
+        return self._decode()
+
+
+def run(pages, body_type, loads):
+    decodes = [0]
+    dispatcher = _Dispatcher(pages)
+
+    def counting_loads(content):
+        decodes[0] += 1
+        return (loads or json.loads)(content)
+    models.json_loads = counting_loads
+    first = dispatcher.page(body_type, 0)
+    t = time.process_time()
+    out = io.StringIO()
+    first.json_encode(out, limit=None)
+    return decodes[0], time.process_time() - t
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('-p', '--pages', type=int, default=200)
+    args = parser.parse_args()
+    pages = make_pages(args.pages)
+    features = len(json.loads(pages[0])['features'])
+    print('%d pages of %d features, %.1f MB' % (
+        args.pages, features, sum(len(p) for p in pages) / 1e6))
+
+    modes = [('uncached json', _Uncached, None),
+             ('memoized json', models.Items, json.loads)]
+    if models.orjson is not None:
+        modes.append(('memoized orjson', models.Items,
+                      models.orjson.loads))
+    for name, body_type, loads in modes:
+        decodes, cpu = run(pages, body_type, loads)
+        print('%-16s %5d decodes %7.2fs cpu' % (name, decodes, cpu))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,108 @@
+# Copyright 2021 Planet Labs, Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+'''Compare the per-request overhead of the dispatcher transports by fetching
+item assets from a local stub server.
+
+    python scripts/benchmarks/bench_transport.py [-n 5000] [-t 4]
+'''
+import argparse
+import json
+import threading
+import time
+
+from planet import api
+from planet.api.transport import RequestsTransport
+from planet.api.transport import Urllib3Transport
+
+try:
+    from BaseHTTPServer import BaseHTTPRequestHandler, HTTPServer
+    from SocketServer import ThreadingMixIn
+except ImportError:
+    from http.server import BaseHTTPRequestHandler, HTTPServer
+    from socketserver import ThreadingMixIn
+
+ASSETS = json.dumps({
+    'analytic': {'status': 'active', 'type': 'analytic',
+                 'location': 'https://example.com/download?token=x'},
+    'visual': {'status': 'inactive', 'type': 'visual'},
+}).encode('utf-8')
+
+
+class _Handler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+    # avoid delayed-ACK stalls measuring the network rather than the client
+    disable_nagle_algorithm = True
+
+    def do_GET(self):
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(ASSETS)))
+        self.end_headers()
+        self.wfile.write(ASSETS)
+
+    def log_message(self, *args):
+        pass
+
+
+class _Server(ThreadingMixIn, HTTPServer):
+    daemon_threads = True
+
+
+def run(client, count, threads):
+    item = {'_links': {'assets': client._url(
+        'data/v1/item-types/PSScene/items/x/assets/')}}
+
+    def work(n):
+        for _ in range(n):
+            client.get_assets(item).get()
+    workers = [threading.Thread(target=work, args=(count // threads,))
+               for _ in range(threads)]
+    t = time.time()
+    [w.start() for w in workers]
+    [w.join() for w in workers]
+    return time.time() - t
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('-n', '--requests', type=int, default=5000)
+    parser.add_argument('-t', '--threads', type=int, default=4)
+    args = parser.parse_args()
+
+    server = _Server(('127.0.0.1', 0), _Handler)
+    threading.Thread(target=server.serve_forever).start()
+    base = 'http://127.0.0.1:%s/' % server.server_port
+    try:
+        for name in ('requests', 'urllib3'):
+            client = api.ClientV1('benchmark', base_url=base,
+                                  workers=args.threads, rate_limit=0)
+            if name == 'urllib3':
+                client.dispatcher.transport = Urllib3Transport(
+                    maxsize=args.threads)
+            else:
+                assert isinstance(client.dispatcher.transport,
+                                  RequestsTransport)
+            # warm up the connection pool
+            run(client, args.threads, args.threads)
+            elapsed = run(client, args.requests, args.threads)
+            print('%-8s %6d requests %6.2fs %8.0f req/s %6.0f us/req' % (
+                name, args.requests, elapsed, args.requests / elapsed,
+                elapsed * 1e6 / args.requests))
+            client.shutdown()
+    finally:
+        server.shutdown()
+
+
+if __name__ == '__main__':
+    main()
@@ -82,6 +82,11 @@ setup(name='planet',
           'pywin32 >= 1.0;platform_system=="Windows"'
       ],
       extras_require={
+          'async': ['aiohttp;python_version>="3.6"'],
+          'fast': ['orjson;python_version>="3.6"'],
+          'columns': ['numpy'],
+          'arrow': ['pyarrow'],
+          'zstd': ['zstandard'],
           'test': test_requires,
           'dev': test_requires + dev_requires,
       },
@@ -11,8 +11,17 @@
 # WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
 # See the License for the specific language governing permissions and
 # limitations under the License.
+import contextlib
 import json
 import os
+import threading
+import time
+try:
+    from BaseHTTPServer import BaseHTTPRequestHandler, HTTPServer
+    from SocketServer import ThreadingMixIn
+except ImportError:
+    from http.server import BaseHTTPRequestHandler, HTTPServer
+    from socketserver import ThreadingMixIn
 
 
 TEST_DIR = os.path.dirname(os.path.realpath(__file__))
@@ -26,3 +35,121 @@ def read_fixture(name):
 
 def clone(j):
     return json.loads(json.dumps(j))
+
+
+def content(size):
+    '''Deterministic content of `size` bytes.'''
+    return (bytes(bytearray(range(251))) * (size // 251 + 1))[:size]
+
+
+class _Handler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+
+    def do_GET(self):
+        self.server.requests.append((self.command, self.path,
+                                     dict(self.headers), None))
+        if self.path.startswith('/slow'):
+            self.server.slow += 1
+            if self.server.slow == 1:
+                time.sleep(.5)
+        if self.path.startswith('/big/'):
+            self._send_big()
+            return
+        if self.path.startswith('/redirect'):
+            self.send_response(302)
+            self.send_header('Location', self.server.redirect_to)
+            self.send_header('Content-Length', '0')
+        else:
+            self.send_response(200)
+            self.send_header('Content-Length', '2')
+        self.end_headers()
+        if not self.path.startswith('/redirect'):
+            self.wfile.write(b'ok')
+        if not self.server.keep_alive:
+            # hang up without saying so
+            self.close_connection = True
+
+    def _send_big(self):
+        data = content(int(self.path.split('/')[-1]))
+        ranges = not self.path.startswith('/big/norange/')
+        byte_range = self.headers.get('Range')
+        if self.headers.get('If-Range', self.server.etag) != self.server.etag:
+            byte_range = None
+        if ranges and byte_range:
+            start, end = map(int, byte_range.split('=')[1].split('-'))
+            self.send_response(206)
+            self.send_header('Content-Range', 'bytes %d-%d/%d' % (
+                start, end, len(data)))
+            data = data[start:end + 1]
+        else:
+            self.send_response(200)
+        if ranges:
+            self.send_header('Accept-Ranges', 'bytes')
+        self.send_header('ETag', self.server.etag)
+        self.send_header('Content-Length', str(len(data)))
+        self.end_headers()
+        if (byte_range and self.server.break_ranges) or self.server.truncate:
+            # send half of the body and hang up
+            if byte_range and self.server.break_ranges:
+                self.server.break_ranges -= 1
+            else:
+                self.server.truncate -= 1
+            data = data[:len(data) // 2]
+            self.close_connection = True
+        if self.server.corrupt:
+            self.server.corrupt -= 1
+            data = b'x' + data[1:]
+        self.wfile.write(data)
+
+    def do_POST(self):
+        length = int(self.headers.get('Content-Length', 0))
+        self.server.requests.append((self.command, self.path,
+                                     dict(self.headers),
+                                     self.rfile.read(length)))
+        self.send_response(200)
+        self.send_header('Content-Length', '2')
+        self.end_headers()
+        self.wfile.write(b'ok')
+
+    def log_message(self, *args):
+        pass
+
+
+class _Server(ThreadingMixIn, HTTPServer):
+    daemon_threads = True
+
+    def get_request(self):
+        self.connections += 1
+        return HTTPServer.get_request(self)
+
+    def handle_error(self, request, client_address):
+        # clients hanging up on slow responses is expected
+        pass
+
+
+@contextlib.contextmanager
+def local_server():
+    '''Serve on a local port until the block exits.
+
+    Paths: `/thing` and `/post` respond ok, `/slow` is slow the first time,
+    `/redirect` redirects to `server.redirect_to` and `/big/<size>` or
+    `/big/norange/<size>` respond with `content(size)`.
+    '''
+    server = _Server(('127.0.0.1', 0), _Handler)
+    server.base = 'http://127.0.0.1:%s/' % server.server_port
+    server.slow = 0
+    server.break_ranges = 0
+    server.truncate = 0
+    server.etag = '"v1"'
+    server.corrupt = 0
+    server.connections = 0
+    server.keep_alive = True
+    server.requests = []
+    thread = threading.Thread(target=server.serve_forever)
+    thread.start()
+    try:
+        yield server
+    finally:
+        server.shutdown()
+        server.server_close()
+        thread.join()
@@ -0,0 +1,302 @@
+# Copyright 2021 Planet Labs, Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+import asyncio
+import base64
+import hashlib
+import io
+import json
+import os
+import sys
+import threading
+
+import pytest
+
+if sys.version_info < (3, 6):
+    pytest.skip('asyncio client requires python 3.6+',
+                allow_module_level=True)
+pytest.importorskip('aiohttp')
+
+from http.server import BaseHTTPRequestHandler, HTTPServer  # noqa: E402
+from socketserver import ThreadingMixIn  # noqa: E402
+
+from planet.api import aio  # noqa: E402
+from planet.api import checksums  # noqa: E402
+from planet.api import exceptions  # noqa: E402
+from planet.api import models  # noqa: E402
+from planet.api import filters  # noqa: E402
+from planet.api.aio import AsyncClientV1, write_to_file  # noqa: E402
+from planet.api.checksums import Checksums  # noqa: E402
+from planet.api.exceptions import ChecksumMismatch  # noqa: E402
+from planet.api.retry import RetryPolicy  # noqa: E402
+from requests.exceptions import ConnectionError  # noqa: E402
+
+
+class _Handler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+
+    def _send(self, status, body=b'', headers=None):
+        self.send_response(status)
+        for k, v in (headers or {}).items():
+            self.send_header(k, v)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _json(self, obj, status=200):
+        self._send(status, json.dumps(obj).encode('utf-8'),
+                   {'Content-Type': 'application/json'})
+
+    def _page(self, page):
+        base = 'http://127.0.0.1:%s/' % self.server.server_port
+        nxt = base + 'page/%d' % (page + 1) if page < 2 else None
+        self._json({
+            '_links': {'_next': nxt},
+            'features': [{'id': '%d-%d' % (page, i)} for i in range(3)],
+        })
+
+    def do_POST(self):
+        length = int(self.headers.get('Content-Length', 0))
+        self.server.posted.append(json.loads(self.rfile.read(length)))
+        if self.path.endswith('/stats'):
+            self._json({'buckets': [
+                {'start_time': '2020-01-0%dT00:00:00.000000Z' % d,
+                 'count': 10} for d in (1, 2)]})
+        elif self.path.endswith('/login'):
+            payload = base64.urlsafe_b64encode(b'{"api_key": "key"}')
+            self._send(200, b'header.' + payload.rstrip(b'=') + b'.sig')
+        else:
+            self._page(0)
+
+    def do_GET(self):
+        self.server.requests.append((self.path, dict(self.headers)))
+        if self.path.startswith('/page/'):
+            self._page(int(self.path.split('/')[-1]))
+        elif self.path == '/flaky':
+            self.server.flaky += 1
+            if self.server.flaky < 3:
+                self._send(503, b'unavailable')
+            else:
+                self._json({'ok': True})
+        elif self.path == '/missing':
+            self._send(404, b'not here')
+        elif self.path == '/download':
+            self._send(302, headers={'Location': self.server.redirect_to})
+        elif self.path.startswith('/file'):
+            data = b'x' * 100000
+            if self.server.corrupt:
+                self.server.corrupt -= 1
+                data = b'y' * 100000
+            self._send(200, data, {
+                'Content-Disposition': 'attachment; filename="thing.tif"'})
+        else:
+            self._send(404)
+
+    def log_message(self, *args):
+        pass
+
+
+class _Server(ThreadingMixIn, HTTPServer):
+    daemon_threads = True
+
+    def handle_error(self, request, client_address):
+        # clients hanging up on cancelled requests is expected
+        pass
+
+
+@pytest.fixture()
+def server():
+    server = _Server(('127.0.0.1', 0), _Handler)
+    server.requests, server.posted, server.flaky = [], [], 0
+    server.corrupt = 0
+    threading.Thread(target=server.serve_forever).start()
+    yield server
+    server.shutdown()
+
+
+def run(coro):
+    return asyncio.new_event_loop().run_until_complete(coro)
+
+
+def client_for(server, **kw):
+    base = 'http://127.0.0.1:%s/' % server.server_port
+    return AsyncClientV1('foobar', base_url=base, rate_limit=0, **kw)
+
+
+def test_quick_search_paging(server):
+    async def search():
+        async with client_for(server) as cl:
+            req = filters.build_search_request(
+                filters.range_filter('cloud_cover', lte=.1), ['PSScene'])
+            items = await cl.quick_search(req, page_size=3)
+            ids = [i['id'] async for i in items]
+            limited = [i async for i in items.items_iter(4)]
+            pages = [p async for p in items.iter(2)]
+            return ids, limited, pages
+    ids, limited, pages = run(search())
+    assert ids == ['%d-%d' % (p, i) for p in range(3) for i in range(3)]
+    assert len(limited) == 4
+    assert len(pages) == 2
+    assert server.posted[0]['item_types'] == ['PSScene']
+    path, headers = server.requests[0]
+    assert path == '/page/1'
+    assert headers['Authorization'] == 'api-key foobar'
+
+
+def test_requires_aiohttp(monkeypatch):
+    monkeypatch.setattr(aio, 'aiohttp', None)
+    with pytest.raises(ImportError) as ex:
+        AsyncClientV1('foobar')
+    assert 'planet[async]' in str(ex.value)
+
+
+@pytest.mark.parametrize('sort', [None, 'acquired asc'])
+def test_sharded_search(server, sort):
+    async def search():
+        async with client_for(server) as cl:
+            req = filters.build_search_request(
+                filters.range_filter('cloud_cover', lte=.1), ['PSScene'])
+            items = await cl.sharded_search(req, shards=2, sort=sort)
+            return [i['id'] async for i in items], \
+                [i async for i in items.items_iter(4)]
+    ids, limited = run(search())
+    # each shard has the same items here, so all but one are duplicates
+    assert sorted(ids) == ['%d-%d' % (p, i)
+                           for p in range(3) for i in range(3)]
+    assert len(limited) == 4
+    stats, first, second = server.posted[:3]
+    assert stats['interval'] == 'day'
+    assert first['filter'] != second['filter']
+
+
+def test_login(server):
+    async def login():
+        async with client_for(server) as cl:
+            return await cl.login('me@example.com', 'secret')
+    assert run(login()) == {'api_key': 'key'}
+    assert server.posted == [{'email': 'me@example.com',
+                              'password': 'secret'}]
+
+
+def test_error_mapping(server):
+    async def missing():
+        async with client_for(server) as cl:
+            await cl._get('missing').get_body()
+    with pytest.raises(exceptions.MissingResource):
+        run(missing())
+
+
+def test_retry(server):
+    class NoWait(RetryPolicy):
+        def backoff(self, last_wait):
+            return 0
+
+    async def flaky():
+        async with client_for(server, retry=NoWait()) as cl:
+            return (await cl._get('flaky').get_body()).get()
+    assert run(flaky()) == {'ok': True}
+    assert server.flaky == 3
+
+
+def test_retry_connection_errors():
+    class NoWait(RetryPolicy):
+        def backoff(self, last_wait):
+            return 0
+
+    policy = NoWait(max_attempts=2)
+
+    async def closed():
+        # nothing listens on the port of a closed server
+        server = _Server(('127.0.0.1', 0), _Handler)
+        base = 'http://127.0.0.1:%s/' % server.server_port
+        server.server_close()
+        async with AsyncClientV1('foobar', base_url=base, rate_limit=0,
+                                 retry=policy) as cl:
+            await cl._get('thing').get_body()
+    with pytest.raises(ConnectionError):
+        run(closed())
+    assert policy.stats()['retry_wait'] == {'connection': 0}
+    # the policy is not changed, so may be shared with a ClientV1
+    assert policy.connection_errors == RetryPolicy.connection_errors
+
+
+def test_download_redirect(server, tmpdir):
+    server.redirect_to = 'http://localhost:%s/file' % server.server_port
+    progress = []
+
+    async def download():
+        async with client_for(server) as cl:
+            writer = write_to_file(str(tmpdir),
+                                   lambda **kw: progress.append(kw))
+            return await cl.download({'location': cl._url('download')},
+                                     writer)
+    body = run(download())
+    assert body.name == 'thing.tif'
+    with open(os.path.join(str(tmpdir), 'thing.tif'), 'rb') as fp:
+        assert len(fp.read()) == 100000
+    assert progress[-1]['finish'] is body
+    # the redirect is to another host, the key is moved to the url
+    path, headers = server.requests[-1]
+    assert path == '/file?api_key=foobar'
+    assert 'Authorization' not in headers
+
+
+def test_write_to_file_checksums(server, tmpdir, monkeypatch):
+    server.redirect_to = 'http://127.0.0.1:%s/file' % server.server_port
+    digests = {'md5': hashlib.md5(b'x' * 100000).hexdigest()}
+    path = tmpdir.join('thing.tif')
+    path.write_binary(b'existing')
+    sums = Checksums(str(tmpdir))
+
+    def download():
+        async def download():
+            async with client_for(server) as cl:
+                writer = write_to_file(str(tmpdir), overwrite=False,
+                                       digests=digests, checksums=sums)
+                await cl.download({'location': cl._url('download')},
+                                  writer)
+        server.requests = []
+        run(download())
+        return len([r for r in server.requests if r[0].startswith('/file')])
+
+    # a corrupt body is requested again
+    server.corrupt = 1
+    assert download() == 2
+    assert path.read_binary() == b'x' * 100000
+    # a verified file is skipped
+    assert download() == 1
+    assert path.read_binary() == b'x' * 100000
+
+    # a file is only replaced by a verified body
+    path.write_binary(b'existing')
+    monkeypatch.setattr(models, 'checksum_retries', 0)
+    server.corrupt = 1
+    with pytest.raises(ChecksumMismatch):
+        download()
+    assert path.read_binary() == b'existing'
+    assert sorted(os.listdir(str(tmpdir))) == [
+        checksums.RECORD_NAME, 'thing.tif']
+
+
+def test_body_async_iter(server):
+    server.redirect_to = 'http://127.0.0.1:%s/file' % server.server_port
+
+    async def download():
+        async with client_for(server) as cl:
+            body = await cl.download({'location': cl._url('download')})
+            buf = io.BytesIO()
+            async for chunk in body:
+                buf.write(chunk)
+            body.response.close()
+            return buf.getvalue()
+    assert len(run(download())) == 100000
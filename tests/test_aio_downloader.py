@@ -0,0 +1,269 @@
+# Copyright 2021 Planet Labs, Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+import asyncio
+import hashlib
+import os
+import sys
+import threading
+import time
+
+import pytest
+
+if sys.version_info < (3, 6):
+    pytest.skip('asyncio downloader requires python 3.6+',
+                allow_module_level=True)
+pytest.importorskip('aiohttp')
+
+from planet.api import journal  # noqa: E402
+from planet.api.checksums import Hasher  # noqa: E402
+from planet.api.aio_downloader import AsyncDownloader  # noqa: E402
+from planet.api.journal import Journal  # noqa: E402
+
+DATA = b'some content'
+
+
+class Resp(object):
+
+    def __init__(self, resp):
+        self.resp = resp
+
+    def get(self):
+        return self.resp
+
+
+class Body(object):
+
+    def __init__(self, name, data):
+        self.name = name
+        self.data = data
+        self.written = False
+        self.response = self
+
+    async def write(self, file, callback, digests=None):
+        callback(start=self)
+        hasher = Hasher(self.name, digests)
+        hasher.update(self.data)
+        hasher.check()
+        with open(file, 'wb') as fp:
+            fp.write(self.data)
+        self.written = True
+        callback(wrote=len(self.data), total=len(self.data))
+        callback(finish=self)
+
+    def close(self):
+        pass
+
+
+class AsyncClient(object):
+    '''Assets become active after `polls` polls.'''
+
+    def __init__(self, polls=2, delay=.001, data=DATA):
+        self.polls = polls
+        self.delay = delay
+        self.data = data
+        self.assets = {}
+        self.downloads = []
+        self.written = []
+        self.activating = self.max_activating = 0
+        self.downloading = self.max_downloading = 0
+        self.closed = False
+
+    async def get_assets(self, item):
+        await asyncio.sleep(self.delay)
+        assets = self.assets.get(item['id'])
+        if assets is None:
+            assets = self.assets[item['id']] = dict(
+                (t, {'type': t, 'status': 'inactive', '_polls': 0,
+                     '_name': '%s.%s' % (item['id'], t),
+                     'md5_digest': hashlib.md5(DATA).hexdigest()})
+                for t in ('a', 'b'))
+        else:
+            for a in assets.values():
+                a['_polls'] += 1
+                if a['_polls'] >= self.polls and a['status'] != 'active':
+                    self.activating -= a['status'] == 'activating'
+                    a['status'] = 'active'
+        return Resp(dict((t, dict(a)) for t, a in assets.items()))
+
+    async def activate(self, asset):
+        await asyncio.sleep(self.delay)
+        self.assets[asset['_name'].split('.')[0]][asset['type']][
+            'status'] = 'activating'
+        self.activating += 1
+        self.max_activating = max(self.activating, self.max_activating)
+
+    async def download(self, asset, writer):
+        self.downloading += 1
+        self.max_downloading = max(self.downloading, self.max_downloading)
+        await asyncio.sleep(self.delay)
+        self.downloading -= 1
+        self.downloads.append(asset['_name'])
+        body = Body(asset['_name'], self.data)
+        await writer(body)
+        if body.written:
+            self.written.append(body.name)
+        return body
+
+    async def close(self):
+        self.closed = True
+
+    def shutdown(self):
+        pass
+
+
+def create(client, **kw):
+    dl = AsyncDownloader(client, **kw)
+    dl._min_poll_interval = 0
+    return dl
+
+
+def items(cnt):
+    return [{'id': str(i)} for i in range(cnt)]
+
+
+def test_download(tmpdir):
+    cl = AsyncClient()
+    dl = create(cl)
+    completed = []
+    dl.on_complete = lambda *a: completed.append(a)
+    stats = dl.download(items(50), ['a', 'b'], str(tmpdir))
+    assert stats == {
+        'downloading': 0, 'complete': 100, 'paging': False,
+        'downloaded': '%.2fMB' % (100 * len(DATA) / 1.0e6),
+        'activating': 0, 'pending': 0, 'polls_per_activation': 2.,
+    }
+    assert len(completed) == 100
+    item, asset, path = completed[0]
+    assert path == os.path.join(str(tmpdir), asset['_name'])
+    assert len(os.listdir(str(tmpdir))) == 101
+    assert cl.closed
+
+
+def test_activate():
+    cl = AsyncClient()
+    dl = create(cl)
+    completed = []
+    dl.on_complete = lambda *a: completed.append(a)
+    stats = dl.activate(items(10), ['a'])
+    assert stats['complete'] == 10
+    assert 'downloading' not in stats
+    assert [a['status'] for i, a in completed] == ['active'] * 10
+    assert cl.downloads == []
+
+
+def test_concurrency(tmpdir):
+    cl = AsyncClient(polls=10, delay=.05)
+    dl = create(cl, activations=1000, downloads=20)
+
+    async def paged():
+        for item in items(1000):
+            yield item
+    t = time.time()
+    stats = dl.download(paged(), ['a', 'b'], str(tmpdir))
+    assert stats['complete'] == 2000
+    # the assets activate together rather than a few at a time
+    assert cl.max_activating > 1000
+    assert cl.max_downloading == 20
+    assert time.time() - t < 30
+
+
+def test_bounded_queues(tmpdir):
+    cl = AsyncClient(polls=1000)
+    dl = create(cl, activations=10)
+    fed = []
+
+    def gen():
+        for item in items(1000):
+            fed.append(item)
+            yield item
+
+    async def run():
+        task = asyncio.ensure_future(dl.run(gen(), ['a'], str(tmpdir)))
+        await asyncio.sleep(.5)
+        stats = dl.stats()
+        dl._cancel()
+        await task
+        return stats
+    loop = asyncio.new_event_loop()
+    stats = loop.run_until_complete(run())
+    loop.close()
+    assert stats['paging']
+    # 10 polling, 10 waiting to be polled, 100 activators blocked on the
+    # poll queue, 10 waiting to be activated and 1 waiting to be queued
+    assert len(fed) == 131
+    assert stats['activating'] == 131
+
+
+def test_checksum_journal(tmpdir):
+    jnl = Journal(str(tmpdir.join('job.db')))
+    jnl.begin(['a', 'b'])
+    dest = tmpdir.mkdir('dest')
+    records = list(jnl.record(Pages(items(3))))
+    cl = AsyncClient(data=b'corrupt')
+    dl = create(cl, journal=jnl)
+    stats = dl.download(records, ['a', 'b'], str(dest))
+    assert stats['complete'] == 0
+    assert jnl.counts() == {journal.FAILED: 6}
+    assert os.listdir(str(dest)) == []
+
+    cl = AsyncClient()
+    dl = create(cl, journal=jnl)
+    jnl.set_state('0', 'a', journal.DONE)
+    dl.download(jnl.resume(None), ['a', 'b'], str(dest))
+    assert jnl.counts() == {journal.DONE: 6}
+    assert '0.a' not in cl.downloads
+
+
+def test_existing_files(tmpdir):
+    tmpdir.join('0.a').write_binary(DATA)
+    tmpdir.join('1.a').write_binary(b'changed')
+    # a verified file is skipped, others are only replaced when verified
+    cl = AsyncClient(data=b'corrupt')
+    stats = create(cl).download(items(2), ['a'], str(tmpdir))
+    assert stats['complete'] == 1
+    assert cl.written == []
+    assert tmpdir.join('1.a').read_binary() == b'changed'
+
+    cl = AsyncClient()
+    stats = create(cl).download(items(2), ['a'], str(tmpdir))
+    assert stats['complete'] == 2
+    assert cl.written == ['1.a']
+    assert tmpdir.join('1.a').read_binary() == DATA
+
+
+class Pages(object):
+    ITEM_KEY = 'features'
+
+    def __init__(self, items):
+        self.items = items
+
+    def iter(self):
+        yield self
+
+    def get(self):
+        return {'features': self.items}
+
+    def _next_url(self):
+        return None
+
+
+def test_shutdown(tmpdir):
+    cl = AsyncClient(polls=1000)
+    dl = create(cl)
+    threading.Timer(.2, dl.shutdown).start()
+    t = time.time()
+    stats = dl.download(items(10), ['a', 'b'], str(tmpdir))
+    assert time.time() - t < 5
+    assert stats['complete'] == 0
+    assert cl.closed
@@ -0,0 +1,115 @@
+# Copyright 2021 Planet Labs, Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+import os
+
+from planet import api
+from planet.api.cache import ResponseCache
+import pytest
+import requests_mock
+
+MOSAICS = r'/basemaps/v1/'
+ASSETS = r'/data/v1/item-types/[^/]+/items/[^/]+/assets/?$'
+
+
+def client_with(cache):
+    return api.ClientV1('foobar', rate_limit=0, cache=cache)
+
+
+def test_ttl_hit():
+    cache = ResponseCache()
+    client = client_with(cache)
+    with requests_mock.Mocker() as m:
+        m.get(client._url('basemaps/v1/mosaics'), json={'mosaics': ['m']})
+        for _ in range(3):
+            body = client.get_mosaic_by_name('m')
+            assert body.get() == {'mosaics': ['m']}
+        assert m.call_count == 1
+    assert cache.stats()[MOSAICS] == {
+        'hits': 2, 'misses': 1, 'revalidated': 0, 'evictions': 0}
+
+
+def test_revalidate_etag():
+    cache = ResponseCache()
+    client = client_with(cache)
+    item = {'_links': {'assets': client._url(
+        'data/v1/item-types/PSScene/items/x/assets/')}}
+    with requests_mock.Mocker() as m:
+        m.get(item['_links']['assets'], [
+            {'json': {'analytic': {'status': 'inactive'}},
+             'headers': {'ETag': '"v1"'}},
+            {'status_code': 304},
+            {'json': {'analytic': {'status': 'active'}},
+             'headers': {'ETag': '"v2"'}},
+        ])
+        first = client.get_assets(item).get()
+        second = client.get_assets(item).get()
+        assert first == second
+        assert m.request_history[1].headers['If-None-Match'] == '"v1"'
+        third = client.get_assets(item).get()
+        assert third['analytic']['status'] == 'active'
+        assert m.request_history[2].headers['If-None-Match'] == '"v1"'
+    assert cache.stats()[ASSETS] == {
+        'hits': 0, 'misses': 2, 'revalidated': 1, 'evictions': 0}
+
+
+def test_uncached_requests():
+    cache = ResponseCache()
+    client = client_with(cache)
+    with requests_mock.Mocker() as m:
+        # activation is a GET but must never be cached
+        url = client._url('data/v1/assets/abc/activate')
+        m.get(url, status_code=202, text='')
+        client.activate({'_links': {'activate': url}})
+        client.activate({'_links': {'activate': url}})
+        assert m.call_count == 2
+    assert cache.stats() == {}
+
+
+def test_lru_eviction():
+    cache = ResponseCache(maxsize=2)
+    client = client_with(cache)
+    with requests_mock.Mocker() as m:
+        for name in 'abc':
+            m.get(client._url('basemaps/v1/series/%s' % name), json={})
+            client.get_mosaic_series(name)
+        client.get_mosaic_series('a')
+        assert m.call_count == 4
+    assert cache.stats()[MOSAICS]['evictions'] == 2
+
+
+def test_disk_cache(tmpdir):
+    directory = os.path.join(str(tmpdir), 'cache')
+    with requests_mock.Mocker() as m:
+        client = client_with(ResponseCache(directory=directory))
+        m.get(client._url('basemaps/v1/series/a'), json={'id': 'a'},
+              headers={'Last-Modified': 'Wed, 21 Oct 2015 07:28:00 GMT'})
+        client.get_mosaic_series('a')
+        # a new process would only have the disk copy
+        client = client_with(ResponseCache(directory=directory))
+        assert client.get_mosaic_series('a').get() == {'id': 'a'}
+        assert m.call_count == 1
+
+
+@pytest.mark.parametrize('status', [304, 200])
+def test_expired_revalidates_last_modified(status):
+    cache = ResponseCache(rules=[(MOSAICS, 0)])
+    client = client_with(cache)
+    lm = 'Wed, 21 Oct 2015 07:28:00 GMT'
+    with requests_mock.Mocker() as m:
+        url = client._url('basemaps/v1/series/a')
+        m.get(url, [{'json': {'id': 'a'}, 'headers': {'Last-Modified': lm}},
+                    {'status_code': status, 'json': {'id': 'a'}}])
+        client.get_mosaic_series('a')
+        assert client.get_mosaic_series('a').get() == {'id': 'a'}
+        assert m.request_history[1].headers['If-Modified-Since'] == lm
@@ -0,0 +1,214 @@
+import hashlib
+import json
+import os
+
+from planet.api import checksums
+from planet.api import downloader
+from planet.api.checksums import Checksums
+from planet.api.checksums import Hasher
+from planet.api.exceptions import ChecksumMismatch
+from planet.api.utils import write_to_file
+import pytest
+
+DATA = b'some content'
+MD5 = hashlib.md5(DATA).hexdigest()
+SHA256 = hashlib.sha256(DATA).hexdigest()
+
+
+def test_preferred():
+    assert checksums.preferred({'md5': MD5, 'sha256': SHA256}) == \
+        {'sha256': SHA256}
+    assert checksums.preferred({'md5': MD5.upper()}) == {'md5': MD5}
+    assert checksums.preferred({'crc32c': 'abc', 'md5': ''}) == {}
+    assert checksums.preferred(None) == {}
+
+
+def test_hasher():
+    hasher = Hasher('f', {'md5': MD5, 'sha256': SHA256})
+    hasher.update(DATA[:4])
+    hasher.reset()
+    hasher.update(DATA)
+    hasher.check(len(DATA))
+    assert hasher.digests() == {'sha256': SHA256}
+    with pytest.raises(ChecksumMismatch) as ex:
+        hasher.check(len(DATA) + 1)
+    assert ex.value.kind == 'size'
+    hasher.update(b'more')
+    with pytest.raises(ChecksumMismatch) as ex:
+        hasher.check()
+    assert ex.value.kind == 'sha256'
+    assert ex.value.expected == SHA256
+
+
+def test_order_digests():
+    manifest = {'name': '', 'files': [
+        {'path': 'PSScene/a_metadata.json', 'media_type': 'application/json',
+         'size': 12, 'digests': {'md5': MD5, 'sha256': SHA256}},
+        {'path': 'b.tif'},
+    ]}
+    assert checksums.order_digests(manifest) == {
+        'a_metadata.json': {'md5': MD5, 'sha256': SHA256}}
+
+
+def test_checksums_verified(tmpdir, monkeypatch):
+    tmpdir.join('a').write_binary(DATA)
+    sums = Checksums(str(tmpdir))
+    assert not sums.verified('missing', {'md5': MD5})
+    assert sums.verified('a', {})
+    hashed = []
+    update_file = Hasher.update_file
+
+    def counting(self, path):
+        hashed.append(os.path.basename(path))
+        update_file(self, path)
+    monkeypatch.setattr(Hasher, 'update_file', counting)
+
+    # hashed once and recorded
+    assert sums.verified('a', {'md5': MD5})
+    assert Checksums(str(tmpdir)).verified('a', {'md5': MD5})
+    assert not Checksums(str(tmpdir)).verified('a', {'md5': 'f' * 32})
+    assert hashed == ['a']
+    record = json.loads(tmpdir.join(checksums.RECORD_NAME).read())
+    assert record['a']['digests'] == {'md5': MD5}
+    assert record['a']['size'] == len(DATA)
+
+    # another algorithm is added to the record
+    assert sums.verified('a', {'sha256': SHA256})
+    assert hashed == ['a', 'a']
+
+    # a changed file is hashed again
+    tmpdir.join('a').write_binary(b'other content')
+    assert not sums.verified('a', {'md5': MD5})
+    assert hashed == ['a', 'a', 'a']
+
+
+def test_checksums_flush(tmpdir):
+    for name in 'abc':
+        tmpdir.join(name).write_binary(DATA)
+    sums = Checksums(str(tmpdir))
+    sums._save_interval = 60
+    for name in 'abc':
+        assert sums.verified(name, {'md5': MD5})
+    # only the first record was saved
+    record = json.loads(tmpdir.join(checksums.RECORD_NAME).read())
+    assert sorted(record) == ['a']
+    sums.flush()
+    record = json.loads(tmpdir.join(checksums.RECORD_NAME).read())
+    assert sorted(record) == ['a', 'b', 'c']
+
+
+class Body(object):
+    '''A Body that writes its content and checks the expected digests.'''
+
+    def __init__(self, name, data=DATA):
+        self.name = name
+        self.data = data
+        self.writes = []
+        self.response = self
+
+    def write(self, file, callback=None, digests=None):
+        self.writes.append(digests)
+        hasher = Hasher(self.name, digests)
+        hasher.update(self.data)
+        hasher.check()
+        with open(file, 'wb') as fp:
+            fp.write(self.data)
+
+    def close(self):
+        pass
+
+
+def test_write_to_file_checksums(tmpdir):
+    sums = Checksums(str(tmpdir))
+    sums.expect({'a': {'md5': MD5}})
+    writer = write_to_file(str(tmpdir), overwrite=False, checksums=sums)
+    body = Body('a')
+    writer(body)
+    assert body.writes == [{'md5': MD5}]
+    assert sums.verified('a', {'md5': MD5})
+
+    # verified files are skipped
+    writer(body)
+    assert len(body.writes) == 1
+
+    # files that do not verify are written again
+    tmpdir.join('a').write_binary(b'corrupt')
+    writer(body)
+    assert len(body.writes) == 2
+
+    # files without expected digests are skipped if they exist
+    tmpdir.join('b').write_binary(b'anything')
+    other = Body('b')
+    writer(other)
+    assert other.writes == []
+
+
+class Download(object):
+    '''A finished download, like a models.Response.'''
+
+    def __init__(self, body, writer):
+        self.body = body
+        self.error = None
+        try:
+            writer and writer(body)
+        except Exception as ex:
+            self.error = ex
+
+    def get_body(self):
+        return self.body
+
+    def wait(self):
+        if self.error:
+            raise self.error
+        return self.body
+
+
+class OrderClient(object):
+
+    def __init__(self, files, unnamed=()):
+        self.files = files
+        self.unnamed = unnamed
+        self.downloads = []
+
+    def download_location(self, location, writer=None):
+        self.downloads.append(location)
+        body = Body(location, self.files[location])
+        if location in self.unnamed:
+            # no content-disposition
+            body.name = None
+        return Download(body, writer)
+
+    def shutdown(self):
+        pass
+
+
+@pytest.mark.parametrize('unnamed', [(), ('manifest.json',)])
+def test_order_manifest_first(tmpdir, unnamed, caplog):
+    manifest = {'files': [
+        {'path': 'PSScene/a', 'digests': {'md5': MD5}},
+        {'path': 'PSScene/b', 'digests': {'md5': MD5}},
+    ]}
+    client = OrderClient({
+        'a': DATA,
+        'b': b'corrupt',
+        'manifest.json': json.dumps(manifest).encode('utf-8'),
+    }, unnamed)
+    results = [{'name': 'order/PSScene/%s' % n, 'location': n}
+               for n in ('a', 'b')]
+    results.append({'name': 'order/manifest.json',
+                    'location': 'manifest.json'})
+    dl = downloader.create(client, order=True, no_sleep=True)
+    completed = []
+    dl.on_complete = lambda *a: completed.append(a)
+    stats = dl.download(iter(results), [], str(tmpdir))
+    assert stats['complete'] == 2
+    assert completed == []
+    assert client.downloads[0] == 'manifest.json'
+    assert sorted(client.downloads[1:]) == ['a', 'b']
+    assert json.loads(tmpdir.join('manifest.json').read()) == manifest
+    # b did not verify so was not written
+    assert sorted(os.listdir(str(tmpdir))) == [
+        checksums.RECORD_NAME, 'a', 'manifest.json']
+    failed = [r.getMessage() for r in caplog.records
+              if r.getMessage().startswith('download failed')]
+    assert len(failed) == 1 and 'b' in failed[0]
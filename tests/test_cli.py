@@ -132,6 +132,14 @@ def test_workers_flag():
     assert cli.client_params['workers'] == 19
 
 
+def test_rate_limit_flags():
+    run_cli(['--rate-limit', '10', '--max-rate', '25', '--burst', '20',
+             'help'])
+    assert cli.client_params['rate_limit'] == 10
+    assert cli.client_params['max_rate'] == 25
+    assert cli.client_params['burst'] == 20
+
+
 def test_api_key_flag():
     run_cli(['-k', 'shazbot', 'help'])
     assert 'api_key' in cli.client_params
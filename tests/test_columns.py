@@ -0,0 +1,92 @@
+# Copyright 2021 Planet Labs, Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+from mock import MagicMock
+import pytest
+
+np = pytest.importorskip('numpy')
+
+from planet.api import columns  # noqa: E402
+from planet.api.columns import to_columns  # noqa: E402
+from planet.api.models import Items  # noqa: E402
+from planet.api.models import Request  # noqa: E402
+from planet.api.sharding import ShardedItems  # noqa: E402
+
+
+def item(id, **props):
+    return {
+        'id': id,
+        'properties': props,
+        'geometry': {
+            'type': 'MultiPolygon',
+            'coordinates': [[[[0, 1], [2, -3], [1, 5], [0, 1]]],
+                            [[[-4, 1], [2, 3], [0, 1]]]]
+        }
+    }
+
+
+def test_to_columns():
+    items = [
+        item('a', acquired='2020-01-02T03:04:05.678000Z', cloud_cover=.5,
+             item_type='PSScene4Band'),
+        {'id': 'a-longer-id', 'properties': {}},
+    ]
+    cols = to_columns(items, ['acquired', 'cloud_cover', 'bbox',
+                              ('item_type', 'U'), ('gsd', 'f4')])
+    assert cols.dtype.names == ('id', 'acquired', 'cloud_cover', 'bbox',
+                                'item_type', 'gsd')
+    assert list(cols['id']) == ['a', 'a-longer-id']
+    assert cols['acquired'][0] == np.datetime64('2020-01-02T03:04:05.678')
+    assert np.isnat(cols['acquired'][1])
+    assert cols['cloud_cover'][0] == .5
+    assert np.isnan(cols['cloud_cover'][1])
+    assert cols['bbox'].shape == (2, 4)
+    assert list(cols['bbox'][0]) == [-4, -3, 2, 5]
+    assert np.isnan(cols['bbox'][1]).all()
+    assert list(cols['item_type']) == ['PSScene4Band', '']
+    assert cols['gsd'].dtype == np.float32
+
+
+def test_to_columns_grows(monkeypatch):
+    monkeypatch.setattr(columns, 'BATCH_SIZE', 3)
+    ids = ['id%d' % i for i in range(20)]
+    items = [item(i, cloud_cover=n) for n, i in enumerate(ids)]
+    cols = to_columns(items)
+    assert list(cols['id']) == ids
+    assert list(cols['cloud_cover']) == list(range(20))
+    assert len(to_columns([])) == 0
+
+
+def test_items_to_columns():
+    http_response = MagicMock(name='http_response')
+    http_response.headers = {}
+    http_response.json.return_value = {
+        'features': [item('a', cloud_cover=.1), item('b')], '_links': {}
+    }
+    items = Items(Request('url', 'auth'), http_response,
+                  MagicMock(name='dispatcher'))
+    cols = items.to_columns(['cloud_cover'], limit=1)
+    assert list(cols['id']) == ['a']
+    assert cols['cloud_cover'][0] == .1
+
+    cols = ShardedItems([lambda: items]).to_columns()
+    assert list(cols['id']) == ['a', 'b']
+    assert cols.dtype.names == ('id', 'acquired', 'cloud_cover', 'bbox')
+
+
+def test_requires_numpy(monkeypatch):
+    monkeypatch.setattr(columns, 'np', None)
+    with pytest.raises(ImportError) as ex:
+        to_columns([item('a')])
+    assert 'planet[columns]' in str(ex.value)
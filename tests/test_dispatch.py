@@ -11,10 +11,28 @@
 # WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
 # See the License for the specific language governing permissions and
 # limitations under the License.
+import threading
+import time
+from planet import api
+from planet.api.dispatch import DEFAULT_TIMEOUTS
 from planet.api.dispatch import RedirectSession
+from planet.api.dispatch import RequestsDispatcher
 from planet.api.dispatch import _is_subdomain_of_tld
+from planet.api.dispatch import _AIMDBucket
+from planet.api.dispatch import _RateLimiter
+from planet.api.dispatch import _TokenBucket
+from planet.api.exceptions import MissingResource
+from planet.api.exceptions import TooManyRequests
+from planet.api.models import Request
+from planet.api.models import Body
+from planet.api.retry import RetryPolicy
+from planet.api.transport import Urllib3Transport
+import pytest
+from requests.exceptions import ConnectionError
 import requests_mock
 
+from _common import local_server
+
 
 def test_redirectsession_rebuilt_auth_called():
     '''verify our hacking around with Session behavior works'''
@@ -56,3 +74,262 @@ def test_is_subdomain_of_tld():
     assert not _is_subdomain_of_tld('http://foo.bar', 'http://bar.foo')
     assert not _is_subdomain_of_tld('http://one.foo.bar', 'http://bar.foo')
     assert not _is_subdomain_of_tld('http://foo.bar', 'http://one.bar.foo')
+
+
+def test_token_bucket_burst_then_rate():
+    bucket = _TokenBucket(rate=100, burst=5)
+    # the burst is available immediately
+    assert [bucket._reserve() for _ in range(5)] == [0] * 5
+    # then each reservation is spaced by 1/rate
+    waits = [bucket._reserve() for _ in range(3)]
+    assert waits[0] > 0
+    assert abs((waits[1] - waits[0]) - .01) < .005
+    assert abs((waits[2] - waits[1]) - .01) < .005
+
+
+def test_token_bucket_disabled():
+    bucket = _TokenBucket(rate=0)
+    assert all(bucket.acquire() == 0 for _ in range(100))
+
+
+def test_token_bucket_does_not_serialize():
+    '''many slow operations can be in flight at once'''
+    bucket = _TokenBucket(rate=1000, burst=10)
+    slow = bucket.wrap(lambda: time.sleep(.2))
+    threads = [threading.Thread(target=slow) for _ in range(10)]
+    t = time.time()
+    [th.start() for th in threads]
+    [th.join() for th in threads]
+    assert time.time() - t < 1
+
+
+def test_aimd_increase_and_decrease():
+    bucket = _AIMDBucket(rate=4, max_rate=5, increase=1)
+    bucket.success()
+    assert bucket.rate == 4.25
+    for _ in range(100):
+        bucket.success()
+    assert bucket.rate == 5
+    bucket.throttled()
+    assert bucket.rate == 2.5
+    # in flight requests throttled at the old rate do not cut it again
+    bucket.throttled()
+    assert bucket.rate == 2.5
+    bucket._cut -= 1
+    bucket.throttled()
+    assert bucket.rate == 1.25
+
+
+def test_aimd_default_max_rate():
+    bucket = _AIMDBucket(rate=4)
+    for _ in range(1000):
+        bucket.success()
+    assert bucket.rate > 4
+    assert bucket.rate == bucket.max_rate == 16
+
+
+def test_aimd_min_rate():
+    bucket = _AIMDBucket(rate=1, min_rate=.5)
+    for _ in range(5):
+        bucket._cut = None
+        bucket.throttled()
+    assert bucket.rate == .5
+
+
+def test_rate_limiter_families():
+    limiter = _RateLimiter(rate=4, max_rate=8)
+
+    def req(path):
+        return Request('https://api.planet.com/' + path, None)
+    data = req('data/v1/quick-search')
+    orders = req('compute/ops/orders/v2')
+    limiter.acquire(data)
+    limiter.acquire(orders)
+    limiter.feedback(data, TooManyRequests(''))
+    limiter.feedback(orders)
+    assert limiter.rates() == {'data': 2, 'orders': 4.12}
+    assert limiter.bucket(req('basemaps/v1/mosaics')) is not \
+        limiter.bucket(data)
+
+
+def test_pool_stats_api_and_redirect():
+    with local_server() as api, local_server() as storage:
+        base = api.base
+        api.redirect_to = storage.base + 'file'
+        dispatcher = RequestsDispatcher(workers=8, rate_limit=0,
+                                        base_url=base)
+        for _ in range(5):
+            dispatcher.session.get(base + 'thing').close()
+            dispatcher.session.get(base + 'redirect').close()
+        stats = dispatcher.pool_stats()
+        api_stats = stats['api'][base.rstrip('/')]
+        assert api_stats['maxsize'] == 9
+        assert api_stats['requests'] == 10
+        assert api_stats['connections'] == 1
+        assert api_stats['reused'] == 9
+        redirect = stats['redirect'][storage.base.rstrip('/')]
+        assert redirect['maxsize'] == 8
+        assert redirect['requests'] == 5
+        assert redirect['connections'] == 1
+
+
+def test_download_segments_pool_size():
+    with local_server() as server:
+        dispatcher = RequestsDispatcher(workers=4, rate_limit=0)
+        dispatcher.session.get(server.base + 'thing').close()
+        dispatcher.set_download_segments(3)
+        dispatcher.session.get(server.base + 'thing').close()
+        stats = dispatcher.pool_stats()['redirect'][server.base.rstrip('/')]
+        assert stats['maxsize'] == 12
+        # the counts of the pools replaced are kept
+        assert stats['requests'] == 2
+
+
+def test_pool_stats_reconnects():
+    with local_server() as server:
+        server.keep_alive = False
+        dispatcher = RequestsDispatcher(rate_limit=0, base_url=server.base)
+        for _ in range(5):
+            resp = dispatcher.session.get(server.base + 'thing')
+            assert resp.content == b'ok'
+        stats = dispatcher.pool_stats()['api'][server.base.rstrip('/')]
+        # the dropped connection is reconnected for each request
+        assert server.connections == 5
+        assert stats['requests'] == 5
+        assert stats['connections'] == 5
+        assert stats['reused'] == 0
+
+
+def _concurrently(n, func):
+    results, errors = [], []
+
+    def run():
+        try:
+            results.append(func())
+        except Exception as ex:
+            errors.append(ex)
+    threads = [threading.Thread(target=run) for _ in range(n)]
+    [th.start() for th in threads]
+    [th.join() for th in threads]
+    return results, errors
+
+
+def test_coalesce_concurrent_gets():
+    client = api.ClientV1('foobar', rate_limit=0)
+    item = {'_links': {'assets': client._url('data/v1/assets/x')}}
+
+    def slow(request, context):
+        time.sleep(.2)
+        return '{"a": 1}'
+    with requests_mock.Mocker() as m:
+        m.get(item['_links']['assets'], text=slow)
+        results, errors = _concurrently(
+            5, lambda: client.get_assets(item).get())
+        assert m.call_count == 1
+        # sequential requests are not coalesced
+        client.get_assets(item).get()
+        assert m.call_count == 2
+    assert not errors
+    assert results == [{'a': 1}] * 5
+    assert client.dispatcher.coalesce_stats() == {
+        'calls': 2, 'coalesced': 4}
+
+
+def test_coalesce_shares_errors():
+    client = api.ClientV1('foobar', rate_limit=0)
+    url = client._url('data/v1/missing')
+
+    def slow(request, context):
+        time.sleep(.2)
+        context.status_code = 404
+        return 'nope'
+    with requests_mock.Mocker() as m:
+        m.get(url, text=slow)
+        results, errors = _concurrently(3, lambda: client._get(url).get_body())
+        assert m.call_count == 1
+    assert len(errors) == 3
+    assert all(isinstance(e, MissingResource) for e in errors)
+
+
+def test_timeouts():
+    client = api.ClientV1('foobar', rate_limit=0)
+    with requests_mock.Mocker() as m:
+        m.get(client._url('data/v1/thing'), json={})
+        client._get('data/v1/thing').get_body()
+        assert m.last_request.timeout == DEFAULT_TIMEOUTS['api']
+
+
+def test_read_timeout_retried():
+    with local_server() as server:
+        client = api.ClientV1('foobar', base_url=server.base, rate_limit=0,
+                              retry=RetryPolicy(base=0))
+        client.dispatcher.timeouts['api'] = (1, .2)
+        body = client._get('slow', body_type=Body).get_body()
+        assert body.get_raw() == 'ok'
+        assert server.slow == 2
+        assert client.dispatcher.retry.stats()['retry_wait'] == {'timeout': 0}
+
+
+@pytest.mark.parametrize('transport', [None, Urllib3Transport()])
+def test_transports(transport):
+    with local_server() as server:
+        base = server.base
+        client = api.ClientV1('foobar', base_url=base, rate_limit=0)
+        if transport:
+            client.dispatcher.transport = transport
+        body = client._get('thing', body_type=Body,
+                           params={'a': 'b c', 'd': ['e', 'f']}).get_body()
+        assert body.get_raw() == 'ok'
+        client.dispatcher.response(Request(
+            base + 'post', client.auth, body_type=Body, data='{"x": 1}',
+            method='POST')).get_body()
+        (_, path, headers, _), (_, _, post_headers, data) = server.requests
+        assert path == '/thing?a=b+c&d=e&d=f'
+        assert headers['Authorization'] == 'api-key foobar'
+        assert headers['User-Agent'].startswith('planet-client-python/')
+        assert post_headers['Content-Type'] == 'application/json'
+        assert data == b'{"x": 1}'
+
+
+def test_urllib3_transport_redirects():
+    with local_server() as api, local_server() as storage:
+        transport = Urllib3Transport()
+        # the key is kept on the same domain
+        api.redirect_to = api.base + 'thing'
+        resp = transport.request('GET', api.base + 'redirect',
+                                 headers={'Authorization': 'api-key foobar'})
+        assert resp.content == b'ok'
+        assert api.requests[-1][2]['Authorization'] == 'api-key foobar'
+        # and moved to the url for another domain
+        api.redirect_to = 'http://localhost:%s/thing' % storage.server_port
+        resp = transport.request('GET', api.base + 'redirect',
+                                 headers={'Authorization': 'api-key foobar'})
+        assert resp.content == b'ok'
+        _, path, headers, _ = storage.requests[-1]
+        assert path == '/thing?api_key=foobar'
+        assert 'Authorization' not in headers
+
+
+def test_urllib3_transport_proxies(monkeypatch):
+    with local_server() as proxy:
+        monkeypatch.setenv('HTTP_PROXY', proxy.base)
+        monkeypatch.setenv('NO_PROXY', 'localhost')
+        transport = Urllib3Transport()
+        resp = transport.request('GET', 'http://planet.invalid/thing')
+        assert resp.content == b'ok'
+        assert proxy.requests[-1][1] == 'http://planet.invalid/thing'
+
+
+def test_urllib3_transport_strict_ssl(monkeypatch):
+    monkeypatch.setattr('planet.api.dispatch.USE_STRICT_SSL', False)
+    assert Urllib3Transport()._pool_kw['cert_reqs'] == 'CERT_NONE'
+    assert Urllib3Transport(verify=True)._pool_kw['cert_reqs'] == \
+        'CERT_REQUIRED'
+
+
+def test_urllib3_transport_connection_error():
+    with local_server() as server:
+        base = server.base
+    transport = Urllib3Transport()
+    with pytest.raises(ConnectionError):
+        transport.request('GET', base, timeout=(1, 1))
@@ -1,4 +1,6 @@
 from planet.api import downloader
+from planet.api.dispatch import RequestsDispatcher
+from planet.api.models import Request
 from planet.api.utils import handle_interrupt
 import logging
 import sys
@@ -27,7 +29,7 @@ class Body(object):
         self.name = name
         self._got_write = False
 
-    def write(self, file, callback):
+    def write(self, file, callback, **opts):
         callback(start=self)
         callback(total=1024, wrote=1024)
         callback(finish=self)
@@ -124,10 +126,221 @@ def test_pipeline():
                              asset_types, 'dest')
     assert stats == {
         'downloading': 0, 'complete': 200, 'paging': False,
-        'downloaded': '0.20MB', 'activating': 0, 'pending': 0
+        'downloaded': '0.20MB', 'activating': 0, 'pending': 0,
+        'polls_per_activation': stats['polls_per_activation'],
     }
+    assert stats['polls_per_activation'] >= 1
     assert 200 == len(completed)
 
 
+def test_stats_rate():
+    cl = HelperClient()
+    cl.dispatcher = RequestsDispatcher(rate_limit=4)
+    cl.dispatcher.limiter.acquire(
+        Request('https://api.planet.com/data/v1/quick-search', None))
+    dl = downloader.create(
+        cl, no_sleep=True, pstage__min_poll_interval=0)
+    stats = handle_interrupt(dl.shutdown, dl.download, items_iter(2),
+                             ['a', 'b'], 'dest')
+    assert stats['rate'] == {'data': 4}
+    assert stats['coalesced'] == 0
+
+
+class ActivateClient(object):
+
+    def __init__(self):
+        self.requests = []
+        self.assets = dict((t, {'type': t, 'status': 'inactive'})
+                           for t in ('a', 'b', 'c', 'd'))
+
+    def get_assets(self, item):
+        self.requests.append('get_assets')
+        return Resp(self.assets)
+
+    def activate(self, asset):
+        self.requests.append(asset['type'])
+        time.sleep(.1)
+
+
+def test_activate_stage_concurrent():
+    cl = ActivateClient()
+    stage = downloader._AStage(iter([{'id': '0'}]), cl, ['a', 'b', 'c'])
+    stage._min_sleep = 0
+    start = time.time()
+    stage.start()
+    item, assets = stage.next()
+    # all requested types activated at once, with one get_assets
+    assert time.time() - start < .25
+    assert cl.requests[0] == 'get_assets'
+    assert sorted(cl.requests[1:]) == ['a', 'b', 'c']
+    assert [assets[t]['status'] for t in 'abcd'] == \
+        ['activating'] * 3 + ['inactive']
+    # the response is not modified
+    assert cl.assets['a']['status'] == 'inactive'
+    assert stage.next() is False
+
+
+class PollClient(object):
+
+    def __init__(self, polls_to_active):
+        self.polls_to_active = polls_to_active
+        self.polls = []
+
+    def get_assets(self, item):
+        self.polls.append((item['id'], time.time()))
+        count = sum(1 for i, _ in self.polls if i == item['id'])
+        status = 'active' if count >= self.polls_to_active else 'activating'
+        return Resp({'a': {'status': status}})
+
+
+def test_poll_stage_schedule():
+    interval = .05
+    cl = PollClient(polls_to_active=3)
+    source = iter([({'id': str(i)}, {'a': {'status': 'activating'}})
+                   for i in range(20)] +
+                  [({'id': 'ready'}, {'a': {'status': 'active'}})])
+    stage = downloader._PStage(source, cl, ['a'])
+    stage._min_sleep = 0
+    stage._min_poll_interval = interval
+    idle = []
+    next_task = stage._next_task
+
+    def counting():
+        task = next_task()
+        if task is None:
+            idle.append(task)
+        return task
+    stage._next_task = counting
+    stage.start()
+    done = []
+    while True:
+        result = stage.next()
+        if result is False:
+            break
+        done.append(result[0]['id'])
+    # an active item is not polled
+    assert done[0] == 'ready'
+    assert sorted(done[1:]) == sorted(str(i) for i in range(20))
+    assert len(cl.polls) == 60
+    # items are polled in turn, each once per interval
+    assert [i for i, _ in cl.polls] == [str(i) for i in range(20)] * 3
+    for i in range(20):
+        times = [t for p, t in cl.polls if p == str(i)]
+        assert all(b - a >= interval * .9 for a, b in zip(times, times[1:]))
+    # the stage sleeps until a poll is due rather than spinning
+    assert len(idle) < 20
+    assert stage.polls_per_activation() == 3
+
+
+class Feed(downloader._Stage):
+    '''Produces the tasks of its source as results.'''
+
+    def _do(self, task):
+        self._put(task)
+
+
+def test_poll_stage_wakes_for_new_items():
+    done = threading.Event()
+
+    def source():
+        yield ({'id': 'slow'}, {'a': {'status': 'activating'}})
+        time.sleep(.2)
+        yield ({'id': 'ready'}, {'a': {'status': 'active'}})
+        # the source stays open
+        done.wait(10)
+    feed = Feed(source(), 1)
+    feed._min_sleep = 0
+    stage = downloader._PStage(feed, PollClient(polls_to_active=100), ['a'])
+    stage._min_sleep = 0
+    stage._min_poll_interval = 60
+    feed.start()
+    stage.start()
+    t = time.time()
+    try:
+        item, _ = stage.next()
+        # neither the poll due in a minute nor the open source hold it up
+        assert item['id'] == 'ready'
+        assert time.time() - t < 2
+    finally:
+        done.set()
+        feed.cancel()
+        stage.cancel()
+
+
+def run_poll_stage(stage, count):
+    stage._min_sleep = 0
+    stage.start()
+    for _ in range(count):
+        assert stage.next()
+    assert stage.next() is False
+
+
+def test_poll_stage_backoff():
+    interval = .02
+    cl = PollClient(polls_to_active=4)
+    start = time.time()
+    source = iter([({'id': '0'}, {'a': {'status': 'activating'}})])
+    stage = downloader._PStage(source, cl, ['a'])
+    stage._min_poll_interval = interval
+    run_poll_stage(stage, 1)
+    times = [start] + [t for _, t in cl.polls]
+    gaps = [b - a for a, b in zip(times, times[1:])]
+    # the first poll after the interval, then doubling
+    for gap, expected in zip(gaps, [1, 1, 2, 4]):
+        assert expected * interval * .9 <= gap < expected * interval + .05
+
+
+def test_poll_stage_estimates(tmpdir):
+    path = str(tmpdir.join('estimates.json'))
+    estimates = downloader.ActivationEstimates(path)
+    assert estimates.get('PSScene', 'a') is None
+    estimates.observe('PSScene', 'a', .2)
+    estimates.save()
+    estimates = downloader.ActivationEstimates(path)
+    assert estimates.get('PSScene', 'a') == .2
+
+    cl = PollClient(polls_to_active=1)
+    start = time.time()
+    item = {'id': '0', 'properties': {'item_type': 'PSScene'}}
+    source = iter([(item, {'a': {'status': 'activating'}})])
+    stage = downloader._PStage(source, cl, ['a'], estimates)
+    stage._min_poll_interval = .01
+    run_poll_stage(stage, 1)
+    # the first poll is scheduled from the estimate
+    (_, polled), = cl.polls
+    assert .9 * .2 * .9 <= polled - start < .2
+    assert stage.polls_per_activation() == 1
+    # active by the first poll, so the estimate moves down to at most the
+    # time of that poll
+    observed = estimates.get('PSScene', 'a')
+    assert .9 * .2 * .9 <= observed < .2
+    assert estimates.get('PSScene', 'b') is None
+
+
+def test_poll_stage_estimates_censored():
+    estimates = downloader.ActivationEstimates()
+    item = {'id': '0', 'properties': {'item_type': 'PSScene'}}
+
+    def poll(polls_to_active, first_poll=.9):
+        source = iter([(item, {'a': {'status': 'activating'}})])
+        stage = downloader._PStage(source, PollClient(polls_to_active),
+                                   ['a'], estimates)
+        stage._min_poll_interval = .05
+        stage._first_poll = first_poll
+        run_poll_stage(stage, 1)
+
+    # an activation that finished before the first poll is not observed
+    poll(1)
+    assert estimates.get('PSScene', 'a') is None
+    # one between polls is observed at the midpoint
+    poll(2)
+    observed = estimates.get('PSScene', 'a')
+    assert .05 <= observed < .1
+    # an activation finished by a first poll after the estimate does not
+    # lower it
+    poll(1, first_poll=1)
+    assert estimates.get('PSScene', 'a') == observed
+
+
 if __name__ == '__main__':
     test_pipeline()
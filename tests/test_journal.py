@@ -0,0 +1,142 @@
+import sqlite3
+
+from planet.api import downloader
+from planet.api import journal
+from planet.api.journal import Journal
+import pytest
+
+from test_downloader import HelperClient
+
+
+class Page(object):
+    '''A page of a paged search, like models.Items.'''
+    ITEM_KEY = 'features'
+
+    def __init__(self, pages, index):
+        self.pages = pages
+        self.index = index
+
+    def get(self):
+        return {'features': self.pages[self.index]}
+
+    def _next_url(self):
+        if self.index + 1 < len(self.pages):
+            return 'page/%d' % (self.index + 1)
+
+    def iter(self):
+        page = self
+        while page is not None:
+            yield page
+            url = page._next_url()
+            page = url and Page(self.pages, int(url.split('/')[1]))
+
+
+def pages(count, size):
+    return [[{'id': '%d-%d' % (p, i)} for i in range(size)]
+            for p in range(count)]
+
+
+class Dispatcher(object):
+
+    def __init__(self, pages):
+        self.pages = pages
+        self.requests = []
+
+    def response(self, request):
+        self.requests.append(request.url)
+        page = Page(self.pages, int(request.url.split('/')[1]))
+        page.get_body = lambda: page
+        return page
+
+
+class Client(object):
+    auth = None
+
+    def __init__(self, pages):
+        self.dispatcher = Dispatcher(pages)
+
+
+def test_journal_job(tmpdir):
+    path = str(tmpdir.join('job.db'))
+    jnl = Journal(path)
+    with pytest.raises(ValueError):
+        jnl.job()
+    jnl.begin(['a', 'b'], '/dest', 10)
+    with pytest.raises(ValueError):
+        jnl.begin(['a'])
+    jnl.close()
+    jnl = Journal(path)
+    assert jnl.job() == {'asset_types': ['a', 'b'], 'dest': '/dest',
+                         'limit': 10}
+    mode, = sqlite3.connect(path).execute('PRAGMA journal_mode').fetchone()
+    assert mode == 'wal'
+
+
+def test_journal_resume(tmpdir):
+    path = str(tmpdir.join('job.db'))
+    search = pages(3, 4)
+    jnl = Journal(path)
+    jnl.begin(['a', 'b'])
+    items = jnl.record(Page(search, 0))
+    # stopped part way through the second page
+    seen = [next(items)['id'] for _ in range(6)]
+    assert seen == ['0-0', '0-1', '0-2', '0-3', '1-0', '1-1']
+    for item_id in seen[:3]:
+        jnl.set_state(item_id, 'a', journal.DONE, path='/dest/' + item_id)
+        jnl.set_state(item_id, 'b', journal.DONE)
+    jnl.set_state('0-3', 'a', journal.DONE)
+    jnl.set_state('0-3', 'b', journal.DOWNLOADING)
+    jnl.set_state('1-0', 'a', journal.FAILED, error='bad')
+    assert jnl.counts() == {'done': 7, 'downloading': 1, 'failed': 1,
+                            'queued': 7}
+    assert jnl.state('0-3', 'b') == 'downloading'
+    assert jnl.state('0-3', 'c') is None
+    # done assets stay done
+    jnl.set_state('0-0', 'a', journal.ACTIVE)
+    assert jnl.state('0-0', 'a') == 'done'
+    jnl.close()
+
+    jnl = Journal(path)
+    client = Client(search)
+    resumed = [i['id'] for i in jnl.resume(client)]
+    # the unfinished items of the recorded pages, then the pages after
+    assert resumed == ['0-3', '1-0', '1-1', '1-2', '1-3',
+                       '2-0', '2-1', '2-2', '2-3']
+    assert client.dispatcher.requests == ['page/2']
+    # nothing is paged again once the search is recorded
+    client.dispatcher.requests = []
+    assert len(list(jnl.resume(client))) == 9
+    assert client.dispatcher.requests == []
+
+
+def test_journal_limit(tmpdir):
+    jnl = Journal(str(tmpdir.join('job.db')))
+    jnl.begin(['a'], limit=6)
+    items = [i['id'] for i in jnl.record(Page(pages(3, 4), 0))]
+    assert items == ['0-0', '0-1', '0-2', '0-3', '1-0', '1-1']
+    assert jnl.counts() == {'queued': 6}
+    assert list(jnl.resume(Client([]))) == [{'id': i} for i in items]
+    # pending items are read in batches
+    jnl._batch_size = 4
+    assert list(jnl.resume(Client([]))) == [{'id': i} for i in items]
+    jnl._batch_size = 3
+    assert list(jnl.resume(Client([]))) == [{'id': i} for i in items]
+
+
+def test_downloader_journal(tmpdir):
+    jnl = Journal(str(tmpdir.join('job.db')))
+    jnl.begin(['a', 'b'])
+    cl = HelperClient()
+    dl = downloader.create(
+        cl, no_sleep=True, pstage__min_poll_interval=0, journal=jnl)
+    items = jnl.record(Page(pages(2, 5), 0))
+    dl.download(items, ['a', 'b'], 'dest')
+    assert jnl.counts() == {'done': 20}
+    assert jnl.state('1-4', 'b') == 'done'
+
+    # a resumed job with everything done makes no requests
+    cl = HelperClient()
+    dl = downloader.create(
+        cl, no_sleep=True, pstage__min_poll_interval=0, journal=jnl)
+    dl.download(jnl.resume(Client([])), ['a', 'b'], 'dest')
+    assert cl.assets == {}
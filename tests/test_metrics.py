@@ -0,0 +1,125 @@
+# Copyright 2021 Planet Labs, Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+from planet import api
+from planet.api.metrics import endpoint_template
+from planet.api.metrics import Listener
+from planet.api.metrics import Metrics
+from planet.api.retry import RetryPolicy
+import pytest
+import requests_mock
+
+ASSETS = 'GET /data/v1/item-types/PSScene/items/{id}/assets/'
+API = 'https://api.planet.com'
+
+
+class NoWaitPolicy(RetryPolicy):
+
+    def backoff(self, last_wait):
+        return 0
+
+
+def client_with(metrics, rate_limit=0, **kw):
+    client = api.ClientV1('foobar', rate_limit=rate_limit,
+                          retry=NoWaitPolicy(), **kw)
+    client.dispatcher.add_listener(metrics)
+    return client
+
+
+def item(client, item_id):
+    return {'_links': {'assets': client._url(
+        'data/v1/item-types/PSScene/items/%s/assets/' % item_id)}}
+
+
+@pytest.mark.parametrize('path, template', [
+    # item types are names, even with digits
+    ('/data/v1/item-types/PSScene4Band/items/20210101_180000_0f4e/assets/',
+     '/data/v1/item-types/PSScene4Band/items/{id}/assets/'),
+    ('/data/v1/item-types/Sentinel2L1C/items/S2A_MSIL1C_20210101/',
+     '/data/v1/item-types/Sentinel2L1C/items/{id}/'),
+    ('/data/v1/item-types/REOrthoTile/items/20210101_123456_3357_RE3/',
+     '/data/v1/item-types/REOrthoTile/items/{id}/'),
+    ('/data/v1/item-types/', '/data/v1/item-types/'),
+    ('/data/v1/searches/4e5bc1ee5c6f4b9db1c5a9f5f3e8a2d1/results',
+     '/data/v1/searches/{id}/results'),
+    ('/compute/ops/orders/v2', '/compute/ops/orders/v2'),
+    ('/compute/ops/orders/v2/7b4c8e2e-0d9a-4c9e-9a5e-2f6b1f8e0f3c',
+     '/compute/ops/orders/v2/{id}'),
+    ('/basemaps/v1/mosaics/48fff803-4104-49bc-b913-7467b7a5ffb5/quads/'
+     '1234-987/full', '/basemaps/v1/mosaics/{id}/quads/{id}/full'),
+    ('/data/v1/download', '/data/v1/download'),
+])
+def test_endpoint_template(path, template):
+    assert endpoint_template(API + path + '?token=x') == template
+
+
+def test_snapshot():
+    metrics = Metrics(buckets=(1, 60))
+    client = client_with(metrics)
+    with requests_mock.Mocker() as m:
+        m.get(item(client, '20210101_a')['_links']['assets'], [
+            {'status_code': 429, 'text': ''},
+            {'json': {'a': 1}, 'headers': {'Content-Length': '8'}},
+        ])
+        m.get(item(client, '20210101_b')['_links']['assets'], json={})
+        client.get_assets(item(client, '20210101_a')).get()
+        client.get_assets(item(client, '20210101_b')).get()
+    ep = metrics.snapshot()['endpoints'][ASSETS]
+    assert ep['count'] == 3
+    assert ep['status'] == {'200': 2, '429': 1}
+    assert ep['retries'] == {'throttled': 1}
+    assert ep['buckets'] == {1: 3, 60: 3, '+Inf': 3}
+    assert ep['bytes_in'] == 8 + 2
+
+
+def test_throttle_wait():
+    metrics = Metrics()
+    client = client_with(metrics, rate_limit=20, burst=1)
+    with requests_mock.Mocker() as m:
+        m.get(item(client, 'x1')['_links']['assets'], json={})
+        for _ in range(3):
+            client.get_assets(item(client, 'x1')).get()
+    snapshot = metrics.snapshot()
+    assert snapshot['throttle_waits'] == 2
+    assert 0 < snapshot['throttle_wait'] < 1
+
+
+def test_listener_errors_ignored():
+    class Broken(Listener):
+        def request_start(self, request):
+            raise Exception('boom')
+
+    metrics = Metrics()
+    client = client_with(metrics)
+    client.dispatcher.add_listener(Broken())
+    with requests_mock.Mocker() as m:
+        m.get(item(client, 'x1')['_links']['assets'], json={})
+        assert client.get_assets(item(client, 'x1')).get() == {}
+    assert metrics.snapshot()['endpoints'][ASSETS]['count'] == 1
+
+
+def test_prometheus():
+    metrics = Metrics(buckets=(.5,))
+    client = client_with(metrics)
+    with requests_mock.Mocker() as m:
+        m.get(item(client, 'x1')['_links']['assets'], json={})
+        client.get_assets(item(client, 'x1')).get()
+    text = metrics.prometheus()
+    labels = 'method="GET",endpoint="/data/v1/item-types/PSScene/items/' \
+        '{id}/assets/"'
+    assert '# TYPE planet_client_request_duration_seconds histogram' in text
+    assert ('planet_client_request_duration_seconds_bucket{%s,le="+Inf"} 1'
+            % labels) in text
+    assert ('planet_client_requests_total{%s,status="200"} 1'
+            % labels) in text
+    assert 'planet_client_throttle_waits_total 0\n' in text
@@ -12,11 +12,28 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 
+import hashlib
 import io
 import json
+import os
+import socket
+import time
+
 import pytest
-from planet.api.models import Features, Paged, Request, Response, WFS3Features
+import requests
+from requests.exceptions import ConnectionError
+from planet import api
+from planet.api import models
+from planet.api.exceptions import ChecksumMismatch
+from planet.api.exceptions import MissingResource
+from planet.api.exceptions import StalledTransfer
+from planet.api.models import Body
+from planet.api.models import Features
+from planet.api.models import JSON, Paged, Request, Response, WFS3Features
 from mock import MagicMock
+
+from _common import content
+from _common import local_server
 # try:
 #     from StringIO import StringIO as Buffy
 # except ImportError:
@@ -149,3 +166,312 @@ def test_wf3_features(limit):
     features.json_encode(buf, limit)
     features_json = json.loads(buf.getvalue())
     assert len(features_json['features']) == limit if limit else num_items
+
+
+def test_body_write_restarts_stalled(monkeypatch):
+    monkeypatch.setattr(models, 'stall_window', 0)
+    monkeypatch.setattr(models, 'stall_throughput', 1e12)
+    monkeypatch.setattr(models, 'stall_restarts', 1)
+    req = Request('url', 'auth')
+    dispatcher = MagicMock(name='dispatcher')
+    fast = mock_http_response(json=None,
+                              iter_content=lambda chunk_size: [b'a' * 10])
+    dispatcher._stream.return_value = fast
+    body = Body(req, mock_http_response(
+        json=None, iter_content=lambda chunk_size: [b'b' * 10]), dispatcher)
+    # every window is too slow, give up after one restart
+    buf = io.BytesIO()
+    with pytest.raises(StalledTransfer):
+        body.write(buf)
+    assert dispatcher.hooks.transfer_stalled.call_count == 2
+    assert dispatcher.hooks.transfer_aborted.call_count == 1
+    # a fast enough restart completes, reporting each byte once
+    monkeypatch.setattr(models, 'stall_throughput', 0)
+    progress = []
+    slow = [b'b' * 10, b'c' * 5]
+
+    def stall_once(chunk_size):
+        for chunk in slow:
+            yield chunk
+        raise ConnectionError('read timed out')
+    body = Body(req, mock_http_response(json=None, iter_content=stall_once),
+                dispatcher)
+    buf = io.BytesIO()
+    body.write(buf, lambda **kw: progress.append(kw.get('wrote')))
+    assert buf.getvalue() == b'a' * 10
+    assert sum(p for p in progress if p) == 15
+
+
+def test_json_decoded_once():
+    resp = mock_http_response(json={'features': [], '_links': {}})
+    body = Paged(Request('url', 'auth'), resp, MagicMock(name='dispatcher'))
+    assert body.get() is body.get()
+    assert body.next() is None
+    assert list(body.items_iter(None)) == []
+    assert resp.json.call_count == 1
+
+
+@pytest.mark.parametrize('backend', [None, json.loads])
+def test_json_backends(monkeypatch, backend):
+    monkeypatch.setattr(models, 'json_loads', backend)
+    resp = requests.Response()
+    resp._content = u'{"name": "caf\u00e9"}'.encode('utf-8')
+    body = JSON(Request('url', 'auth'), resp, None)
+    assert body.get() == {'name': u'caf\u00e9'}
+    # content that is not UTF-8 is decoded by requests
+    resp = requests.Response()
+    resp._content = u'{"name": "caf\u00e9"}'.encode('latin-1')
+    resp.encoding = 'latin-1'
+    body = JSON(Request('url', 'auth'), resp, None)
+    assert body.get() == {'name': u'caf\u00e9'}
+
+
+@pytest.mark.parametrize('af', [False, True])
+def test_prefetch_items(af):
+    body = WFS3Features if af else Thingees
+    key = 'features' if af else 'thingees'
+    expected = list(thingees(5, 5, key=key, body=body, af=af).items_iter(None))
+    paged = thingees(5, 5, key=key, body=body, af=af)
+    assert list(paged.items_iter(None, prefetch=2)) == expected
+    paged = thingees(5, 5, key=key, body=body, af=af)
+    assert len(list(paged.iter(prefetch=1))) == 5
+
+
+def counting(paged):
+    fetched = []
+    dispatch = paged._dispatcher._dispatch.side_effect
+
+    def fetch(request):
+        fetched.append(request)
+        return next(dispatch)
+    paged._dispatcher._dispatch.side_effect = fetch
+    return fetched
+
+
+def test_prefetch_overlaps_and_stops_early():
+    paged = thingees(5, 5)
+    fetched = counting(paged)
+    pages = paged.iter(prefetch=1)
+    assert next(pages) is paged
+    # the next page is fetched while the first is consumed
+    deadline = time.time() + 2
+    while not fetched and time.time() < deadline:
+        time.sleep(.01)
+    assert len(fetched) == 1
+    pages.close()
+    # reaching the limit stops fetching, with at most one page read ahead
+    paged = thingees(5, 5)
+    fetched = counting(paged)
+    items = list(paged.items_iter(7, prefetch=1))
+    assert [i['thingee'] for i in items] == list(range(7))
+    time.sleep(.3)
+    assert len(fetched) <= 3
+
+
+def test_prefetch_error():
+    paged = thingees(5, 5)
+    paged._dispatcher._dispatch.side_effect = MissingResource('gone')
+    items = paged.items_iter(None, prefetch=2)
+    assert len([next(items) for _ in range(5)]) == 5
+    with pytest.raises(MissingResource):
+        next(items)
+
+
+def test_readinto_chunks(monkeypatch):
+    monkeypatch.setattr(models, 'min_read_size', 4)
+    monkeypatch.setattr(models, 'max_read_size', 16)
+    monkeypatch.setattr(models, 'read_interval', 10)
+    data = bytes(bytearray(range(100)))
+    sizes = []
+    out = io.BytesIO()
+    for chunk in models._readinto_chunks(io.BufferedReader(io.BytesIO(data))):
+        sizes.append(len(chunk))
+        out.write(chunk)
+    assert out.getvalue() == data
+    # fast reads grow up to the maximum
+    assert sizes[:4] == [4, 8, 16, 16]
+
+    class Broken(io.BufferedIOBase):
+        def readinto(self, b):
+            raise socket.timeout('timed out')
+    with pytest.raises(ConnectionError):
+        list(models._readinto_chunks(Broken()))
+
+
+def test_body_write_batches_progress(monkeypatch):
+    monkeypatch.setattr(models, 'progress_interval', 60)
+    monkeypatch.setattr(models, 'progress_bytes', 25)
+    chunks = [b'a' * 10] * 6
+    body = Body(Request('url', 'auth'), mock_http_response(
+        json=None, iter_content=lambda chunk_size: chunks), MagicMock())
+    progress = []
+    body.write(io.BytesIO(), lambda **kw: progress.append(kw.get('wrote')))
+    assert progress == [None, 30, 30, None]
+
+
+def stream_body(server, path, client=None):
+    '''A Body streaming from the local server.'''
+    client = client or api.ClientV1('foobar', base_url=server.base,
+                                    rate_limit=0)
+    request = Request(server.base + path, client.auth, body_type=Body)
+    return Body(request, client.dispatcher._stream(request),
+                client.dispatcher)
+
+
+def test_download_reads_into_buffer(monkeypatch):
+    monkeypatch.setattr(models, 'min_read_size', 1024)
+    monkeypatch.setattr(models, 'read_interval', 10)
+    monkeypatch.setattr(models, 'progress_interval', 60)
+    size = 1024 * 1024 + 7
+    with local_server() as server:
+        body = stream_body(server, 'big/%d' % size)
+        assert body._direct_fp() is not None
+        buf = io.BytesIO()
+        progress = []
+        body.write(buf, lambda **kw: progress.append(kw))
+    assert buf.getvalue() == content(size)
+    # the start, a single batched progress report and the finish
+    assert progress[1:-1] == [{'wrote': size, 'total': size}]
+    assert body.size == size
+
+
+@pytest.mark.parametrize('path, break_ranges', [
+    ('big', 0), ('big', 1), ('big/norange', 0)
+])
+def test_segmented_download(tmpdir, monkeypatch, path, break_ranges):
+    monkeypatch.setattr(models, 'segment_min_size', 1024)
+    size = 1024 * 1024 + 3
+    dest = str(tmpdir.join('out'))
+    progress = []
+    with local_server() as server:
+        server.break_ranges = break_ranges
+        body = stream_body(server, '%s/%d' % (path, size))
+        body.write(dest, lambda **kw: progress.append(kw), segments=4)
+    with open(dest, 'rb') as fp:
+        assert fp.read() == content(size)
+    assert sum(p.get('wrote', 0) for p in progress) == size
+    assert 'finish' in progress[-1]
+    ranges = [h.get('Range') for _, _, h, _ in server.requests]
+    if path == 'big/norange':
+        # the server does not accept ranges
+        assert ranges == [None]
+    else:
+        assert ranges[0] is None
+        assert set(ranges[1:]) >= set(['bytes=262144-524288',
+                                       'bytes=524289-786433',
+                                       'bytes=786434-1048578'])
+        # a broken range is resumed from where it stopped
+        assert len(ranges) == 4 + break_ranges
+    assert tmpdir.listdir() == [tmpdir.join('out')]
+
+
+def test_resumed_download(tmpdir, monkeypatch):
+    monkeypatch.setattr(models, 'min_read_size', 1024)
+    # a broken transfer is not restarted
+    monkeypatch.setattr(models, 'stall_restarts', 0)
+    size = 256 * 1024
+    dest = str(tmpdir.join('out'))
+    with local_server() as server:
+        def write(callback=None):
+            stream_body(server, 'big/%d' % size).write(
+                dest, callback, resume=True)
+
+        # the server hangs up half way
+        server.truncate = 1
+        with pytest.raises(ConnectionError):
+            write()
+        with open(dest + '.part.json') as fp:
+            sidecar = json.load(fp)
+        assert sidecar['etag'] == '"v1"'
+        assert sidecar['size'] == size
+        assert sidecar['completed'] == [[0, size // 2]]
+        assert not os.path.exists(dest)
+
+        progress = []
+        write(lambda **kw: progress.append(kw))
+        with open(dest, 'rb') as fp:
+            assert fp.read() == content(size)
+        assert tmpdir.listdir() == [tmpdir.join('out')]
+        _, _, headers, _ = server.requests[-1]
+        assert headers['Range'] == 'bytes=%d-%d' % (size // 2, size - 1)
+        assert headers['If-Range'] == '"v1"'
+        assert sum(p.get('wrote', 0) for p in progress) == size // 2
+        assert [p['total'] for p in progress if 'total' in p][-1] == size
+
+        # a partial download of other content is discarded
+        os.unlink(dest)
+        server.truncate = 1
+        with pytest.raises(ConnectionError):
+            write()
+        server.etag = '"v2"'
+        server.requests = []
+        write()
+        with open(dest, 'rb') as fp:
+            assert fp.read() == content(size)
+        assert [h.get('Range') for _, _, h, _ in server.requests] == [None]
+
+
+@pytest.mark.parametrize('opts', [{}, {'segments': 4}, {'resume': True}])
+@pytest.mark.parametrize('corrupt', [0, 1, 100])
+def test_verified_download(tmpdir, monkeypatch, opts, corrupt):
+    monkeypatch.setattr(models, 'segment_min_size', 1024)
+    size = 256 * 1024
+    digests = {'md5': hashlib.md5(content(size)).hexdigest().upper()}
+    dest = str(tmpdir.join('out'))
+    retries = []
+    with local_server() as server:
+        server.corrupt = corrupt
+        client = api.ClientV1('foobar', base_url=server.base, rate_limit=0)
+        client.dispatcher.hooks.request_retry = \
+            lambda req, attempt, wait, reason: retries.append(reason)
+        body = stream_body(server, 'big/%d' % size, client)
+        if corrupt > models.checksum_retries:
+            with pytest.raises(ChecksumMismatch) as ex:
+                body.write(dest, digests=digests, **opts)
+            assert ex.value.kind == 'md5'
+            assert tmpdir.listdir() == []
+        else:
+            body.write(dest, digests=digests, **opts)
+            with open(dest, 'rb') as fp:
+                assert fp.read() == content(size)
+            assert tmpdir.listdir() == [tmpdir.join('out')]
+    assert retries == ['checksum'] * min(corrupt, models.checksum_retries)
+
+
+def test_write_ranges_reports_last_bytes(monkeypatch):
+    def write_range(self, fp, lock, segment, stop):
+        with lock:
+            segment.pos = segment.end
+    monkeypatch.setattr(Body, '_write_range', write_range)
+    monkeypatch.setattr(models, 'progress_interval', 60)
+    body = Body(Request('url', 'auth'), mock_http_response(json=None),
+                MagicMock())
+    progress = []
+    # the segments are written before any is checked
+    body._write_ranges(io.BytesIO(), lambda **kw: progress.append(kw), [
+        models._Segment(start, start + 10) for start in (0, 10, 20, 30)])
+    assert sum(p.get('wrote', 0) for p in progress) == 40
+    assert progress[-2]['total'] == 40
+    assert 'finish' in progress[-1]
+
+
+@pytest.mark.parametrize('path', ['big/%d', 'big/norange/%d'])
+def test_download_reuses_connection(tmpdir, path):
+    size = 100 * 1024
+    with local_server() as server:
+        client = api.ClientV1('foobar', base_url=server.base, rate_limit=0)
+        for i in range(5):
+            body = stream_body(server, path % size, client)
+            assert body._direct_fp() is not None
+            body.write(str(tmpdir.join(str(i))))
+        assert server.connections == 1
+        # a body that is not read to the end does not return its connection
+        body = stream_body(server, path % size, client)
+        chunks = body._iter_chunks()
+        next(chunks)
+        chunks.close()
+        stream_body(server, path % size, client).write(
+            str(tmpdir.join('last')))
+        assert server.connections == 2
+    for i in range(5):
+        assert tmpdir.join(str(i)).read_binary() == content(size)
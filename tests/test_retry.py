@@ -0,0 +1,128 @@
+# Copyright 2021 Planet Labs, Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+import os
+import random
+
+from planet import api
+from planet.api.models import Request
+from planet.api.retry import RetryPolicy
+import pytest
+import requests
+import requests_mock
+
+
+class NoWaitPolicy(RetryPolicy):
+    '''records the waits it would have used without sleeping'''
+
+    def __init__(self, **kw):
+        RetryPolicy.__init__(self, **kw)
+        self.waits = []
+
+    def get_wait(self, *a, **kw):
+        wait, reason = RetryPolicy.get_wait(self, *a, **kw)
+        if wait is not None:
+            self.waits.append(wait)
+            wait = 0
+        return wait, reason
+
+
+@pytest.fixture()
+def policy():
+    return NoWaitPolicy(rand=random.Random(1))
+
+
+@pytest.fixture()
+def client(policy):
+    return api.ClientV1('foobar', rate_limit=0, retry=policy)
+
+
+def test_backoff_decorrelated_jitter():
+    policy = RetryPolicy(base=1, cap=10, rand=random.Random(1))
+    last = 0
+    for _ in range(20):
+        wait = policy.backoff(last)
+        assert 1 <= wait <= min(10, max(1, last * 3))
+        last = wait
+
+
+def test_reason():
+    policy = RetryPolicy()
+    get = Request('url', 'auth')
+    post = Request('url', 'auth', method='POST')
+    resp = requests.Response()
+    resp.status_code = 503
+    throttled = api.exceptions.TooManyRequests('')
+    conn = requests.exceptions.ConnectionError()
+    assert policy.reason(post, error=throttled) == 'throttled'
+    assert policy.reason(get, error=throttled) == 'throttled'
+    assert policy.reason(get, resp, api.exceptions.APIException()) == 'server'
+    assert policy.reason(post, resp, api.exceptions.APIException()) is None
+    assert policy.reason(get, error=conn) == 'connection'
+    assert policy.reason(post, error=conn) is None
+    assert policy.reason(get, error=api.exceptions.OverQuota('')) is None
+
+
+def test_retry_after_honored(client, policy):
+    with requests_mock.Mocker() as m:
+        uri = os.path.join(client.base_url, 'whatevs')
+        m.get(uri, [
+            {'text': 'slow down', 'status_code': 429,
+             'headers': {'Retry-After': '7'}},
+            {'text': 'test', 'status_code': 200},
+        ])
+        assert 'test' == client._get('whatevs').get_body().get_raw()
+    assert policy.waits == [7]
+    stats = policy.stats()
+    assert stats['attempts'] == 2
+    assert stats['retries'] == 1
+    assert stats['retry_wait'] == {'throttled': 0}
+
+
+def test_retry_server_error_idempotent_only(client, policy):
+    with requests_mock.Mocker() as m:
+        uri = os.path.join(client.base_url, 'whatevs')
+        m.get(uri, [
+            {'text': 'oops', 'status_code': 502},
+            {'text': 'oops', 'status_code': 500},
+            {'text': 'test', 'status_code': 200},
+        ])
+        assert 'test' == client._get('whatevs').get_body().get_raw()
+        assert len(policy.waits) == 2
+
+        uri = os.path.join(client.base_url, 'data/v1/searches/')
+        m.post(uri, text='oops', status_code=503)
+        with pytest.raises(api.exceptions.APIException):
+            client.create_search({})
+        assert m.call_count == 4
+
+
+def test_retry_gives_up(client, policy):
+    with requests_mock.Mocker() as m:
+        uri = os.path.join(client.base_url, 'whatevs')
+        m.get(uri, text='slow down', status_code=429)
+        with pytest.raises(api.exceptions.TooManyRequests):
+            client._get('whatevs').get_body()
+        assert m.call_count == policy.max_attempts
+    assert policy.stats()['failures'] == 1
+
+
+def test_retry_connection_error(client, policy):
+    with requests_mock.Mocker() as m:
+        uri = os.path.join(client.base_url, 'whatevs')
+        m.get(uri, [
+            {'exc': requests.exceptions.ConnectionError},
+            {'text': 'test', 'status_code': 200},
+        ])
+        assert 'test' == client._get('whatevs').get_body().get_raw()
+    assert policy.stats()['retry_wait'] == {'connection': 0}
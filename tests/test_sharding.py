@@ -0,0 +1,212 @@
+# Copyright 2021 Planet Labs, Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import io
+import json
+import os
+import threading
+
+from planet import api
+from planet.api import filters
+from planet.api import sharding
+from planet.api.sharding import ShardedItems
+from planet.api.sharding import merge_sorted
+from planet.api.sharding import shard_boundaries
+from planet.api.sharding import shard_requests
+from planet.api.sharding import sort_key
+import pytest
+import requests_mock
+
+
+def buckets(*counts):
+    return [{'start_time': '2020-01-%02dT00:00:00.000000Z' % day,
+             'count': count} for day, count in enumerate(counts, 1)]
+
+
+class FakeItems(object):
+
+    def __init__(self, items, closed=None):
+        self._items = items
+        self._closed = closed
+
+    def items_iter(self, limit, prefetch=0):
+        try:
+            for item in self._items:
+                if isinstance(item, Exception):
+                    raise item
+                yield item
+        finally:
+            if self._closed:
+                self._closed.set()
+
+
+def search(*ids, **kw):
+    items = [i if isinstance(i, Exception) else {'id': i} for i in ids]
+    return lambda: FakeItems(items, kw.get('closed'))
+
+
+def test_shard_boundaries():
+    def days(*d):
+        return ['2020-01-%02dT00:00:00.000000Z' % i for i in d]
+    assert shard_boundaries(buckets(5, 5, 5, 5), 2) == days(3)
+    assert shard_boundaries(buckets(5, 5, 5, 5), 4) == days(2, 3, 4)
+    # a single large bucket cannot be split
+    assert shard_boundaries(buckets(1, 100, 1), 3) == days(2, 3)
+    assert shard_boundaries(buckets(100), 4) == []
+    assert shard_boundaries(buckets(0, 0), 2) == []
+    # unsorted buckets
+    assert shard_boundaries(buckets(5, 5)[::-1], 2) == days(2)
+
+
+def test_shard_requests():
+    filt = filters.range_filter('cloud_cover', lt=.1)
+    request = filters.build_search_request(filt, ['PSScene4Band'])
+    shards = shard_requests(request, ['2020-01-02', '2020-01-03'])
+    assert len(shards) == 3
+    acquired = [s['filter']['config'][1]['config'] for s in shards]
+    assert acquired == [
+        {'lt': '2020-01-02T00:00:00Z'},
+        {'gte': '2020-01-02T00:00:00Z', 'lt': '2020-01-03T00:00:00Z'},
+        {'gte': '2020-01-03T00:00:00Z'},
+    ]
+    for shard in shards:
+        assert shard['filter']['config'][0] == filt
+        assert shard['item_types'] == ['PSScene4Band']
+    # the request is not modified
+    assert request['filter'] == filt
+    assert shard_requests(request, []) == [request]
+
+
+def test_sharded_items():
+    items = ShardedItems([search('a', 'b'), search('b', 'c'), search()])
+    ids = sorted(i['id'] for i in items.items_iter(None))
+    assert ids == ['a', 'b', 'c']
+    # iterating again runs the searches again
+    assert len(list(items.items_iter(None))) == 3
+
+
+def test_recent_ids():
+    ids = sharding._RecentIds(2)
+    assert ids.add('a') and ids.add('b')
+    assert not ids.add('a')
+    assert ids.add('c')
+    assert len(ids) == 2
+    # a is forgotten
+    assert ids.add('a')
+    assert not ids.add('c')
+
+
+def test_sharded_items_limit():
+    closed = threading.Event()
+    ids = ['id%d' % i for i in range(100)]
+    items = ShardedItems([search(*ids, closed=closed)], buffer=1)
+    assert len(list(items.items_iter(5))) == 5
+    # the search is stopped once the limit is reached
+    assert closed.wait(5)
+
+
+def test_sharded_items_error():
+    items = ShardedItems([search('a', api.exceptions.ServerError('boom'))])
+    with pytest.raises(api.exceptions.ServerError):
+        list(items.items_iter(None))
+
+
+def test_sharded_items_json_encode():
+    out = io.StringIO()
+    ShardedItems([search('a'), search('a')]).json_encode(out)
+    assert json.loads(out.getvalue()) == {
+        'type': 'FeatureCollection', 'features': [{'id': 'a'}]
+    }
+    out = io.StringIO()
+    ShardedItems([search()]).json_encode(out)
+    assert json.loads(out.getvalue()) == {
+        'type': 'FeatureCollection', 'features': []
+    }
+
+
+def test_sharded_search():
+    client = api.ClientV1('foobar', rate_limit=0)
+    stats_url = os.path.join(client.base_url, 'data/v1/stats')
+    search_url = os.path.join(client.base_url, 'data/v1/quick-search')
+
+    def quick_search(request, context):
+        acquired = request.json()['filter']['config'][1]['config']
+        ids = ['x', 'late'] if 'gte' in acquired else ['x', 'early']
+        return {'features': [{'id': i} for i in ids], '_links': {}}
+
+    request = filters.build_search_request(filters.and_filter(), ['all'])
+    with requests_mock.Mocker() as m:
+        m.post(stats_url, json={'buckets': buckets(5, 5)})
+        m.post(search_url, json=quick_search)
+        items = client.sharded_search(request, shards=2, page_size=10)
+        ids = sorted(i['id'] for i in items.items_iter(None))
+        assert ids == ['early', 'late', 'x']
+        assert m.request_history[0].json()['interval'] == 'day'
+        assert all(r.qs['_page_size'] == ['10']
+                   for r in m.request_history[1:])
+
+
+def acquired(*values):
+    return [{'id': v, 'properties': {'acquired': v}} for v in values]
+
+
+def test_sort_key():
+    items = acquired('b', 'a', 'c') + [{'id': 'x', 'properties': {}}]
+    assert [i['id'] for i in sorted(items, key=sort_key('acquired asc'))] \
+        == ['a', 'b', 'c', 'x']
+    key = sort_key(('acquired', 'desc'))
+    assert [i['id'] for i in sorted(items, key=key)] == ['c', 'b', 'a', 'x']
+    with pytest.raises(ValueError):
+        sort_key('acquired sideways')
+
+
+def test_merge_sorted():
+    merged = merge_sorted([acquired('a', 'd', 'e'), acquired(),
+                           acquired('b', 'c', 'f')], 'acquired asc')
+    assert [i['id'] for i in merged] == ['a', 'b', 'c', 'd', 'e', 'f']
+    merged = merge_sorted([acquired('e', 'a'), acquired('f', 'b')],
+                          'acquired desc')
+    assert [i['id'] for i in merged] == ['f', 'e', 'b', 'a']
+
+
+def test_merge_sorted_lazy():
+    pulled = []
+
+    def stream(*values):
+        for item in acquired(*values):
+            pulled.append(item['id'])
+            yield item
+
+    streams = [stream('a', 'c', 'e'), stream('b', 'd', 'f')]
+    merged = merge_sorted(streams, 'acquired asc')
+    assert next(merged)['id'] == 'a'
+    # only one item of each stream is pending
+    assert pulled == ['a', 'b']
+    assert next(merged)['id'] == 'b'
+    assert pulled == ['a', 'b', 'c']
+    merged.close()
+    for s in streams:
+        with pytest.raises(StopIteration):
+            next(s)
+
+
+def test_sharded_items_sorted():
+    def search(*values):
+        return lambda: FakeItems(acquired(*values))
+
+    items = ShardedItems([search('b', 'd'), search('a', 'd', 'e')],
+                         sort='acquired asc')
+    ids = [i['id'] for i in items.items_iter(None)]
+    assert ids == ['a', 'b', 'd', 'e']
+    assert [i['id'] for i in items.items_iter(2)] == ['a', 'b']
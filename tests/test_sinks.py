@@ -0,0 +1,143 @@
+# Copyright 2021 Planet Labs, Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import csv
+import gzip
+import io
+import json
+
+from planet.api import sinks
+from planet.api.sinks import open_sink
+import pytest
+
+
+GEOMETRY = {'type': 'Point', 'coordinates': [1, 2]}
+ITEMS = [
+    {'id': 'a', 'geometry': GEOMETRY,
+     'properties': {'acquired': '2020-01-01T00:00:00Z', 'cloud_cover': 0,
+                    'sat': {'id': 1}}},
+    {'id': 'b', 'geometry': GEOMETRY,
+     'properties': {'cloud_cover': .5, 'note': u'café, "quoted"'}},
+]
+
+
+def write(format, items=ITEMS, **kw):
+    out = io.BytesIO()
+    with open_sink(format, out, **kw) as sink:
+        sink.write(items)
+    return out.getvalue()
+
+
+@pytest.fixture
+def batches(monkeypatch):
+    '''write items a few at a time'''
+    monkeypatch.setattr(sinks, 'BATCH_SIZE', 1)
+
+
+def test_ndjson(batches):
+    lines = write('ndjson').splitlines()
+    assert [json.loads(line) for line in lines] == ITEMS
+    assert write('ndjson', []) == b''
+
+
+def test_ndjson_gzip():
+    data = gzip.GzipFile(fileobj=io.BytesIO(write('ndjson',
+                                                  compression='gzip')))
+    assert [json.loads(line) for line in data] == ITEMS
+
+
+def test_ndjson_zstd():
+    zstandard = pytest.importorskip('zstandard')
+    data = zstandard.ZstdDecompressor().decompressobj().decompress(
+        write('ndjson', compression='zstd'))
+    assert [json.loads(line) for line in data.splitlines()] == ITEMS
+
+
+def test_csv(batches):
+    rows = list(csv.reader(io.StringIO(write('csv').decode('utf-8'))))
+    # the fields of the first batch only
+    assert rows == [
+        ['id', 'acquired', 'cloud_cover', 'sat'],
+        ['a', '2020-01-01T00:00:00Z', '0', '{"id":1}'],
+        ['b', '', '0.5', ''],
+    ]
+    data = write('csv', fields=['id', 'note', 'geometry'],
+                 compression='gzip')
+    data = gzip.GzipFile(fileobj=io.BytesIO(data)).read().decode('utf-8')
+    assert list(csv.reader(io.StringIO(data))) == [
+        ['id', 'note', 'geometry'],
+        ['a', '', json.dumps(GEOMETRY, separators=(',', ':'))],
+        ['b', u'café, "quoted"',
+         json.dumps(GEOMETRY, separators=(',', ':'))],
+    ]
+
+
+def read_table(format, data):
+    pa = pytest.importorskip('pyarrow')
+    if format == 'parquet':
+        import pyarrow.parquet as pq
+        return pq.read_table(pa.BufferReader(data))
+    return pa.ipc.open_file(pa.BufferReader(data)).read_all()
+
+
+@pytest.mark.parametrize('format', ['parquet', 'arrow'])
+def test_arrow(batches, format):
+    pa = pytest.importorskip('pyarrow')
+    table = read_table(format, write(format))
+    if format == 'parquet':
+        assert table.to_batches()[0].num_rows == 1
+    assert table.schema.names == ['id', 'acquired', 'cloud_cover', 'sat',
+                                  'geometry', 'other_properties']
+    assert table.schema.field('cloud_cover').type == pa.float64()
+    assert table.to_pydict() == {
+        'id': ['a', 'b'],
+        'acquired': ['2020-01-01T00:00:00Z', None],
+        'cloud_cover': [0., .5],
+        'sat': ['{"id":1}', None],
+        'geometry': [json.dumps(GEOMETRY, separators=(',', ':'))] * 2,
+        # a property first seen after the first batch
+        'other_properties': [None, '{"note":"caf\\u00e9, \\"quoted\\""}'],
+    }
+
+
+@pytest.mark.parametrize('format', ['parquet', 'arrow'])
+def test_arrow_mixed_types(batches, format):
+    items = [
+        {'id': 'a', 'properties': {'gsd': 3, 'ok': True}},
+        {'id': 'b', 'properties': {'gsd': 'unknown', 'ok': 1}},
+        {'id': 'c', 'properties': {'gsd': 4.5, 'ok': False}},
+    ]
+    table = read_table(format, write(format, items))
+    assert table.to_pydict() == {
+        'id': ['a', 'b', 'c'],
+        'gsd': [3., None, 4.5],
+        'ok': [True, None, False],
+        'geometry': [None] * 3,
+        'other_properties': [None, '{"gsd":"unknown","ok":1}', None],
+    }
+    # with explicit fields, values that do not fit are null
+    table = read_table(format, write(format, items, fields=['id', 'gsd']))
+    assert table.to_pydict() == {'id': ['a', 'b', 'c'],
+                                 'gsd': [3., None, 4.5]}
+
+
+def test_open_sink_errors():
+    with pytest.raises(ValueError):
+        open_sink('xml', io.BytesIO())
+    with pytest.raises(ValueError):
+        open_sink('parquet', io.BytesIO(), compression='gzip')
+    with pytest.raises(ValueError):
+        open_sink('ndjson', io.BytesIO(), fields=['id'])
+    with pytest.raises(ValueError):
+        open_sink('csv', io.BytesIO(), compression='lzma')
@@ -8,6 +8,7 @@ from planet import api
 from planet.scripts import main
 from planet.api import ClientV1
 from planet.api import models
+from planet.api.journal import Journal
 import pytest
 from _common import read_fixture
 
@@ -231,6 +232,43 @@ def test_download_search_id(runner, client, monkeypatch):
     assert client.saved_search.call_args[0][0] == 'x22'
 
 
+def test_download_resume(runner, client, monkeypatch, tmpdir):
+    path = str(tmpdir.join('job.db'))
+    jnl = Journal(path)
+    jnl.begin(['visual'], str(tmpdir))
+    jnl.close()
+    dl = MagicMock(name='downloader')
+    monkeypatch.setattr('planet.scripts.v1.downloader', dl)
+    monkeypatch.setattr('planet.scripts.v1.downloader_output',
+                        lambda *a, **kw: MagicMock())
+    calls = []
+    monkeypatch.setattr('planet.scripts.v1.handle_interrupt',
+                        lambda cancel, f, items, *a:
+                        calls.append((list(items),) + a))
+    assert_success(
+        runner.invoke(main, ['data', 'download', '--resume', path]), '')
+    (items, asset_types, dest), = calls
+    assert asset_types == ['visual']
+    assert dest == str(tmpdir)
+    assert items == []
+    assert dl.create.call_args[1]['journal'].path == path
+    # activation estimates are only persisted when asked to
+    dl.ActivationEstimates.assert_called_with(None)
+    estimates = str(tmpdir.join('estimates.json'))
+    assert_success(
+        runner.invoke(main, ['data', 'download', '--resume', path,
+                             '--activation-estimates', estimates]), '')
+    dl.ActivationEstimates.assert_called_with(estimates)
+    assert_failure(
+        runner.invoke(main, ['data', 'download', '--resume', path,
+                             '--search-id', 'x']),
+        'search and job options not supported with resume')
+    assert_failure(
+        runner.invoke(main, ['data', 'download', '--resume', path,
+                             '--limit', '5']),
+        'search and job options not supported with resume')
+
+
 def test_create_search(runner, client):
     fake_response = '{"chowda":true}'
     configure_response(client.create_search, fake_response)
@@ -352,3 +390,32 @@ def test_get_associated_resource(runner, client):
         ]),
         '{"chowda":true}\n'
     )
+
+
+def test_quick_search_shards(runner, client):
+    client.sharded_search.return_value = api.sharding.ShardedItems([])
+    assert_success(
+        runner.invoke(main, [
+            'data', 'search', '--item-type', 'all', '--limit', '10',
+            '--shards', '3'
+        ]), {'type': 'FeatureCollection', 'features': []})
+    args, kw = client.sharded_search.call_args
+    assert args[1] == 3
+    assert kw['page_size'] == 10
+
+
+def test_quick_search_format(runner, client):
+    items = [{'id': 'a', 'properties': {'cloud_cover': .1}}]
+    response = MagicMock(name='items', spec=models.Items)
+    response.items_iter.return_value = iter(items)
+    client.quick_search.return_value = response
+    result = runner.invoke(main, [
+        'data', 'search', '--item-type', 'all', '--format', 'csv',
+        '--fields', 'id,cloud_cover'
+    ])
+    assert result.exit_code == 0, result.output
+    assert result.output == 'id,cloud_cover\na,0.1\n'
+    assert_failure(runner.invoke(main, [
+        'data', 'search', '--item-type', 'all', '--format', 'parquet',
+        '--compress', 'gzip'
+    ]), 'parquet output cannot be compressed')